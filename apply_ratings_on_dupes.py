@@ -25,25 +25,35 @@ by tweaking the XML and forcing a rebuild, so this becomes much easier
 for management since it can be automated.  If you make changes, I would
 love it if you submit a patch or pull request!
 
-Uses its own non-persistent SQLite DB for data storage/retrieval.  The
-contents of this DB are reset every time it starts.  Yes, there's a
+Reads tracks from the persistent library catalog (see `catalog.py`),
+which is refreshed with whatever changed in iTunes since the last run.
+Its working table is reset every time it starts.  Yes, there's a
 race condition here - so don't run more than one instance at a time, or
 you'll make the world explode causing a giant sinkhole.
 
 As currently written, this finds duplicates in the iTunes Library based
-on a hash of various ID3 components (see `gen_hash()` below).  I
+on a hash of various ID3 components (see `catalog.gen_hash()`).  I
 initially wanted this to be based off file MD5 hashes, but that doesn't
 work when the library reference is invalid because iTunes doesn't return
 the OLD location of the file, it returns `k.missing_value`
 
+`--key fuzzy` matches on tags that are close rather than identical -
+"feat." or "ft", case, punctuation, a second's difference in duration
+(see `fuzzy.py`).  `--key audio` does match on file contents, hashing
+just the audio so that tags don't matter (see `fingerprint.py`).
+Tracks whose files are missing are left out, for the reason above.
+
 If dupes are found and one lacks ratings, then ratings are set.  If
 multiple are found and they have different ratings, the highest rating
 is assumed to be the correct one and all matches are set to that.  This
 could ultimately be changed to allow control of this behavior via a
 command-line switch.
 
-IDs for prior entries with the same hash are retained, for quick
-retrieval and updating when subsequent matches are found.
+Every track is grouped by hash before anything is written, so each
+group's rating is settled once.  Only tracks whose rating actually
+changes are written back, in bulk by id, and `--dry-run` lists those changes
+without making them.  The groups are kept in the working DB's
+`dupe_finder` and `dupe_ids` tables.
 
 TODO: Provide the option to automatically preen dead entries upon
       completion, if their information was replicated to at least
@@ -51,154 +61,313 @@ TODO: Provide the option to automatically preen dead entries upon
 
 """
 # ---*< Standard imports >*----------------------------------------------------
-from datetime import datetime
-from hashlib import md5
-import json
-import time
+import argparse
+import sys
 
 # ---*< Third-party imports >*-------------------------------------------------
 
 # ---*< Local imports >*-------------------------------------------------------
-from itunes import init_db_conn, ITunesManager, iTunesTrack
+from catalog import DEFAULT_CATALOG_FILE, gen_hash, open_catalog
+from fingerprint import FingerprintCache
+from fuzzy import DEFAULT_THRESHOLD, FuzzyMatcher
+from jobs import DEFAULT_CHECKPOINT_INTERVAL, Job, PENDING
+from itunes import ITunesManager, XMLLibraryBackend
 
 # ---*< Initialization >*------------------------------------------------------
-def gen_hash(track):
-    m = md5()
-    body = '%s - %s - %s - %s - %s' % (track.artist(),
-                                       track.album(),
-                                       track.name(),
-                                       track.duration(),
-                                       track.comment())
-
-    m.update(body.encode('utf-8'))
-
-    return m.hexdigest()
+"""Fields needed from the library catalog to hash and reconcile tracks"""
+SNAPSHOT_FIELDS = ['id', 'name', 'artist', 'album', 'duration', 'comment',
+                   'rating', 'date_added', 'location', 'hash']
 
+"""Rating changes sent between checkpoints"""
+APPLY_SLICE_SIZE = 2000
 
 def get_track_by_hash(db, md5hash):
     print "retrieving hash from db"
 
-def track_datetime_to_python(dt):
-    """Makes sure microseconds are set to 000001
+def plan_ratings(tracks):
+    """Works out which tracks need their rating changed
 
-    This is kinda hackish, but necessary.. Otherwise the values fail
-    validation upon pulling from DB.
+    Tracks are grouped by dupe hash, and every track in a group gets
+    the highest rating in the group.  Only tracks whose rating would
+    actually change are returned.
 
-    Note that it doesn't check anytihng. :p
+    :param tracks: iterable of track `dict`s, as given by
+                   `Catalog.rows()`.  Any without a `hash` get one
+                   generated.
+    :rtype: `tuple` of (groups, changes).  `groups` maps each hash to
+            (rating, oldest date added, [track ids]), and `changes` is a
+            `list` of (track id, name, old rating, new rating).
     """
-    return datetime.strptime(str(dt)+'.000001', 
-                             '%Y-%m-%d %H:%M:%S.%f')
+    members = {}
+    for t in tracks:
+        members.setdefault(t.get('hash') or gen_hash(t), []).append(t)
 
-def save_track(tunes, db, track):
-    """Saves a track to the DB, keyed on a hash of ID3 tags and duration
+    groups = {}
+    changes = []
+    for (track_hash, dupes) in members.iteritems():
+        rating = max(t['rating'] or 0 for t in dupes)
 
-    Effectively, the stored object acts as the master record for info.
-    This looks at various fields and sets the stored data to be what is
-    relevant.
-    """
-    track_hash = gen_hash(track)
-    track_entry = iTunesTrack()
-
-    curs = db.cursor()
-
-    # Get any existing record and do some stuff with it
-    curs.execute('''
-        SELECT data FROM dupe_finder WHERE md5=?
-    ''', (track_hash,))
-
-    rows = curs.fetchall()
-    if len(rows) == 0:
-        # Nothing found, so use track will be the new entry
-        track_entry.md5 = track_hash
-        track_entry.ids = [track.id(),]
-        track_entry.rating = track.rating()
-
-        # Have to convert to ISO format
-        track_entry.date_added = track_datetime_to_python(track.date_added())
-
-    elif len(rows) == 1:
-        data = json.loads(rows[0]['data'])
-        track_entry = iTunesTrack(**data)
-
-        if track.id() not in track_entry.ids:
-            track_entry.ids.append(track.id())
-
-        # Compare values and save appropriate ones in the db
-        # First, compare the date added and set it to the older one
-        #
-        # Currently this does NOTHING.  iTunes considers date_added to
-        # be a read-only field, so it can't be changed.  Thanks Apple!
-        dt = track_datetime_to_python(track.date_added())
-        if dt < track_entry.date_added:
-            track_entry.date_added = dt
-
-        if track_entry.rating == 0:
-            """If there's no rating there and we have one, just set it
-            """
-            if track.rating() > 0:
-                track_entry.rating = track.rating()
-        elif track_entry.rating > 0:
-            """If they differ, default to the higher value
-            """
-            print "Existing rating: %d Track rating: %d" % (track_entry.rating,
-                                                            track.rating())
-            if track.rating() > track_entry.rating:
-                track_entry.rating = track.rating()
+        # Recorded, but currently this does NOTHING.  iTunes considers
+        # date_added to be a read-only field, so it can't be changed.
+        # Thanks Apple!
+        dates = [t['date_added'] for t in dupes if t['date_added'] is not None]
+        date_added = min(dates) if dates else None
 
-    else:
-        raise ValueError('Unexpected results (%d) found for track %s' % 
-                         len(rows), track.name())
+        groups[track_hash] = (rating, date_added, [t['id'] for t in dupes])
+
+        if len(dupes) > 1:
+            for t in dupes:
+                if (t['rating'] or 0) != rating:
+                    changes.append((t['id'], t['name'], t['rating'] or 0,
+                                    rating))
+
+    return (groups, changes)
 
-    track_entry.validate()
 
-    curs.execute('''
-        INSERT OR REPLACE INTO dupe_finder (md5, data) VALUES (?, ?)
-    ''', (track_hash, track_entry.to_json()))
+def save_groups(db, groups):
+    """Records the master info for each group of dupes in the working DB
+
+    :param db: `sqlite3.Db` handle to the working DB
+    :param groups: `dict` of groups, as given by `plan_ratings()`
+    """
+    db.executemany('''
+        INSERT OR REPLACE INTO dupe_finder (md5, rating, date_added)
+        VALUES (?, ?, ?)
+    ''', [(h, rating, date_added)
+          for (h, (rating, date_added, _)) in groups.iteritems()])
+
+    db.executemany('''
+        INSERT OR IGNORE INTO dupe_ids (md5, track_id) VALUES (?, ?)
+    ''', [(h, track_id)
+          for (h, (_, _, ids)) in groups.iteritems() for track_id in ids])
 
     db.commit()
 
+
+def apply_ratings(tunes, changes, job=None):
+    """Sets each planned rating in iTunes
+
+    Changes go through a `BatchWriter`, so it's one Apple event per
+    rating value (per `BATCH_CHUNK_SIZE` tracks) rather than per track.
+    They're sent `APPLY_SLICE_SIZE` at a time, checkpointing `job` in
+    between.
+
+    :param tunes: `ITunesManager` connected to a live iTunes
+    :param changes: `list` of changes, as given by `plan_ratings()`
+    :param job: (optional) `jobs.Job` with an item per change, keyed on
+                track id, to tick off as changes are made
+    :rtype: `list` of (track id, name) of the tracks that couldn't be
+            updated
     """
-    Now, if there is more than one value in the ID field, go ahead and
-    update all the entires with the new rating.
+    failures = []
+
+    for start in xrange(0, len(changes), APPLY_SLICE_SIZE):
+        writer = tunes.batch()
+        names = {}
+        for (track_id, name, _, rating) in changes[start:start +
+                                                   APPLY_SLICE_SIZE]:
+            writer.set(track_id, 'rating', rating)
+            names[track_id] = name
+
+        for ((track_id, _), error) in writer.flush().iteritems():
+            if error is not None:
+                sys.stderr.write('Error setting rating on %d - %s: %s\n' %
+                                 (track_id, names[track_id], error))
+                failures.append((track_id, names[track_id]))
+                if job is not None:
+                    job.failed(str(track_id))
+            elif job is not None:
+                job.done(str(track_id))
+
+        if job is not None:
+            job.checkpoint()
+
+    return failures
+
+
+def audio_keyed(db, tracks):
+    """Rekeys tracks on their audio fingerprint instead of their tags
+
+    Tracks with no file, or whose file can't be read, are left out.
+
+    :param db: `sqlite3.Db` handle holding the fingerprint cache
+    :param tracks: iterable of track `dict`s including `location`
+    :rtype: `list` of track `dict`s with `hash` set to the fingerprint
+    """
+    tracks = [t for t in tracks if t['location']]
+    cache = FingerprintCache(db)
+    prints = cache.fingerprint_files([t['location'] for t in tracks])
+
+    print ('Fingerprinted %(hashed)d files (%(bytes)d bytes), '
+           '%(cached)d cached' % cache.stats)
+    for (path, error) in cache.errors:
+        sys.stderr.write('Could not fingerprint %s: %s\n' % (path, error))
+
+    keyed = []
+    for t in tracks:
+        if t['location'] in prints:
+            t['hash'] = prints[t['location']]
+            keyed.append(t)
+
+    return keyed
 
-    Here's the thing.  iTunes doesn't provide a way to search by track
-    or database ID.  Really.  So rather than iterate over the entire
-    playlist, I let iTunes search for track title and iterate over those
-    results.  Not great, but a TON faster than the alternative.
+
+def fuzzy_keyed(tracks, threshold=DEFAULT_THRESHOLD):
+    """Rekeys tracks so that near-identical tags share a key
+
+    See `fuzzy.FuzzyMatcher`.  Tracks without a close match are dropped,
+    as they have no dupes.
+
+    :param tracks: iterable of track `dict`s
+    :param threshold: (optional) `float` lowest match score, from 0 to 1
+    :rtype: `list` of track `dict`s with `hash` set to a group key
     """
-    if len(track_entry.ids) > 1:
-        import appscript
-        lib = itunes.itunes.library_playlists[1]
-        tracks = lib.tracks[appscript.its.name.contains(track.name())]
-        for t in tracks.get():
-            """Update entries if their id is also in track_entry.ids"""
-            if t.id() in track_entry.ids:
-                # Update the rating 
-                t.rating.set(track_entry.rating)
+    matcher = FuzzyMatcher(threshold)
+    keyed = []
+
+    for (n, group) in enumerate(matcher.groups(tracks)):
+        for t in group:
+            t['hash'] = 'fuzzy-%d' % n
+            keyed.append(t)
+
+    print ('Compared %(compared)d pairs of %(tracks)d tracks in %(blocks)d '
+           'blocks' % matcher.stats)
+
+    return keyed
 
 
 # ---*< Code >*----------------------------------------------------------------
-def update_ratings(itunes):
+def update_ratings(itunes, catalog_file=DEFAULT_CATALOG_FILE,
+                   full_refresh=False, dry_run=False, key='tags',
+                   threshold=DEFAULT_THRESHOLD,
+                   checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                   restart=False):
     """Handles synchronizing ratings and addition dates in iTunes
 
+    Works in two phases.  Every track in the catalog is grouped by hash
+    and each group's rating settled first, entirely in memory.  Only
+    then is iTunes touched, and only for tracks whose rating changes.
+
+    The plan and progress through it are checkpointed to the catalog DB
+    (see `jobs.Job`).  If the last run with the same `key` and
+    `threshold` was interrupted, this carries on with its plan rather
+    than making a new one.
+
     :param itunes: `iTunesManager` used for communicating with iTunes.
                    This should already be setup and connected.
+    :param catalog_file: (optional) `str` path of the library catalog
+    :param full_refresh: (optional) `boolean`; if True, refetch every
+                         track into the catalog, not just changed ones
+    :param dry_run: (optional) `boolean`; if True, only report what
+                    would change.  Always the case if `itunes` is
+                    read-only.
+    :param key: (optional) `str` - 'tags' to match dupes on their tags
+                (see `catalog.gen_hash()`), 'fuzzy' to match them on
+                similar tags (see `fuzzy.py`), or 'audio' to match them
+                on their audio (see `fingerprint.py`).  Tracks without a
+                file can't be matched on audio.
+    :param threshold: (optional) `float` lowest score for a fuzzy match
+    :param checkpoint_interval: (optional) most seconds of progress
+                                that can be lost
+    :param restart: (optional) `boolean`; if True, make a new plan even
+                    if the last run didn't finish
+    :rtype: `list` of planned changes, as given by `plan_ratings()`
     """
+    catalog = open_catalog(catalog_file)
+    db = catalog.db
 
-    # Setup DB connection
-    db = init_db_conn()
+    job = None
+    if not (dry_run or itunes.read_only):
+        job = Job(db, 'ratings', {'key': key, 'threshold': threshold},
+                  checkpoint_interval, restart)
 
-    # Loop over tracks building the db.  Note that prior tracks with
-    # matching MD5 data will all be updated each time a subsequent track
-    # is found.  This obviates the need to re-review the data after
-    # processing all tracks.
-    for t in itunes.itunes.tracks():
-        track_hash = gen_hash(t)
-        print '%s\t%d\t%d\t%s' % (track_hash, t.id(), t.rating(), t.name())
-        save_track(itunes, db, t)
+    if job is not None and job.resumed and job.phase == 'planned':
+        changes = [tuple(data) for (_, data) in job.items(PENDING)]
+        print 'Resuming the last run: %d ratings left to change' % len(changes)
 
+    else:
+        changes = plan_changes(catalog, itunes, full_refresh, key, threshold)
 
-if __name__ == "__main__":
+        if job is not None:
+            for change in changes:
+                job.add(str(change[0]), change)
+            job.set_phase('planned')
+
+    if job is None or not changes:
+        if job is not None:
+            job.finish()
+        return changes
+
+    failures = apply_ratings(itunes, changes, job)
+    print ('Updated %d ratings, %d failed' %
+           (len(changes) - len(failures), len(failures)))
+    job.finish()
+
+    return changes
 
-    itunes = ITunesManager()#IGNORE:C0103
-    update_ratings(itunes)
+
+def plan_changes(catalog, itunes, full_refresh, key, threshold):
+    """Refreshes the catalog and plans the changes - see `update_ratings()`
+
+    :rtype: `list` of planned changes, as given by `plan_ratings()`
+    """
+    db = catalog.db
+    catalog.refresh(itunes, full_refresh)
+
+    tracks = catalog.rows(SNAPSHOT_FIELDS)
+    if key == 'audio':
+        tracks = audio_keyed(db, tracks)
+    elif key == 'fuzzy':
+        tracks = fuzzy_keyed(tracks, threshold)
+
+    (groups, changes) = plan_ratings(tracks)
+    save_groups(db, groups)
+
+    dupes = [ids for (_, _, ids) in groups.itervalues() if len(ids) > 1]
+    print ('%d tracks in %d groups of dupes, %d ratings to change' %
+           (sum(len(ids) for ids in dupes), len(dupes), len(changes)))
+
+    for (track_id, name, old, new) in changes:
+        print '%d\t%d -> %d\t%s' % (track_id, old, new, name)
+
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Synchronizes ratings on '
+                                     'identical tracks.')
+    parser.add_argument('--library-xml', metavar='PATH',
+                        help='find dupes from this iTunes Library.xml '
+                             'without changing anything in iTunes')
+    parser.add_argument('--catalog', metavar='PATH',
+                        default=DEFAULT_CATALOG_FILE,
+                        help='library catalog file (default: %(default)s)')
+    parser.add_argument('--full-refresh', action='store_true',
+                        help='refetch every track into the catalog, not '
+                             'just those that changed')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report the ratings that would change')
+    parser.add_argument('--key', choices=['tags', 'fuzzy', 'audio'],
+                        default='tags',
+                        help='match dupes on identical tags, similar tags '
+                             'or a hash of their audio (default: '
+                             '%(default)s)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='lowest score, from 0 to 1, for a fuzzy match '
+                             '(default: %(default)s)')
+    parser.add_argument('--checkpoint-interval', type=int, metavar='SECS',
+                        default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help='most seconds of progress an interruption '
+                             'can lose (default: %(default)s)')
+    parser.add_argument('--restart', action='store_true',
+                        help="make a new plan, even if the last run didn't "
+                             'finish')
+    args = parser.parse_args()#IGNORE:C0103
+
+    if args.library_xml:
+        itunes = ITunesManager(XMLLibraryBackend(args.library_xml))#IGNORE:C0103
+    else:
+        itunes = ITunesManager()#IGNORE:C0103
+    update_ratings(itunes, args.catalog, args.full_refresh, args.dry_run,
+                   args.key, args.threshold, args.checkpoint_interval,
+                   args.restart)
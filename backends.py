@@ -0,0 +1,312 @@
+# ---*< backends.py >*---------------------------------------------------------
+# Sources of iTunes library data
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Backends that ITunesManager reads the library through
+
+Created on Oct 16, 2026
+
+`AppscriptBackend` talks to a running copy of iTunes, and is the only
+one that can change anything.  `XMLLibraryBackend` reads the
+`iTunes Library.xml` file that iTunes keeps up to date alongside its
+database.  It's read-only, but it doesn't need iTunes (or a Mac) at
+all, and reading from disk is much faster than Apple events.  Set
+`ROADIE_PROFILE=1` to see where the Apple events go (see `instrument`).
+
+Both return the same values for a given field - missing values are
+None, and `location` is a POSIX path string.  Note that the XML file
+gives dates in UTC, where iTunes gives them in local time.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import os
+import urllib
+import urlparse
+
+# ---*< Third-party imports >*-------------------------------------------------
+try:
+    from appscript import app, its, k, CommandError #@UnresolvedImport
+except ImportError:
+    # Not on a Mac.  Only the XML backend will work.
+    app = its = k = None
+
+    class CommandError(Exception):
+        """Stand-in so `except CommandError` still works without appscript"""
+
+# ---*< Local imports >*-------------------------------------------------------
+import instrument
+from library_xml import iter_tracks
+
+# ---*< Initialization >*------------------------------------------------------
+"""Track properties that can be requested via ITunesManager.snapshot()"""
+SNAPSHOT_FIELDS = ('id',
+                   'persistent_ID',
+                   'location',
+                   'name',
+                   'artist',
+                   'album',
+                   'duration',
+                   'comment',
+                   'rating',
+                   'date_added',
+                   'modification_date',
+                   )
+
+"""Number of tracks requested per Apple event when a whole-library fetch
+of a property fails (usually because the reply is too big) and we have
+to fall back to fetching it in pieces."""
+SNAPSHOT_CHUNK_SIZE = 5000
+
+"""Timeout in seconds for bulk property fetches.  A single fetch of one
+property for a large library can take a while."""
+SNAPSHOT_TIMEOUT = 600
+
+"""Where iTunes keeps the XML copy of the library by default"""
+DEFAULT_LIBRARY_XML = os.path.expanduser('~/Music/iTunes/iTunes Library.xml')
+
+"""Maps snapshot field names to the keys used in iTunes Library.xml"""
+XML_KEYS = {'id': 'Track ID',
+            'persistent_ID': 'Persistent ID',
+            'location': 'Location',
+            'name': 'Name',
+            'artist': 'Artist',
+            'album': 'Album',
+            'duration': 'Total Time',
+            'comment': 'Comments',
+            'rating': 'Rating',
+            'date_added': 'Date Added',
+            'modification_date': 'Date Modified',
+            }
+
+# ---*< Code >*----------------------------------------------------------------
+def location_to_path(location):
+    """Converts a `file://` URL from the library XML into a POSIX path"""
+    return urllib.unquote(urlparse.urlparse(location).path).decode('utf-8')
+
+
+class LibraryBackend(object):
+    """Interface for anything ITunesManager can read the library from
+
+    Subclasses need to provide `fetch(field)`, returning a `list` of
+    one field's value for every library track.  Values must be in the
+    same track order for every field, so that the lists line up.  They
+    should override `fetch_many()` if several fields can be read at once
+    more cheaply.  Those that can talk to iTunes should also provide
+    `connect()` and set `read_only` to False.
+    """
+    read_only = True
+
+    def connect(self):
+        """Returns the appscript application, or None if there isn't one"""
+        return None
+
+    def fetch_many(self, fields):
+        """Returns a `dict` of field name to `fetch()` result"""
+        return dict((f, self.fetch(f)) for f in fields)
+
+    def fetch_by_persistent_id(self, persistent_ids, fields):
+        """Returns columns of `fields` for just the given tracks
+
+        The result always includes a `persistent_ID` column, as tracks
+        that no longer exist are left out.  This default reads every
+        track and filters, which is right for anything where a full
+        read is cheap.
+        """
+        wanted = set(persistent_ids)
+        fields = list(fields)
+        if 'persistent_ID' not in fields:
+            fields.append('persistent_ID')
+
+        everything = self.fetch_many(fields)
+        keep = [i for i, pid in enumerate(everything['persistent_ID'])
+                if pid in wanted]
+
+        return dict((f, [everything[f][i] for i in keep]) for f in fields)
+
+
+class AppscriptBackend(LibraryBackend):
+    """Reads from (and writes to) a running iTunes via py-appscript
+
+    Filters and keywords are built with the backend's `its` and `k`
+    rather than appscript's directly, so that a stand-in for iTunes
+    (see `simulator`) can supply its own.
+    """
+    read_only = False
+    its = its
+    k = k
+
+    def __init__(self):
+        """__init__ method.  Takes no options."""
+        self.itunes = None
+        super(AppscriptBackend, self).__init__()
+
+    def connect(self):
+        if app is None:
+            raise ValueError('py-appscript is not available, so iTunes '
+                             'cannot be reached.  Use the XML backend.')
+
+        if not self.itunes:
+            self.itunes = instrument.wrap(app('iTunes'))
+
+        return self.itunes
+
+    def fetch(self, field):
+        """Fetches one property of every track in a single Apple event
+
+        If the bulk request fails - iTunes will time out or run out of
+        memory on very large replies - the field is fetched again in
+        chunks of `SNAPSHOT_CHUNK_SIZE` tracks.
+        """
+        tracks = self.connect().library_playlists[1].tracks
+
+        try:
+            values = getattr(tracks, field).get(timeout=SNAPSHOT_TIMEOUT)
+        except CommandError:
+            values = self._chunked_fetch(tracks, field)
+
+        return [self._clean_value(field, v) for v in values]
+
+    def fetch_by_persistent_id(self, persistent_ids, fields):
+        """Fetches all the properties of each track in one Apple event
+
+        That's one event per track, so only worth it over `fetch_many()`
+        when there are far fewer tracks than there are in the library.
+        """
+        tracks = self.connect().library_playlists[1].tracks
+        fields = list(fields)
+        if 'persistent_ID' not in fields:
+            fields.append('persistent_ID')
+
+        columns = dict((f, []) for f in fields)
+
+        for pid in persistent_ids:
+            found = tracks[self.its.persistent_ID == pid].properties.get(
+                                                    timeout=SNAPSHOT_TIMEOUT)
+            if not found:
+                # Deleted since the persistent ID was read
+                continue
+
+            props = found[0]
+            for f in fields:
+                columns[f].append(self._clean_value(f,
+                                    props.get(getattr(self.k, f),
+                                              self.k.missing_value)))
+
+        return columns
+
+    def fetch_playlist(self, playlist, fields):
+        """Fetches fields of every track in a user playlist, in bulk
+
+        One Apple event per field, as for `fetch()`.  Raises ValueError
+        if there's no such playlist.
+        """
+        itunes = self.connect()
+        if not itunes.exists(itunes.user_playlists[playlist]):
+            raise ValueError('Playlist %s does not exist.' % playlist)
+
+        tracks = itunes.user_playlists[playlist].tracks
+
+        return dict((f, [self._clean_value(f, v) for v in
+                         getattr(tracks, f).get(timeout=SNAPSHOT_TIMEOUT)])
+                    for f in fields)
+
+    def _chunked_fetch(self, tracks, field):
+        """Fetches a single property `SNAPSHOT_CHUNK_SIZE` tracks at a time
+
+        Element ranges in AppleScript are 1-based and inclusive.
+        """
+        count = tracks.count(each=self.k.item)
+        values = []
+
+        for start in xrange(1, count + 1, SNAPSHOT_CHUNK_SIZE):
+            end = min(start + SNAPSHOT_CHUNK_SIZE - 1, count)
+            values.extend(getattr(tracks[start:end], field).get(
+                                                    timeout=SNAPSHOT_TIMEOUT))
+
+        return values
+
+    def _clean_value(self, field, value):
+        """Converts a raw property value into what a snapshot stores"""
+        if value == self.k.missing_value:
+            return None
+
+        if field == 'location':
+            return value.path
+
+        return value
+
+
+class XMLLibraryBackend(LibraryBackend):
+    """Reads the library from an `iTunes Library.xml` file
+
+    iTunes keeps the last known location of a track in the XML even
+    after the file has gone, so by default each location is checked
+    against the file system and reported as None if it doesn't exist,
+    the same as iTunes would.  Turn that off with `check_locations`
+    when the music isn't mounted on this machine.
+
+    The file is streamed (see `library_xml.iter_tracks()`) rather than
+    loaded, and isn't cached - each call to `fetch_many()` reads it
+    again, keeping only the requested fields.  Ask for all the fields
+    you need in one go.
+    """
+
+    def __init__(self, xml_file=DEFAULT_LIBRARY_XML, check_locations=True):
+        """__init__ method.
+
+        :param xml_file: (optional) `str` path of the library XML
+        :param check_locations: (optional) `boolean` indicating whether
+                                locations of files that don't exist
+                                should be reported as missing (None)
+        """
+        self.xml_file = xml_file
+        self.check_locations = check_locations
+        super(XMLLibraryBackend, self).__init__()
+
+    def iter_rows(self, fields):
+        """Yields a `dict` of the requested fields for each track in turn
+
+        Memory use doesn't grow with the size of the library, so use
+        this rather than a snapshot when a single pass is enough.
+        """
+        keys = [(f, XML_KEYS[f]) for f in fields]
+
+        for t in iter_tracks(self.xml_file):
+            yield dict((f, self._clean_value(f, t.get(key)))
+                       for f, key in keys)
+
+    def fetch(self, field):
+        return self.fetch_many([field])[field]
+
+    def fetch_many(self, fields):
+        """Reads all the requested fields in one pass over the XML"""
+        columns = dict((f, []) for f in fields)
+        appends = [(f, columns[f].append) for f in fields]
+
+        for row in self.iter_rows(fields):
+            for f, append in appends:
+                append(row[f])
+
+        return columns
+
+    def _clean_value(self, field, value):
+        """Converts a raw XML value into what a snapshot stores"""
+        if value is None:
+            if field == 'rating':
+                # Unrated tracks have no Rating key at all
+                return 0
+            return None
+
+        if field == 'location':
+            path = location_to_path(value)
+            if self.check_locations and not os.path.exists(path):
+                return None
+            return path
+
+        if field == 'duration':
+            # Stored in milliseconds, iTunes reports seconds
+            return value / 1000.0
+
+        return value
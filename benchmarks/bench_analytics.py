@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# ---*< bench_analytics.py >*--------------------------------------------------
+# Benchmarks the NumPy library reports against looping over tracks
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Times `analytics.LibraryArrays` reports on big catalogs
+
+Created on Oct 16, 2026
+
+Fills a catalog with the given number of tracks (100k and 1M by
+default) - a mix of ratings, dates added, folders, dupes and tracks with
+no file - then times:
+
+- `load`: `LibraryArrays.load()`
+- each report, once loaded
+- `python`: the same four reports worked out by looping over
+  `Catalog.rows()` in Python, as they had to be before
+
+and checks that the two ways agree.
+
+Usage: python benchmarks/bench_analytics.py [sizes...]
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+from collections import Counter
+from datetime import datetime, timedelta
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from analytics import LibraryArrays
+from catalog import open_catalog
+
+# ---*< Initialization >*------------------------------------------------------
+DEFAULT_SIZES = [100000, 1000000]
+
+"""Every this many tracks shares its dupe hash with the one before"""
+DUPE_EVERY = 10
+
+"""Every this many tracks has no file"""
+MISSING_EVERY = 50
+
+# ---*< Code >*----------------------------------------------------------------
+def make_rows(count):
+    """Returns `count` catalog rows, as `Catalog.store()` takes them"""
+    start = datetime(2003, 4, 28)
+    rows = []
+    for i in xrange(count):
+        added = start + timedelta(seconds=i * 300)
+        path = (None if i % MISSING_EVERY == 0 else
+                u'/Volumes/multimedia/Music/Artist %d/Album %d/%d.mp3' %
+                (i % 5000, i % 20, i))
+        group = i - 1 if i % DUPE_EVERY == 1 else i
+        rows.append((u'%016X' % i, i, path, u'Track %d' % i,
+                     u'Artist %d' % (i % 5000), u'Album %d' % (i % 20),
+                     240.0, u'', 20 * (i % 7 % 6), added, added,
+                     u'%032x' % group, path))
+    return rows
+
+
+def python_reports(catalog):
+    """Works out the reports by looping over every track"""
+    ratings = Counter()
+    folders = Counter()
+    groups = Counter()
+    added = Counter()
+    for t in catalog.rows(('location', 'rating', 'date_added', 'hash')):
+        ratings[t.rating] += 1
+        if t.location:
+            folders[os.path.dirname(t.location)] += 1
+        groups[t.hash] += 1
+        added[(t.date_added.year, t.rating > 0)] += 1
+
+    return (ratings, folders, Counter(groups.itervalues()), added)
+
+
+def check(arrays, expected):
+    """Raises AssertionError unless the two ways agree"""
+    (ratings, folders, sizes, added) = expected
+
+    assert dict((r['rating'], r['tracks'])
+                for r in arrays.ratings_report()) == ratings
+    assert dict((r['folder'], r['tracks'])
+                for r in arrays.folders_report()) == folders
+    assert dict((r['size'], r['groups'])
+                for r in arrays.dupes_report()) == sizes
+    for r in arrays.added_report():
+        assert r['rated'] == added[(int(r['period']), True)]
+        assert r['unrated'] == added[(int(r['period']), False)]
+
+
+def timed(function, *args):
+    """Returns (result, seconds) of calling `function`"""
+    start = time.time()
+    result = function(*args)
+    return (result, time.time() - start)
+
+
+if __name__ == '__main__':
+    sizes = [int(s) for s in sys.argv[1:]] or DEFAULT_SIZES
+
+    print '%-10s %-20s %10s' % ('tracks', 'step', 'seconds')
+    for size in sizes:
+        workdir = tempfile.mkdtemp()
+        try:
+            catalog = open_catalog(os.path.join(workdir, 'catalog.db'))
+            catalog.store(make_rows(size))
+
+            (arrays, elapsed) = timed(LibraryArrays.load, catalog.db)
+            print '%-10d %-20s %10.3f' % (size, 'load', elapsed)
+
+            for (name, report) in (('ratings', arrays.ratings_report),
+                                   ('folders', arrays.folders_report),
+                                   ('folders --depth 5',
+                                    lambda: arrays.folders_report(5)),
+                                   ('dupes', arrays.dupes_report),
+                                   ('added', arrays.added_report),
+                                   ('added --period day',
+                                    lambda: arrays.added_report('day'))):
+                print '%-10d %-20s %10.3f' % (size, name, timed(report)[1])
+
+            (expected, elapsed) = timed(python_reports, catalog)
+            print '%-10d %-20s %10.3f' % (size, 'python', elapsed)
+
+            check(arrays, expected)
+        finally:
+            shutil.rmtree(workdir)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# ---*< bench_end_to_end.py >*-------------------------------------------------
+# Benchmarks the scripts end to end against a simulated iTunes
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Times each script's work end to end, and counts its Apple events
+
+Created on Oct 16, 2026
+
+Runs against `simulator.SimulatedITunes`, so it needs neither iTunes nor
+a Mac.  For each library size (10k and 100k tracks by default; 1M works
+but takes a while) a synthetic library with dupes and dead entries is
+generated, and each scenario is run against it in turn:
+
+- `snapshot`: `ITunesManager.snapshot()` of every field
+- `ratings`: `update_ratings()` from an empty catalog
+- `ratings-warm`: `update_ratings()` again, with the catalog current
+- `dead`: `ITunesManager.remove_dead_tracks()`
+- `sync`: `sync_dir()` over a tree holding some of the library's files
+  and `NEW_FILES` new ones, from an empty catalog
+
+Time on the simulator is our own code's time.  Against iTunes, every
+event also costs a round trip, so events are the figure to watch - and
+they're deterministic, so unlike times they can be checked exactly.
+`--json PATH` saves the results, and `--baseline PATH` compares events
+against saved results, exiting 1 if any scenario sends more than it
+did.  `--latency MS` makes each event sleep, to see the two together.
+
+Usage: python benchmarks/bench_end_to_end.py [--latency MS] [--json PATH]
+           [--baseline PATH] [sizes...]
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from apply_ratings_on_dupes import update_ratings
+from catalog import open_catalog
+from itunes import ITunesManager
+from simulator import generate_library, SimulatedBackend, SimulatedITunes
+from sync_directory_hierarchy_with_itunes import sync_dir
+
+# ---*< Initialization >*------------------------------------------------------
+DEFAULT_SIZES = [10000, 100000]
+
+"""Library files written to disk for the sync scenario"""
+EXISTING_FILES = 500
+
+"""Files written to disk that aren't in the library yet"""
+NEW_FILES = 500
+
+# ---*< Code >*----------------------------------------------------------------
+def build_tree(root, library):
+    """Writes sync's files under `root`, pointing library tracks at some
+
+    The first `EXISTING_FILES` tracks with a file are moved into the
+    tree, and `NEW_FILES` files that aren't in the library are added.
+    """
+    tree = os.path.join(root, 'tree')
+    existing = [t for t in library if t['location']][:EXISTING_FILES]
+    paths = []
+
+    for (i, t) in enumerate(existing):
+        t['location'] = os.path.join(tree, 'Library %d' % (i // 20),
+                                     '%d.mp3' % i)
+        paths.append(t['location'])
+
+    for i in xrange(NEW_FILES):
+        paths.append(os.path.join(tree, 'New %d' % (i // 20), '%d.mp3' % i))
+
+    for path in paths:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+
+    return tree
+
+
+def scenarios(workdir, tree):
+    """Returns (name, function taking an `ITunesManager`) for each run"""
+    ratings_catalog = os.path.join(workdir, 'ratings.db')
+
+    def sync(itunes):
+        catalog = open_catalog(os.path.join(workdir, 'sync.db'))
+        sync_dir(catalog.db, tree, silent=True, library=itunes)
+
+    return [('snapshot', lambda itunes: itunes.snapshot()),
+            ('ratings', lambda itunes: update_ratings(itunes,
+                                                      ratings_catalog)),
+            ('ratings-warm', lambda itunes: update_ratings(itunes,
+                                                           ratings_catalog)),
+            ('dead', lambda itunes: itunes.remove_dead_tracks()),
+            ('sync', sync),
+            ]
+
+
+def run(name, scenario, fake):
+    """Runs one scenario quietly, returning its result `dict`"""
+    itunes = ITunesManager(SimulatedBackend(fake))
+    before = dict(fake.events)
+
+    (stdout, stderr) = (sys.stdout, sys.stderr)
+    sys.stdout = sys.stderr = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        scenario(itunes)
+        elapsed = time.time() - start
+    finally:
+        sys.stdout.close()
+        (sys.stdout, sys.stderr) = (stdout, stderr)
+
+    events = dict((c, n - before.get(c, 0))
+                  for (c, n) in fake.events.iteritems()
+                  if n != before.get(c, 0))
+
+    return {'scenario': name, 'seconds': elapsed,
+            'events': sum(events.itervalues()), 'by_command': events}
+
+
+def compare(results, baseline_file):
+    """Returns a `list` of scenarios sending more events than before"""
+    with open(baseline_file) as f:
+        baseline = dict(((r['size'], r['scenario']), r['events'])
+                        for r in json.load(f))
+
+    worse = []
+    for r in results:
+        before = baseline.get((r['size'], r['scenario']))
+        if before is not None and r['events'] > before:
+            worse.append('%s at %d tracks: %d events, was %d' %
+                         (r['scenario'], r['size'], r['events'], before))
+
+    return worse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the scripts '
+                                     'against a simulated iTunes.')
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES,
+                        help='library sizes (default: %s)' %
+                             ' '.join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument('--latency', type=float, default=0, metavar='MS',
+                        help='milliseconds each event takes (default: 0)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='write the results here')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='fail if any scenario sends more events than '
+                             'in these saved results')
+    args = parser.parse_args()
+
+    print '%-10s %-14s %10s %10s  %s' % ('tracks', 'scenario', 'seconds',
+                                        'events', 'by command')
+    results = []
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp()
+        try:
+            library = generate_library(size)
+            tree = build_tree(workdir, library)
+            fake = SimulatedITunes(library, latency=args.latency / 1000.0)
+
+            for (name, scenario) in scenarios(workdir, tree):
+                result = run(name, scenario, fake)
+                result['size'] = size
+                results.append(result)
+
+                print '%-10d %-14s %10.2f %10d  %s' % (
+                        size, name, result['seconds'], result['events'],
+                        ' '.join('%s:%d' % i for i in
+                                 sorted(result['by_command'].items())))
+        finally:
+            shutil.rmtree(workdir)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        worse = compare(results, args.baseline)
+        for line in worse:
+            print 'More events than the baseline: %s' % line
+        if worse:
+            sys.exit(1)
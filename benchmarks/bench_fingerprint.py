@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# ---*< bench_fingerprint.py >*------------------------------------------------
+# Benchmarks audio fingerprinting across a process pool
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Measures `FingerprintCache` throughput as the pool size grows
+
+Created on Oct 16, 2026
+
+Writes a set of tagged MP3 and M4A files, each pair sharing its audio
+but tagged differently, then fingerprints them with each pool size in
+turn from an empty cache.  Checks that every pair matches, and that a
+re-run is answered entirely from the cache.
+
+The files are freshly written, so they'll mostly be read back from the
+page cache - this measures hashing rather than the disk.  Drop the page
+cache between runs to include the disk.
+
+Usage: python benchmarks/bench_fingerprint.py [MB per file] [processes...]
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from fingerprint import FingerprintCache
+
+# ---*< Initialization >*------------------------------------------------------
+PAIRS = 32
+DEFAULT_SIZE = 8 # MB
+
+# ---*< Code >*----------------------------------------------------------------
+def id3v2(body):
+    """Returns an ID3v2.3 tag wrapped around `body`"""
+    size = len(body)
+    syncsafe = ''.join(chr((size >> s) & 0x7f) for s in (21, 14, 7, 0))
+    return 'ID3\x03\x00\x00' + syncsafe + body
+
+
+def atom(kind, body):
+    """Returns an MP4 atom"""
+    return struct.pack('>I4s', len(body) + 8, kind) + body
+
+
+def write_pair(root, i, audio):
+    """Writes two copies of `audio` with different tags"""
+    paths = []
+    for tag in ('first', 'second edit'):
+        path = os.path.join(root, '%d-%s.mp3' % (i, tag.split()[0]))
+        with open(path, 'wb') as f:
+            f.write(id3v2('TIT2 %s %d' % (tag, i) * (1 + len(tag))))
+            f.write(audio)
+            f.write('TAG' + tag.ljust(125))
+        paths.append(path)
+
+        path = os.path.join(root, '%d-%s.m4a' % (i, tag.split()[0]))
+        with open(path, 'wb') as f:
+            f.write(atom('ftyp', 'M4A \x00\x00\x00\x00'))
+            if tag == 'first':
+                f.write(atom('moov', 'udta %s' % tag))
+            f.write(atom('mdat', audio))
+            if tag != 'first':
+                f.write(atom('moov', 'udta %s' % tag * 10))
+        paths.append(path)
+
+    return paths
+
+
+if __name__ == '__main__':
+    size = int(float(sys.argv[1]) * 1024 * 1024 if len(sys.argv) > 1
+               else DEFAULT_SIZE * 1024 * 1024)
+    pools = ([int(x) for x in sys.argv[2:]] or
+             sorted(set([1, 2, 4, multiprocessing.cpu_count()])))
+    root = tempfile.mkdtemp()
+
+    try:
+        paths = []
+        for i in xrange(PAIRS):
+            paths.extend(write_pair(root, i, os.urandom(size)))
+
+        total = sum(os.path.getsize(p) for p in paths)
+        print '%d files, %.0f MB' % (len(paths), total / 1048576.0)
+        print '%-12s %10s %10s %8s' % ('processes', 'seconds', 'MB/sec',
+                                       'speedup')
+
+        baseline = None
+        for processes in pools:
+            cache = FingerprintCache(sqlite3.connect(':memory:'), processes)
+            start = time.time()
+            prints = cache.fingerprint_files(paths)
+            elapsed = time.time() - start
+            baseline = baseline or elapsed
+
+            # All four files written for each pair have the same audio
+            for i in xrange(PAIRS):
+                found = set(prints[p] for p in paths[i * 4:i * 4 + 4])
+                if len(found) != 1 or cache.errors:
+                    raise ValueError('Pair %d did not match: %s %s' %
+                                     (i, found, cache.errors))
+
+            print '%-12d %10.2f %10.0f %7.1fx' % (processes, elapsed,
+                                                  total / 1048576.0 / elapsed,
+                                                  baseline / elapsed)
+
+        start = time.time()
+        cache.fingerprint_files(paths)
+        print '%-12s %10.2f %10s %8s  (%d of %d cached)' % (
+                        'cached', time.time() - start, '', '',
+                        cache.stats['cached'], len(paths))
+    finally:
+        shutil.rmtree(root)
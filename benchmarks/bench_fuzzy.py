@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# ---*< bench_fuzzy.py >*------------------------------------------------------
+# Benchmarks fuzzy dupe matching
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Measures how `FuzzyMatcher` scales with the size of the library
+
+Created on Oct 16, 2026
+
+Generates libraries of the given sizes (15k, 30k and 60k tracks by
+default) in which one track in ten has a dupe with scuffed tags - a
+different spelling of "featuring", a change of case, punctuation, a
+duration a few hundred milliseconds off.  Reports the time taken, the
+number of pairs actually scored, and how many of the planted dupes
+were found.
+
+Usage: python benchmarks/bench_fuzzy.py [sizes...]
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from fuzzy import FuzzyMatcher
+
+# ---*< Initialization >*------------------------------------------------------
+DEFAULT_SIZES = [15000, 30000, 60000]
+
+"""One track in this many gets a dupe"""
+DUPE_EVERY = 10
+
+WORDS = ('love night dance deep house city light dream fire heart soul '
+         'rain gold blue time fall rise wave sun moon star high low').split()
+
+# ---*< Code >*----------------------------------------------------------------
+def make_library(count, rng):
+    """Returns (tracks, number of planted dupes)"""
+    tracks = []
+    planted = 0
+    artists = count // 15
+
+    while len(tracks) < count:
+        i = len(tracks)
+        track = {'id': i,
+                 'artist': 'Artist %d' % rng.randrange(artists),
+                 'album': 'Album %d' % rng.randrange(artists * 3),
+                 'name': ' '.join(rng.choice(WORDS) for _ in xrange(3)) +
+                         ' %d' % i,
+                 'duration': rng.uniform(120, 600),
+                 'comment': '',
+                 }
+        tracks.append(track)
+
+        if i % DUPE_EVERY == 0 and len(tracks) < count:
+            dupe = dict(track, id=i + 1)
+            dupe['artist'] = dupe['artist'].upper() + ' ft. Someone'
+            dupe['name'] = dupe['name'].title() + ' (Original Mix)'
+            dupe['album'] = dupe['album'] + '!'
+            dupe['duration'] += rng.uniform(-0.5, 0.5)
+            tracks.append(dupe)
+            planted += 1
+
+    return (tracks, planted)
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or DEFAULT_SIZES
+    rng = random.Random(42)
+
+    print '%-8s %10s %12s %14s %10s' % ('tracks', 'seconds', 'pairs scored',
+                                        'all pairs', 'found')
+    for size in sizes:
+        (tracks, planted) = make_library(size, rng)
+        matcher = FuzzyMatcher(threshold=0.75)
+
+        start = time.time()
+        groups = matcher.groups(tracks)
+        elapsed = time.time() - start
+
+        found = sum(1 for g in groups
+                    if len(g) == 2 and abs(g[0]['id'] - g[1]['id']) == 1)
+        print '%-8d %10.2f %12d %14d %5d/%d' % (size, elapsed,
+                                              matcher.stats['compared'],
+                                              size * (size - 1) // 2,
+                                              found, planted)
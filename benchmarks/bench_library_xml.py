@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# ---*< bench_library_xml.py >*------------------------------------------------
+# Benchmarks the streaming library XML reader
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Measures tracks/sec and peak RSS of `library_xml.iter_tracks()`
+
+Created on Oct 16, 2026
+
+Writes synthetic iTunes Library.xml files of the given sizes (100k and
+1M tracks by default - the 1M file is close to 1GB) and parses each one
+in a fresh process, so the peak RSS reported belongs to that parse
+alone.  Pass --plistlib to parse with `plistlib` too, for comparison.
+
+Usage: python benchmarks/bench_library_xml.py [--plistlib] [sizes...]
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from library_xml import iter_tracks
+
+# ---*< Initialization >*------------------------------------------------------
+DEFAULT_SIZES = [100000, 1000000]
+
+XML_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple Computer//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+\t<key>Major Version</key><integer>1</integer>
+\t<key>Minor Version</key><integer>1</integer>
+\t<key>Application Version</key><string>10.4</string>
+\t<key>Music Folder</key><string>file://localhost/Volumes/multimedia/Music/</string>
+\t<key>Tracks</key>
+\t<dict>
+'''
+
+TRACK_TEMPLATE = '''\t\t<key>%(id)d</key>
+\t\t<dict>
+\t\t\t<key>Track ID</key><integer>%(id)d</integer>
+\t\t\t<key>Name</key><string>%(name)s</string>
+\t\t\t<key>Artist</key><string>%(artist)s</string>
+\t\t\t<key>Album</key><string>%(album)s</string>
+\t\t\t<key>Kind</key><string>MPEG audio file</string>
+\t\t\t<key>Size</key><integer>%(size)d</integer>
+\t\t\t<key>Total Time</key><integer>%(time)d</integer>
+\t\t\t<key>Date Modified</key><date>2011-07-28T04:12:55Z</date>
+\t\t\t<key>Date Added</key><date>2011-07-28T04:13:02Z</date>
+\t\t\t<key>Bit Rate</key><integer>320</integer>
+\t\t\t<key>Sample Rate</key><integer>44100</integer>
+\t\t\t<key>Rating</key><integer>%(rating)d</integer>
+\t\t\t<key>Persistent ID</key><string>%(pid)016X</string>
+\t\t\t<key>Track Type</key><string>File</string>
+\t\t\t<key>Location</key><string>file://localhost/Volumes/multimedia/Music/%(artist_url)s/%(album_url)s/%(id)d.mp3</string>
+\t\t</dict>
+'''
+
+XML_FOOTER = '''\t</dict>
+\t<key>Playlists</key>
+\t<array>
+\t</array>
+</dict>
+</plist>
+'''
+
+# ---*< Code >*----------------------------------------------------------------
+def write_library(path, count):
+    """Writes a synthetic library XML with `count` tracks to `path`"""
+    out = open(path, 'w')
+    out.write(XML_HEADER)
+
+    for i in xrange(1, count + 1):
+        artist = 'Artist %d & Friends' % (i % 5000)
+        album = 'Album %d' % (i % 20)
+        out.write(TRACK_TEMPLATE % {'id': i,
+                                    'pid': i,
+                                    'name': 'Track %d' % i,
+                                    'artist': escape(artist),
+                                    'album': album,
+                                    'size': 8000000 + i,
+                                    'time': 240000 + i % 1000,
+                                    'rating': 20 * (i % 6),
+                                    'artist_url': artist.replace(' ', '%20')
+                                                        .replace('&', '%26'),
+                                    'album_url': album.replace(' ', '%20'),
+                                    })
+
+    out.write(XML_FOOTER)
+    out.close()
+
+
+def parse(path, use_plistlib=False):
+    """Parses a library and prints count, seconds and peak RSS in KB
+
+    Runs in the child process.
+    """
+    start = time.time()
+
+    if use_plistlib:
+        import plistlib
+        count = len(plistlib.readPlist(path)['Tracks'])
+    else:
+        count = 0
+        for _ in iter_tracks(path):
+            count += 1
+
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes on OS X, KB everywhere else
+        peak /= 1024
+
+    print count, elapsed, peak
+
+
+def run(path, use_plistlib=False):
+    """Parses `path` in a new process and returns (count, secs, peak KB)"""
+    args = [sys.executable, os.path.abspath(__file__), '--child', path]
+    if use_plistlib:
+        args.append('--plistlib')
+
+    out = subprocess.check_output(args).split()
+
+    return int(out[0]), float(out[1]), int(out[2])
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        parse(sys.argv[2], '--plistlib' in sys.argv)
+        sys.exit(0)
+
+    compare = '--plistlib' in sys.argv
+    sizes = [int(x) for x in sys.argv[1:] if x.isdigit()] or DEFAULT_SIZES
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        print '%-10s %-10s %12s %10s %12s' % ('tracks', 'parser', 'tracks/sec',
+                                             'seconds', 'peak RSS MB')
+        for size in sizes:
+            path = os.path.join(tmpdir, 'library-%d.xml' % size)
+            write_library(path, size)
+
+            parsers = ['iterparse', 'plistlib'] if compare else ['iterparse']
+            for name in parsers:
+                count, elapsed, peak = run(path, name == 'plistlib')
+                if count != size:
+                    raise ValueError('Parsed %d tracks, expected %d' %
+                                     (count, size))
+
+                print '%-10d %-10s %12.0f %10.2f %12.1f' % (size, name,
+                                                            count / elapsed,
+                                                            elapsed,
+                                                            peak / 1024.0)
+
+            os.unlink(path)
+    finally:
+        shutil.rmtree(tmpdir)
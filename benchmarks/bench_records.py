@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# ---*< bench_records.py >*----------------------------------------------------
+# Benchmarks track records against dicts and dictshield Documents
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Measures the memory and time of holding a library as `models.Track`s
+
+Created on Oct 16, 2026
+
+Builds the given number of tracks (250k and 1M by default) from catalog
+rows three ways, each in a fresh process:
+
+- `document`: a dictshield `iTunesTrack` per track, validated and
+  serialized with `to_json()`, as the scripts used to.  It only has
+  five fields, so if anything it flatters the `Document`.  Skipped if
+  dictshield isn't installed.
+- `dict`: `dict(zip(fields, row))`, as `Catalog.rows()` used to.
+- `track`: `models.record_maker()`, as `Catalog.rows()` does now.
+
+Reports the time to build them, the time for one pass reading the dupe
+hash fields of every track (what `plan_ratings()` does), and how much
+the peak RSS grew while they were held.
+
+Usage: python benchmarks/bench_records.py [sizes...]
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+from datetime import datetime
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from catalog import CATALOG_FIELDS, HASH_FIELDS
+import models
+
+# ---*< Initialization >*------------------------------------------------------
+DEFAULT_SIZES = [250000, 1000000]
+
+MODELS = ('document', 'dict', 'track')
+
+FIELDS = tuple(CATALOG_FIELDS) + ('hash',)
+
+# ---*< Code >*----------------------------------------------------------------
+def make_rows(count):
+    """Returns `count` catalog rows, as `Catalog.rows()` would read them"""
+    added = datetime(2011, 7, 28, 4, 13, 2)
+    rows = []
+    for i in xrange(count):
+        rows.append((u'%016X' % i, i,
+                     u'/Volumes/multimedia/Music/Artist %d/Album %d/%d.mp3' %
+                     (i % 5000, i % 20, i),
+                     u'Track %d' % i, u'Artist %d' % (i % 5000),
+                     u'Album %d' % (i % 20), 240.0 + i % 1000, u'',
+                     20 * (i % 6), added, added, u'%032x' % i))
+    return rows
+
+
+def peak_rss():
+    """Returns the peak RSS of this process in KB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes on OS X, KB everywhere else
+        peak /= 1024
+    return peak
+
+
+def build(model, rows):
+    """Returns a `list` of records of the given model, one per row"""
+    if model == 'document':
+        records = []
+        for row in rows:
+            track = models.iTunesTrack(md5=row[11], path=row[2],
+                                       rating=row[8], ids=[row[1]],
+                                       date_added=row[9])
+            track.validate()
+            track.to_json()
+            records.append(track)
+        return records
+
+    if model == 'dict':
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    make = models.record_maker(FIELDS)
+    return [make(row) for row in rows]
+
+
+def child(model, count):
+    """Builds and reads the records, printing build secs, read secs and
+    RSS growth in KB
+
+    Runs in the child process.
+    """
+    rows = make_rows(count)
+    before = peak_rss()
+
+    start = time.time()
+    records = build(model, rows)
+    built = time.time() - start
+
+    fields = ('md5', 'path', 'rating') if model == 'document' else HASH_FIELDS
+    start = time.time()
+    for r in records:
+        for f in fields:
+            r[f]
+    read = time.time() - start
+
+    print built, read, peak_rss() - before
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child(sys.argv[2], int(sys.argv[3]))
+        sys.exit(0)
+
+    sizes = [int(x) for x in sys.argv[1:]] or DEFAULT_SIZES
+
+    print '%-10s %-10s %10s %10s %12s %10s' % ('tracks', 'model', 'build s',
+                                              'read s', 'RSS MB', 'bytes/trk')
+    for size in sizes:
+        for model in MODELS:
+            if model == 'document' and not hasattr(models, 'iTunesTrack'):
+                print '%-10d %-10s  (dictshield is not installed)' % (size,
+                                                                      model)
+                continue
+
+            out = subprocess.check_output([sys.executable,
+                                           os.path.abspath(__file__),
+                                           '--child', model, str(size)])
+            (built, read, grown) = out.split()
+            print '%-10d %-10s %10.2f %10.2f %12.1f %10.0f' % (
+                            size, model, float(built), float(read),
+                            int(grown) / 1024.0, int(grown) * 1024.0 / size)
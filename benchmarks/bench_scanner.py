@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# ---*< bench_scanner.py >*----------------------------------------------------
+# Benchmarks the parallel tree scanner against a slow file system
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Measures `TreeScanner` throughput as the pool size grows
+
+Created on Oct 16, 2026
+
+Builds a local tree shaped like a music collection (artist/album/track)
+and scans it with a lister that sleeps before every directory listing,
+to stand in for the round trip to an SMB or NFS server.  `os.walk()`
+with the same delay is the baseline.
+
+The last row is a re-scan of the unchanged tree through a
+`DirectoryJournal`, which only stat()s each directory.  The injected
+delay only applies to listings, so that row leaves out stat latency.
+
+Usage: python benchmarks/bench_scanner.py [latency ms] [workers...]
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from scanner import DirectoryJournal, list_dir, TreeScanner
+
+# ---*< Initialization >*------------------------------------------------------
+ARTISTS = 100
+ALBUMS = 4
+TRACKS = 12
+
+DEFAULT_LATENCY = 5 # ms
+DEFAULT_WORKERS = [1, 2, 4, 8, 16, 32]
+
+INCLUDE = re.compile(r'^.+\.mp3$', re.IGNORECASE)
+
+# ---*< Code >*----------------------------------------------------------------
+def build_tree(root):
+    """Creates an empty-file music tree, returning the mp3 count"""
+    for a in xrange(ARTISTS):
+        for b in xrange(ALBUMS):
+            album = os.path.join(root, 'Artist %d' % a, 'Album %d' % b)
+            os.makedirs(album)
+            for t in xrange(TRACKS):
+                open(os.path.join(album, '%02d.mp3' % t), 'w').close()
+            open(os.path.join(album, 'cover.jpg'), 'w').close()
+
+    return ARTISTS * ALBUMS * TRACKS
+
+
+def slow_lister(latency):
+    """Returns a `list_dir()` that waits `latency` seconds first"""
+    def lister(path):
+        time.sleep(latency)
+        return list_dir(path)
+
+    return lister
+
+
+def walk(root, latency):
+    """Baseline - os.walk() paying the same delay per directory"""
+    found = []
+    for (dirpath, dirs, files) in os.walk(root):
+        time.sleep(latency)
+        found.extend(os.path.join(dirpath, f) for f in files
+                     if INCLUDE.match(f))
+
+    return found
+
+
+if __name__ == '__main__':
+    latency = (float(sys.argv[1]) if len(sys.argv) > 1
+               else DEFAULT_LATENCY) / 1000.0
+    pools = [int(x) for x in sys.argv[2:]] or DEFAULT_WORKERS
+    root = tempfile.mkdtemp()
+
+    try:
+        expected = build_tree(root)
+        dirs = 1 + ARTISTS + ARTISTS * ALBUMS
+        print ('%d directories, %d tracks, %.1fms per listing' %
+               (dirs, expected, latency * 1000))
+        print '%-12s %10s %12s %8s' % ('scanner', 'seconds', 'files/sec',
+                                       'speedup')
+
+        start = time.time()
+        count = len(walk(root, latency))
+        baseline = time.time() - start
+        print '%-12s %10.2f %12.0f %8s' % ('os.walk', baseline,
+                                           count / baseline, '1.0x')
+
+        for workers in pools:
+            scanner = TreeScanner(INCLUDE, workers=workers,
+                                  lister=slow_lister(latency))
+            start = time.time()
+            count = sum(1 for _ in scanner.scan(root))
+            elapsed = time.time() - start
+
+            if count != expected:
+                raise ValueError('Found %d files, expected %d' %
+                                 (count, expected))
+
+            print '%-12s %10.2f %12.0f %7.1fx' % ('%d workers' % workers,
+                                                  elapsed, count / elapsed,
+                                                  baseline / elapsed)
+
+        # Prime the journal, then backdate its listings rather than
+        # waiting out MTIME_GRANULARITY, so the second scan trusts it
+        journal = DirectoryJournal(sqlite3.connect(':memory:'))
+        scanner = TreeScanner(INCLUDE, workers=pools[-1],
+                              lister=journal.lister(slow_lister(latency)))
+        sum(1 for _ in scanner.scan(root))
+        journal.save(root)
+        for d in journal.entries:
+            entry = list(journal.entries[d])
+            entry[1] += 60 # listed_at
+            journal.entries[d] = tuple(entry)
+
+        start = time.time()
+        count = sum(1 for _ in scanner.scan(root))
+        elapsed = time.time() - start
+        print '%-12s %10.2f %12.0f %7.1fx  (%d of %d dirs listed)' % (
+                                        'journal', elapsed, count / elapsed,
+                                        baseline / elapsed,
+                                        journal.stats['listed'] - dirs, dirs)
+    finally:
+        shutil.rmtree(root)
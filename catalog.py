@@ -0,0 +1,364 @@
+# ---*< catalog.py >*----------------------------------------------------------
+# Persistent copy of the iTunes library
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Keeps a persistent local copy of the iTunes library in SQLite
+
+Created on Oct 16, 2026
+
+Every script used to start from an empty in-memory DB and pull the whole
+library out of iTunes.  The catalog instead lives in a file that's kept
+between runs, and `Catalog.refresh()` only pulls what changed since the
+last time:
+
+1. A snapshot of just the persistent IDs and change-detection fields
+   (`CHANGE_FIELDS`) - one bulk fetch per field.
+2. Tracks whose persistent ID is new, or whose change-detection fields
+   differ from the catalog, are fetched in full.
+3. Persistent IDs in the catalog that iTunes no longer has are deleted.
+
+iTunes doesn't touch the modification date when you change a rating, so
+rating is also a change-detection field.  Nor does it when a file goes
+missing or is pointed elsewhere, so location is one too - everything
+downstream trusts the catalog's path.  Where each track's file was last
+seen is kept as well (`last_path`), so a file that's gone missing can
+still be found by `relocate_tracks.py`.
+
+Both backends can refresh the same catalog, but the XML gives dates in
+UTC and iTunes in local time, so switching between them makes every
+track look modified once.
+
+Each track is one row of typed columns, with secondary indexes on path,
+track id, dupe hash (see `gen_hash()`), rating and date added - the
+last two for `query.TrackQuery`.  Changes are written with
+`executemany()` inside a single transaction, and a large load drops the
+secondary indexes first and rebuilds them once at the end, which is
+much faster than keeping them up to date row by row.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+from hashlib import md5
+import os
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from itunes import init_db_conn
+from models import record_maker
+
+# ---*< Initialization >*------------------------------------------------------
+"""Where the catalog is kept unless told otherwise"""
+DEFAULT_CATALOG_FILE = os.path.expanduser('~/.roadie/catalog.db')
+
+"""Snapshot fields compared to decide whether a track needs refetching"""
+CHANGE_FIELDS = ('modification_date', 'rating', 'location')
+
+"""Snapshot fields stored in the catalog, and the column each goes in"""
+CATALOG_COLUMNS = (('persistent_ID', 'persistent_id'),
+                   ('id', 'track_id'),
+                   ('location', 'path'),
+                   ('name', 'name'),
+                   ('artist', 'artist'),
+                   ('album', 'album'),
+                   ('duration', 'duration'),
+                   ('comment', 'comment'),
+                   ('rating', 'rating'),
+                   ('date_added', 'date_added'),
+                   ('modification_date', 'modification_date'),
+                   )
+CATALOG_FIELDS = [f for f, _ in CATALOG_COLUMNS]
+
+"""Every column that `Catalog.rows()` can return, by field name.  The
+dupe hash is worked out when a track is stored."""
+COLUMN_NAMES = dict(CATALOG_COLUMNS, hash='hash')
+
+"""Fields that make up the dupe hash"""
+HASH_FIELDS = ('artist', 'album', 'name', 'duration', 'comment')
+
+"""Secondary indexes on the catalog, by name"""
+CATALOG_INDEXES = (('catalog_path', 'path'),
+                   ('catalog_track_id', 'track_id'),
+                   ('catalog_hash', 'hash'),
+                   ('catalog_rating', 'rating'),
+                   ('catalog_date_added', 'date_added'),
+                   )
+
+"""Bump when the catalog table or the dupe hash changes.  An older
+catalog is dropped and rebuilt from scratch on the next refresh - it's
+only a cache."""
+CATALOG_VERSION = 4
+
+"""Loads of more than this many rows drop and rebuild the indexes"""
+REINDEX_THRESHOLD = 10000
+
+"""A full snapshot is one Apple event per field, and fetching changed
+tracks is one per track.  If more than this many times as many tracks
+as fields changed, take a full snapshot instead.  The bulk events are
+each slower than a single track's, hence the margin."""
+FULL_REFRESH_FACTOR = 10
+
+# ---*< Code >*----------------------------------------------------------------
+def gen_hash(track):
+    """Generates the dupe key for a track
+
+    Fields are normalized first, so a track hashes the same whichever
+    backend read it: a missing field is empty, and the duration is in
+    whole milliseconds, as the library XML gives it, rather than
+    whatever float iTunes returns.
+
+    :param track: `dict` of track fields, as given by
+                  `LibrarySnapshot.row()` or `Catalog.rows()`
+    """
+    values = []
+    for f in HASH_FIELDS:
+        value = track[f]
+        if value is None:
+            value = ''
+        elif f == 'duration':
+            value = int(round(value * 1000))
+        values.append(value)
+
+    m = md5()
+    body = '%s - %s - %s - %s - %s' % tuple(values)
+
+    m.update(body.encode('utf-8'))
+
+    return m.hexdigest()
+
+
+def open_catalog(db_file=DEFAULT_CATALOG_FILE):
+    """Opens the persistent catalog, creating it if need be
+
+    The connection also holds the usual per-run working tables (see
+    `itunes.setup_db()`), which are still reset every time.
+
+    :param db_file: (optional) `str` path of the catalog DB
+    :rtype: `Catalog`
+    """
+    dirname = os.path.dirname(db_file)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    db = init_db_conn(persist=True, db_file=db_file)
+
+    # Tuned for bulk loads.  WAL with synchronous=NORMAL can lose the
+    # last transaction on power loss, but never corrupts the DB - and
+    # the catalog can always be refreshed again.
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('PRAGMA temp_store=MEMORY')
+    db.execute('PRAGMA cache_size=-65536') # KB, so 64MB
+
+    return Catalog(db)
+
+
+def setup_catalog(db):
+    """Creates the catalog table and its indexes if they don't exist
+
+    A catalog from an older version of the schema is thrown away.
+    """
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    if version < CATALOG_VERSION:
+        db.execute('''DROP TABLE IF EXISTS catalog;''')
+        db.execute('PRAGMA user_version=%d' % CATALOG_VERSION)
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS catalog(
+            persistent_id TEXT PRIMARY KEY,
+            track_id INTEGER,
+            path TEXT,
+            name TEXT,
+            artist TEXT,
+            album TEXT,
+            duration REAL,
+            comment TEXT,
+            rating INTEGER,
+            date_added timestamp,
+            modification_date timestamp,
+            hash TEXT,
+            last_path TEXT
+        )
+    ''')
+    create_indexes(db)
+    db.commit()
+
+
+def create_indexes(db):
+    """Creates any of the catalog's secondary indexes that are missing"""
+    for name, column in CATALOG_INDEXES:
+        db.execute('CREATE INDEX IF NOT EXISTS %s ON catalog (%s)' %
+                   (name, column))
+
+
+def drop_indexes(db):
+    """Drops the catalog's secondary indexes, ahead of a big load"""
+    for name, _ in CATALOG_INDEXES:
+        db.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Catalog(object):
+    """Persistent, incrementally refreshed copy of the iTunes library"""
+
+    def __init__(self, db):
+        """__init__ method.
+
+        :param db: `sqlite3.Db` handle holding (or to hold) the catalog
+        """
+        self.db = db
+        setup_catalog(db)
+        super(Catalog, self).__init__()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM catalog').fetchone()[0]
+
+    def refresh(self, itunes, full=False):
+        """Brings the catalog up to date with the library
+
+        :param itunes: `ITunesManager` to read the library through
+        :param full: (optional) `boolean`; if True, refetch every track
+                     rather than just the ones that look changed
+        :rtype: `tuple` of (added, updated, deleted) track counts
+        """
+        known = {}
+        last_paths = {}
+        for row in self.db.execute('''
+            SELECT persistent_id, last_path, %s FROM catalog
+        ''' % ', '.join([COLUMN_NAMES[f] for f in CHANGE_FIELDS])):
+            row = tuple(row)
+            known[row[0]] = row[2:]
+            last_paths[row[0]] = row[1]
+
+        snap = itunes.snapshot(('persistent_ID',) + CHANGE_FIELDS)
+        current = set(snap['persistent_ID'])
+        changed = set()
+
+        for i, pid in enumerate(snap['persistent_ID']):
+            if full or known.get(pid) != tuple(snap[f][i]
+                                               for f in CHANGE_FIELDS):
+                changed.add(pid)
+
+        deleted = [pid for pid in known if pid not in current]
+
+        if len(changed) > len(CATALOG_FIELDS) * FULL_REFRESH_FACTOR:
+            fresh = itunes.snapshot(CATALOG_FIELDS)
+        elif changed:
+            fresh = itunes.fetch_tracks(changed, CATALOG_FIELDS)
+        else:
+            fresh = None
+
+        added = updated = 0
+        rows = []
+        if fresh is not None:
+            for track in fresh.records(CATALOG_FIELDS):
+                # A full snapshot has unchanged tracks in it too
+                if track.persistent_ID not in changed:
+                    continue
+
+                # The one place tracks come in from outside, so the one
+                # place they're checked
+                track.validate()
+
+                if track.persistent_ID in known:
+                    updated += 1
+                else:
+                    added += 1
+
+                rows.append([track[f] for f in CATALOG_FIELDS] +
+                            [gen_hash(track),
+                             track.location or
+                             last_paths.get(track.persistent_ID)])
+
+        self.store(rows, deleted)
+
+        return (added, updated, len(deleted))
+
+    def store(self, rows, deleted=()):
+        """Writes track rows to the catalog in one transaction
+
+        :param rows: iterable of row sequences, holding `CATALOG_FIELDS`
+                     in order followed by the dupe hash and the last
+                     location the track's file was seen at
+        :param deleted: (optional) iterable of persistent IDs to remove
+        """
+        rows = list(rows)
+        reindex = len(rows) > REINDEX_THRESHOLD
+
+        try:
+            if reindex:
+                drop_indexes(self.db)
+
+            self.db.executemany('''
+                INSERT OR REPLACE INTO catalog (%s, hash, last_path)
+                VALUES (%s)
+            ''' % (', '.join([c for _, c in CATALOG_COLUMNS]),
+                   ', '.join(['?'] * (len(CATALOG_COLUMNS) + 2))), rows)
+
+            self.db.executemany('''
+                DELETE FROM catalog WHERE persistent_id = ?
+            ''', [(pid,) for pid in deleted])
+
+            if reindex:
+                create_indexes(self.db)
+                # Lets the planner pick the most selective index when a
+                # query could use several
+                self.db.execute('ANALYZE catalog')
+
+            self.db.commit()
+
+        except:
+            self.db.rollback()
+            raise
+
+    def paths(self):
+        """Returns a `set` of every track location in the catalog"""
+        return set(row[0] for row in self.db.execute('''
+            SELECT path FROM catalog WHERE path IS NOT NULL
+        '''))
+
+    def missing(self):
+        """Yields (track id, artist, name) for each track with no file"""
+        curs = self.db.execute('''
+            SELECT track_id, artist, name FROM catalog WHERE path IS NULL
+        ''')
+
+        for row in curs:
+            yield tuple(row)
+
+    def duplicate_paths(self):
+        """Yields (path, [track ids]) for files in the library twice"""
+        curs = self.db.execute('''
+            SELECT path, GROUP_CONCAT(track_id) FROM catalog
+            WHERE path IS NOT NULL
+            GROUP BY path HAVING COUNT(*) > 1
+        ''')
+
+        for (path, ids) in curs:
+            yield (path, [int(x) for x in ids.split(',')])
+
+    def last_seen(self):
+        """Yields each track that has ever had a file as a `models.Track`
+        of `persistent_ID` and `location`, the location being where its
+        file was last seen - even if iTunes has lost it since"""
+        make = record_maker(('persistent_ID', 'location'))
+
+        for row in self.db.execute('''
+            SELECT persistent_id, last_path FROM catalog
+            WHERE last_path IS NOT NULL
+        '''):
+            yield make(row)
+
+    def rows(self, fields=CATALOG_FIELDS):
+        """Yields each catalogued track as a `models.Track`
+
+        Tracks read like the `dict`s from `LibrarySnapshot.row()`, so
+        code written against a snapshot works on the catalog too.  They
+        were checked on the way in, so aren't validated again.
+        """
+        curs = self.db.execute('SELECT %s FROM catalog' %
+                               ', '.join([COLUMN_NAMES[f] for f in fields]))
+        make = record_maker(fields)
+
+        for row in curs:
+            yield make(row)
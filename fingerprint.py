@@ -0,0 +1,288 @@
+# ---*< fingerprint.py >*------------------------------------------------------
+# Dupe keys from audio content
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Fingerprints music files by their audio alone, ignoring the tags
+
+Created on Oct 16, 2026
+
+`catalog.gen_hash()` keys dupes on tags, so retagging one copy of a
+track breaks the match, and two different edits that happen to be
+tagged alike collide.  An MD5 of the whole file has the opposite
+problem - any tag edit changes it.
+
+`fingerprint()` hashes only the audio payload:
+
+* MP3 - everything between any ID3v2 tags at the start and any ID3v1
+  or APEv2 tags at the end.
+* MP4 (m4a, m4b, m4p...) - the contents of the `mdat` atoms.  All the
+  metadata lives in `moov`, which is skipped.
+* Anything else - the whole file.
+
+So two files with the same audio get the same fingerprint however
+they're tagged.  Note that this matches identical encodings, not
+identical recordings - the same song ripped twice won't match.
+
+Hashing a big collection is mostly reading, so `FingerprintCache`
+spreads it over a process pool, each reading in large sequential
+chunks.  Results are cached in the catalog DB keyed on (device, inode,
+size, mtime), so a re-run only hashes files that are new or changed.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+from hashlib import md5
+import multiprocessing
+import os
+import struct
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+
+# ---*< Initialization >*------------------------------------------------------
+"""Bytes read at a time while hashing"""
+READ_SIZE = 4 * 1024 * 1024
+
+"""Files handed to each pool process at a time"""
+POOL_CHUNK_SIZE = 16
+
+"""Fingerprints hashed between writes to the cache, so an interrupted run
+keeps most of its work"""
+CACHE_COMMIT_EVERY = 500
+
+"""Extensions treated as MP4 containers"""
+MP4_EXTENSIONS = ('.m4a', '.m4b', '.m4p', '.m4v', '.mp4', '.aac')
+
+# ---*< Code >*----------------------------------------------------------------
+def id3v2_length(header):
+    """Returns the full length of an ID3v2 tag given its first 10 bytes
+
+    Returns 0 if `header` isn't the start of an ID3v2 tag.
+    """
+    if len(header) < 10 or header[:3] != 'ID3':
+        return 0
+
+    flags = ord(header[5])
+    # The size is 'syncsafe' - 7 bits per byte
+    size = 0
+    for c in header[6:10]:
+        size = (size << 7) | (ord(c) & 0x7f)
+
+    # Header, body, and a footer if the footer flag is set
+    return 10 + size + (10 if flags & 0x10 else 0)
+
+
+def mp3_ranges(f, size):
+    """Returns the (start, end) byte range of an MP3's audio frames"""
+    start = 0
+    while True:
+        f.seek(start)
+        length = id3v2_length(f.read(10))
+        if not length:
+            break
+        start += length
+
+    end = size
+    if end - 128 >= start:
+        f.seek(end - 128)
+        if f.read(3) == 'TAG':
+            end -= 128
+
+    if end - 32 >= start:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == 'APETAGEX':
+            (tag_size, tag_flags) = struct.unpack('<II', footer[12:20])
+            # The size includes the footer but not the header
+            end -= tag_size + (32 if tag_flags & 0x80000000 else 0)
+
+    return [(start, max(start, end))]
+
+
+def mp4_ranges(f, size):
+    """Returns the (start, end) byte range of each `mdat` atom's contents
+
+    Only the top-level atoms are walked.  If there's no `mdat` at all,
+    it probably isn't an MP4, and the whole file is used.
+    """
+    ranges = []
+    pos = 0
+
+    while pos + 8 <= size:
+        f.seek(pos)
+        (length, kind) = struct.unpack('>I4s', f.read(8))
+        header = 8
+
+        if length == 1:
+            # 64-bit size follows the type
+            length = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif length == 0:
+            # Runs to the end of the file
+            length = size - pos
+
+        if length < header:
+            break
+
+        if kind == 'mdat':
+            ranges.append((pos + header, min(pos + length, size)))
+
+        pos += length
+
+    return ranges or [(0, size)]
+
+
+def audio_ranges(path, f, size):
+    """Returns the byte ranges of an open file that hold its audio"""
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == '.mp3':
+        return mp3_ranges(f, size)
+
+    if ext in MP4_EXTENSIONS:
+        return mp4_ranges(f, size)
+
+    return [(0, size)]
+
+
+def fingerprint(path):
+    """Returns an MD5 hex digest of a file's audio payload"""
+    m = md5()
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+
+        for (start, end) in audio_ranges(path, f, size):
+            f.seek(start)
+            left = end - start
+            while left > 0:
+                data = f.read(min(READ_SIZE, left))
+                if not data:
+                    break
+                m.update(data)
+                left -= len(data)
+
+    return m.hexdigest()
+
+
+def _pool_fingerprint(path):
+    """Pool worker - returns (path, fingerprint or None, error or None)"""
+    try:
+        return (path, fingerprint(path), None)
+    except (IOError, OSError, struct.error) as e:
+        return (path, None, str(e))
+
+
+def setup_fingerprints(db):
+    """Creates the fingerprint cache table if it doesn't already exist"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS fingerprints(
+            device INTEGER,
+            inode INTEGER,
+            size INTEGER,
+            mtime REAL,
+            fingerprint TEXT,
+            PRIMARY KEY (device, inode)
+        )
+    ''')
+    db.commit()
+
+
+class FingerprintCache(object):
+    """Fingerprints files, remembering them by (device, inode, size, mtime)
+
+    Files that can't be read are skipped, and recorded in `errors` as
+    (path, message) tuples.
+    """
+
+    def __init__(self, db, processes=None):
+        """__init__ method.
+
+        :param db: `sqlite3.Db` handle to keep the cache in
+        :param processes: (optional) `int` number of processes to hash
+                          with.  Defaults to one per CPU.
+        """
+        self.db = db
+        self.processes = processes or multiprocessing.cpu_count()
+        self.errors = []
+        self.stats = {'cached': 0, 'hashed': 0, 'bytes': 0}
+        setup_fingerprints(db)
+        super(FingerprintCache, self).__init__()
+
+    def fingerprint_files(self, paths):
+        """Returns a `dict` of path to fingerprint for each readable file
+
+        Cached fingerprints are used when the file's device, inode, size
+        and mtime all still match.  The rest are hashed in parallel and
+        written back to the cache.
+        """
+        cache = {}
+        for row in self.db.execute('''
+            SELECT device, inode, size, mtime, fingerprint FROM fingerprints
+        '''):
+            row = tuple(row)
+            cache[row[:2]] = row[2:]
+
+        results = {}
+        misses = {}
+
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                self.errors.append((path, str(e)))
+                continue
+
+            key = (st.st_dev, st.st_ino)
+            cached = cache.get(key)
+
+            if cached is not None and cached[:2] == (st.st_size, st.st_mtime):
+                results[path] = cached[2]
+                self.stats['cached'] += 1
+            else:
+                misses[path] = key + (st.st_size, st.st_mtime)
+
+        if not misses:
+            return results
+
+        fresh = []
+        pool = multiprocessing.Pool(min(self.processes, len(misses)))
+        try:
+            for (path, print_, error) in pool.imap_unordered(
+                                                    _pool_fingerprint, misses,
+                                                    POOL_CHUNK_SIZE):
+                if error is not None:
+                    self.errors.append((path, error))
+                    continue
+
+                results[path] = print_
+                fresh.append(misses[path] + (print_,))
+                self.stats['hashed'] += 1
+                self.stats['bytes'] += misses[path][2]
+
+                if len(fresh) >= CACHE_COMMIT_EVERY:
+                    self._store(fresh)
+                    fresh = []
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            # Keep whatever was hashed, even if interrupted
+            self._store(fresh)
+
+        return results
+
+    def _store(self, fresh):
+        """Writes newly hashed (device, inode, size, mtime, fingerprint)
+        rows to the cache"""
+        self.db.executemany('''
+            INSERT OR REPLACE INTO fingerprints
+                (device, inode, size, mtime, fingerprint)
+            VALUES (?, ?, ?, ?, ?)
+        ''', fresh)
+        self.db.commit()
@@ -0,0 +1,194 @@
+# ---*< fuzzy.py >*------------------------------------------------------------
+# Fuzzy dupe matching
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Finds dupes whose tags are close, rather than exactly the same
+
+Created on Oct 16, 2026
+
+`catalog.gen_hash()` only matches tracks whose artist, album, name,
+duration and comment are identical, so "Artist feat. X" and "Artist ft
+X" are different tracks, and so are two rips a few hundred milliseconds
+apart.  `FuzzyMatcher` works from the same fields, but:
+
+1. Normalizes them - case, accents, punctuation, whitespace, and the
+   various spellings of "featuring" all go.
+2. Blocks the tracks by normalized lead artist and duration bucket, so
+   only tracks in the same block (or the bucket either side of it) are
+   ever compared.  That keeps it close to linear in the size of the
+   library, where comparing every pair would be quadratic.
+3. Scores each candidate pair on how similar its fields are, and puts
+   pairs scoring at least `threshold` in the same group.  Groups are
+   transitive - if A matches B and B matches C, all three are dupes.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+from difflib import SequenceMatcher
+import re
+import unicodedata
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+
+# ---*< Initialization >*------------------------------------------------------
+"""Lowest score at which two tracks are considered dupes"""
+DEFAULT_THRESHOLD = 0.9
+
+"""Most seconds two dupes' durations can differ by"""
+DURATION_TOLERANCE = 1.0
+
+"""Width of a duration block in seconds.  Must be at least
+`DURATION_TOLERANCE`, as only neighbouring buckets are compared."""
+DURATION_BUCKET = 2.0
+
+"""How much each field counts towards a pair's score"""
+FIELD_WEIGHTS = (('name', 0.5),
+                 ('artist', 0.2),
+                 ('album', 0.2),
+                 ('comment', 0.1),
+                 )
+
+FEATURING_REGEX = re.compile(r'\b(?:featuring|feat|ft)\b\.?')
+PUNCTUATION_REGEX = re.compile(r'[^\w\s]', re.UNICODE)
+SPACE_REGEX = re.compile(r'\s+', re.UNICODE)
+
+"""Splits the lead artist from the rest"""
+LEAD_ARTIST_REGEX = re.compile(r'\s(?:feat|vs|and|with|x)\s.*$')
+
+# ---*< Code >*----------------------------------------------------------------
+def normalize(text):
+    """Reduces a tag to a form where trivial differences don't count
+
+    >>> normalize(u'  Beyonc\\xe9 Ft. JAY-Z ')
+    u'beyonce feat jay z'
+    """
+    if not text:
+        return u''
+
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+
+    text = unicodedata.normalize('NFKD', text)
+    text = u''.join(c for c in text if not unicodedata.combining(c))
+    text = text.lower().replace(u'&', u' and ')
+    text = FEATURING_REGEX.sub(u' feat ', text)
+    text = PUNCTUATION_REGEX.sub(u' ', text)
+
+    return SPACE_REGEX.sub(u' ', text).strip()
+
+
+def lead_artist(artist):
+    """Returns the first artist from a normalized artist tag"""
+    return LEAD_ARTIST_REGEX.sub(u'', artist)
+
+
+class FuzzyMatcher(object):
+    """Groups tracks whose tags are near enough the same"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD,
+                 tolerance=DURATION_TOLERANCE):
+        """__init__ method.
+
+        :param threshold: (optional) `float` lowest score, from 0 to 1,
+                          at which two tracks count as dupes
+        :param tolerance: (optional) `float` most seconds two dupes'
+                          durations can differ by.  No more than
+                          `DURATION_BUCKET`.
+        """
+        if tolerance > DURATION_BUCKET:
+            raise ValueError('Duration tolerance can be at most %s '
+                             'seconds' % DURATION_BUCKET)
+
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.stats = {'tracks': 0, 'blocks': 0, 'compared': 0, 'matched': 0}
+        super(FuzzyMatcher, self).__init__()
+
+    def groups(self, tracks):
+        """Returns a `list` of groups of dupes, each a `list` of tracks
+
+        Tracks with no dupes aren't returned.
+
+        :param tracks: iterable of track `dict`s holding at least
+                       `artist`, `album`, `name`, `duration` and
+                       `comment`, as given by `Catalog.rows()`
+        """
+        tracks = list(tracks)
+        fields = [f for f, _ in FIELD_WEIGHTS]
+        normal = [dict((f, normalize(t[f])) for f in fields) for t in tracks]
+
+        blocks = {}
+        for (i, t) in enumerate(tracks):
+            key = (lead_artist(normal[i]['artist']),
+                   int((t['duration'] or 0) // DURATION_BUCKET))
+            blocks.setdefault(key, []).append(i)
+
+        self.stats['tracks'] = len(tracks)
+        self.stats['blocks'] = len(blocks)
+
+        parent = range(len(tracks))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for ((artist, bucket), members) in blocks.iteritems():
+            # Compare within the block, and with the next bucket up so
+            # that durations either side of a boundary still meet
+            neighbours = blocks.get((artist, bucket + 1), [])
+
+            for (n, i) in enumerate(members):
+                for j in members[n + 1:] + neighbours:
+                    if find(i) == find(j):
+                        continue
+
+                    if self.score(tracks[i], normal[i],
+                                  tracks[j], normal[j]) >= self.threshold:
+                        parent[find(i)] = find(j)
+                        self.stats['matched'] += 1
+
+        grouped = {}
+        for i in xrange(len(tracks)):
+            grouped.setdefault(find(i), []).append(tracks[i])
+
+        return [g for g in grouped.itervalues() if len(g) > 1]
+
+    def score(self, a, a_normal, b, b_normal):
+        """Scores how alike two tracks are, from 0 to 1
+
+        Tracks whose durations are further apart than the tolerance
+        score 0 whatever their tags.
+        """
+        self.stats['compared'] += 1
+
+        if abs((a['duration'] or 0) - (b['duration'] or 0)) > self.tolerance:
+            return 0.0
+
+        total = 0.0
+        left = 1.0
+        for (f, weight) in FIELD_WEIGHTS:
+            total += weight * similarity(a_normal[f], b_normal[f])
+            left -= weight
+
+            # Give up once the rest can't make up the difference
+            if total + left < self.threshold:
+                return total
+
+        return total
+
+
+def similarity(a, b):
+    """Returns how alike two normalized strings are, from 0 to 1"""
+    if a == b:
+        return 1.0
+
+    matcher = SequenceMatcher(None, a, b)
+    if matcher.real_quick_ratio() == 0:
+        return 0.0
+
+    return matcher.ratio()
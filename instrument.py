@@ -0,0 +1,289 @@
+# ---*< instrument.py >*-------------------------------------------------------
+# Counts and times Apple events
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Counts and times every Apple event sent to iTunes
+
+Created on Oct 16, 2026
+
+Nearly all the time any of these scripts takes is spent waiting on
+iTunes, so what matters is how many events get sent, of which kind, and
+from where.  Set `ROADIE_PROFILE=1` and the application returned by
+`AppscriptBackend.connect()` is wrapped in an `EventProxy`.  Every
+command sent through it is timed and counted by command and property
+(`get location`, `set rating`, `add`...), with a histogram of how long
+each took, and by the line of code that sent it.
+
+When the script exits, a report goes to stderr.  It lists each kind of
+event and the call sites that spent longest waiting on iTunes.  Set
+`ROADIE_PROFILE_JSON` to a path to have the same figures written there
+as JSON as well.
+
+With the variable unset nothing is wrapped, so it costs nothing.
+
+An event is labelled with its command and the property it was sent to,
+e.g. `get location`.  Picking out elements - `tracks[...]`,
+`tracks.ID(n)` - isn't an event, and what it picks isn't a property, so
+a command sent to an element is labelled with just the command (`add`,
+`delete`).  References returned *by* a command (say, the tracks `add`
+made) aren't wrapped, so events sent through those go uncounted.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import atexit
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+# ---*< Third-party imports >*-------------------------------------------------
+try:
+    from appscript.reference import Command #@UnresolvedImport
+except ImportError:
+    # Not on a Mac - only stand-ins registered with
+    # `register_command_type()` are commands
+    Command = None
+
+# ---*< Local imports >*-------------------------------------------------------
+
+# ---*< Initialization >*------------------------------------------------------
+"""Turns profiling on when set to anything but empty or 0"""
+PROFILE_VAR = 'ROADIE_PROFILE'
+
+"""Path to write the report to as JSON, as well as printing it"""
+PROFILE_JSON_VAR = 'ROADIE_PROFILE_JSON'
+
+"""Upper bounds of the latency histogram buckets, in milliseconds.  The
+last bucket takes everything slower."""
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+"""Call sites listed in the report"""
+TOP_CALL_SITES = 10
+
+"""Classes whose instances are commands, sending an event when called"""
+_command_types = [Command] if Command is not None else []
+
+# ---*< Code >*----------------------------------------------------------------
+def register_command_type(cls):
+    """Class decorator marking a stand-in's command class as one, so its
+    calls are counted like appscript's"""
+    _command_types.append(cls)
+    return cls
+
+
+def is_command(target):
+    """True if calling `target` sends a command"""
+    return isinstance(target, tuple(_command_types))
+
+
+def enabled():
+    """True if `PROFILE_VAR` asks for events to be profiled"""
+    return os.environ.get(PROFILE_VAR, '') not in ('', '0')
+
+
+def wrap(target):
+    """Returns `target` wrapped to record its events, if profiling is on
+
+    Otherwise `target` itself is returned.
+
+    :param target: appscript application (or reference)
+    """
+    if target is None or not enabled():
+        return target
+
+    return EventProxy(target, recorder())
+
+
+_recorder = []
+
+def recorder():
+    """Returns the `EventRecorder` for this run, reporting at exit"""
+    if not _recorder:
+        _recorder.append(EventRecorder())
+        atexit.register(_recorder[0].report, sys.stderr,
+                        os.environ.get(PROFILE_JSON_VAR))
+
+    return _recorder[0]
+
+
+class EventRecorder(object):
+    """Tallies events by kind and by call site.  Thread-safe."""
+
+    def __init__(self):
+        """__init__ method.  Takes no options."""
+        self.lock = threading.Lock()
+        self.events = {}
+        self.sites = {}
+        self.started = time.time()
+        super(EventRecorder, self).__init__()
+
+    def record(self, command, prop, site, elapsed, failed):
+        """Adds one event
+
+        :param command: `str` name of the command, e.g. 'get'
+        :param prop: `str` property or element it was sent to, or ''
+        :param site: `tuple` of (file, line, function) that sent it
+        :param elapsed: `float` seconds it took
+        :param failed: `boolean` True if it raised
+        """
+        bucket = bisect.bisect_left(HISTOGRAM_BOUNDS, elapsed * 1000)
+
+        with self.lock:
+            stats = self.events.get((command, prop))
+            if stats is None:
+                stats = self.events[(command, prop)] = {
+                            'count': 0, 'errors': 0, 'seconds': 0.0,
+                            'max': 0.0,
+                            'histogram': [0] * (len(HISTOGRAM_BOUNDS) + 1)}
+
+            stats['count'] += 1
+            stats['errors'] += failed
+            stats['seconds'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['histogram'][bucket] += 1
+
+            site_stats = self.sites.setdefault((site, command, prop),
+                                               [0, 0.0])
+            site_stats[0] += 1
+            site_stats[1] += elapsed
+
+    def summary(self):
+        """Returns the figures so far as a JSON-able `dict`"""
+        with self.lock:
+            events = [dict(stats, command=command, property=prop,
+                           histogram=list(stats['histogram']))
+                      for ((command, prop), stats) in self.events.items()]
+            sites = [{'file': f, 'line': line, 'function': func,
+                      'command': command, 'property': prop,
+                      'count': count, 'seconds': seconds}
+                     for (((f, line, func), command, prop),
+                          (count, seconds)) in self.sites.items()]
+
+        events.sort(key=lambda e: e['seconds'], reverse=True)
+        sites.sort(key=lambda s: s['seconds'], reverse=True)
+
+        return {'script': os.path.basename(sys.argv[0] or '-'),
+                'elapsed': time.time() - self.started,
+                'events': sum(e['count'] for e in events),
+                'seconds': sum(e['seconds'] for e in events),
+                'histogram_bounds_ms': list(HISTOGRAM_BOUNDS),
+                'by_event': events,
+                'by_call_site': sites}
+
+    def report(self, out, json_file=None):
+        """Writes the report to `out`, and as JSON to `json_file` if given"""
+        summary = self.summary()
+
+        if json_file:
+            with open(json_file, 'w') as f:
+                json.dump(summary, f, indent=2, sort_keys=True)
+
+        out.write('\nApple events sent by %s: %d, waiting %.2f of %.2f '
+                  'seconds\n' % (summary['script'], summary['events'],
+                                 summary['seconds'], summary['elapsed']))
+        if not summary['events']:
+            return
+
+        labels = ['<%dms' % b for b in HISTOGRAM_BOUNDS] + ['more']
+        out.write('\n%-24s %8s %6s %10s %9s %9s  %s\n' %
+                  ('event', 'count', 'errors', 'seconds', 'mean ms',
+                   'max ms', 'latency'))
+        for e in summary['by_event']:
+            histogram = ' '.join(['%s:%d' % (label, n) for (label, n)
+                                  in zip(labels, e['histogram']) if n])
+            out.write('%-24s %8d %6d %10.2f %9.1f %9.1f  %s\n' %
+                      (('%s %s' % (e['command'], e['property'])).strip(),
+                       e['count'], e['errors'], e['seconds'],
+                       e['seconds'] * 1000 / e['count'], e['max'] * 1000,
+                       histogram))
+
+        out.write('\n%-44s %-24s %8s %10s\n' % ('call site', 'event',
+                                                   'count', 'seconds'))
+        for s in summary['by_call_site'][:TOP_CALL_SITES]:
+            site = '%s:%d %s' % (os.path.basename(s['file']), s['line'],
+                                 s['function'])
+            out.write('%-44s %-24s %8d %10.2f\n' %
+                      (site, ('%s %s' % (s['command'], s['property'])).strip(),
+                       s['count'], s['seconds']))
+
+
+def _unwrap(value):
+    """Returns the real reference behind an `EventProxy`"""
+    if isinstance(value, EventProxy):
+        return value._target
+    return value
+
+
+class EventProxy(object):
+    """Stands in for an appscript reference, recording every command
+
+    Attribute and element lookups return more proxies, so everything
+    reached through the application is covered.  Calling a command
+    (`ref.get()`, `ref.set()`, `app.add()`...) sends an event and is
+    recorded, as one event.  Calling a reference directly is appscript
+    shorthand for `get`, and is recorded as one.  Element selectors
+    (`tracks.ID(n)`) send nothing and aren't recorded.
+    """
+    __slots__ = ('_target', '_recorder', '_name', '_prop')
+
+    def __init__(self, target, recorder, name='', prop=''):
+        """__init__ method.
+
+        :param target: appscript object to stand in for
+        :param recorder: `EventRecorder` to record events in
+        :param name: (optional) `str` attribute `target` was reached by
+        :param prop: (optional) `str` attribute before that
+        """
+        self._target = target
+        self._recorder = recorder
+        self._name = name
+        self._prop = prop
+
+    def __getattr__(self, name):
+        return EventProxy(getattr(self._target, name), self._recorder, name,
+                          self._name)
+
+    def __getitem__(self, key):
+        # Elements picked out aren't a property, so they start a new label
+        return EventProxy(self._target[_unwrap(key)], self._recorder)
+
+    def __getslice__(self, start, end):
+        return EventProxy(self._target[start:end], self._recorder)
+
+    def __call__(self, *args, **kwargs):
+        args = [_unwrap(a) for a in args]
+        kwargs = dict((key, _unwrap(v)) for (key, v) in kwargs.iteritems())
+
+        if isinstance(self._target, types.MethodType):
+            # An element selector such as `tracks.ID(n)`, not an event
+            return EventProxy(self._target(*args, **kwargs), self._recorder)
+
+        if is_command(self._target):
+            (command, prop) = (self._name, self._prop)
+        else:
+            (command, prop) = ('get', self._name)
+
+        caller = sys._getframe(1)
+        site = (caller.f_code.co_filename, caller.f_lineno,
+                caller.f_code.co_name)
+
+        failed = True
+        start = time.time()
+        try:
+            result = self._target(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._recorder.record(command, prop, site, time.time() - start,
+                                  failed)
+
+    def __nonzero__(self):
+        return bool(self._target)
+
+    def __repr__(self):
+        return 'EventProxy(%r)' % (self._target,)
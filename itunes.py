@@ -10,20 +10,43 @@ Created on Feb 12, 2011
 
 """
 # ---*< Standard imports >*----------------------------------------------------
+from collections import OrderedDict
+import errno
+from itertools import izip
+from multiprocessing.pool import ThreadPool
 import os
 import sqlite3
 import sys
 import tempfile
 
 # ---*< Third-party imports >*-------------------------------------------------
-from appscript import app, k, CommandError #@UnresolvedImport
 
 # ---*< Local imports >*-------------------------------------------------------
+from backends import (AppscriptBackend, CommandError, SNAPSHOT_FIELDS,
+                      SNAPSHOT_TIMEOUT, XMLLibraryBackend)
+from models import record_maker
 
 # ---*< Initialization >*------------------------------------------------------
 """The name of the playlist of files to kill.  Any type of playlist."""
 PLAYLIST_NAME = 'Files to kill'
 
+"""Most tracks matched by a single `BatchWriter` event.  Each one adds a
+clause to the filter iTunes has to evaluate against the library."""
+BATCH_CHUNK_SIZE = 500
+
+"""Files deleted at once by `delete_tracks()`.  Deletes on a network
+mount spend most of their time waiting on the server."""
+DELETE_WORKERS = 8
+
+"""Files deleted between commits of the delete journal"""
+DELETE_COMMIT_EVERY = 100
+
+"""States of a track in the delete journal"""
+DELETE_PENDING = 0
+DELETE_UNLINKED = 1
+DELETE_DONE = 2
+DELETE_FAILED = 3
+
 # ---*< Code >*----------------------------------------------------------------
 def init_db_conn(persist=False, db_file=None):
     """Setups up the SQLite DB handle
@@ -43,11 +66,11 @@ def init_db_conn(persist=False, db_file=None):
         if not db_file:
             db_file = tempfile.NamedTemporaryFile(delete=False).name
 
-        print 'DB File: %s' % db_file
+        sys.stderr.write('DB File: %s\n' % db_file)
 
     else:
         db_file = ':memory:'
-        print 'Using memory for SQLite DB'
+        sys.stderr.write('Using memory for SQLite DB\n')
 
     db_conn = sqlite3.connect(db_file,
                               detect_types=sqlite3.PARSE_DECLTYPES
@@ -59,30 +82,36 @@ def init_db_conn(persist=False, db_file=None):
 
 
 def setup_db(db):
-    """Initializes a database if empty
+    """Initializes the per-run working tables, emptying them if they exist
 
-    The DB schema is keyed on the MD5 of the file, and the stored JSON
-    contains the md5 and all data in the iTunesTrack object.  Indexing
-    is also provided on file path, in case there are multiple reference
-    to the same actual file.
+    `dupe_finder` holds one row per dupe hash with the rating and date
+    added that every track sharing that hash should end up with, and
+    `dupe_ids` maps each hash to the ids of the tracks that share it.
 
-    TODO: Should table creation be removed and done by caller?
+    The persistent library catalog is set up separately, by
+    `catalog.setup_catalog()`.
     """
     db.execute('''DROP TABLE IF EXISTS dupe_finder;''')
     db.execute('''
         CREATE TABLE dupe_finder(
             md5 TEXT PRIMARY KEY,
-            data json
+            rating INTEGER,
+            date_added timestamp
         )
     ''')
 
-    db.execute('''DROP TABLE IF EXISTS sync_hierarchy;''')
+    db.execute('''DROP TABLE IF EXISTS dupe_ids;''')
     db.execute('''
-        CREATE TABLE sync_hierarchy(
-            path TEXT PRIMARY KEY,
-            data json
+        CREATE TABLE dupe_ids(
+            md5 TEXT,
+            track_id INTEGER,
+            PRIMARY KEY (md5, track_id)
         )
     ''')
+    db.execute('''CREATE INDEX dupe_ids_track_id ON dupe_ids (track_id)''')
+
+    # Left over from before the catalog
+    db.execute('''DROP TABLE IF EXISTS sync_hierarchy;''')
 
 
 def smart_str(oldstr, encoding='utf-8', strings_only=False, errors='strict'):
@@ -105,10 +134,206 @@ def smart_str(oldstr, encoding='utf-8', strings_only=False, errors='strict'):
         return unicode(oldstr).encode(encoding, errors)
 
 
+class LibrarySnapshot(object):
+    """Columnar copy of track properties for the entire library
+
+    Each requested field is stored as its own list, and all lists are
+    index-aligned - position `i` in every column refers to the same
+    track.  Missing values (`k.missing_value`) are stored as None, and
+    `location` is stored as a POSIX path string rather than an Alias.
+
+    Columns are accessed by field name::
+
+        snap = itunes.snapshot(['id', 'location'])
+        for track_id, path in zip(snap['id'], snap['location']):
+            ...
+    """
+
+    def __init__(self, columns):
+        """__init__ method.
+
+        :param columns: `dict` mapping field name to a `list` of values.
+                        All lists must be the same length.
+        """
+        lengths = set(len(v) for v in columns.values())
+        if len(lengths) > 1:
+            raise ValueError('Snapshot columns have differing lengths: %s' %
+                             ', '.join(['%s=%d' % (f, len(v))
+                                        for f, v in columns.items()]))
+
+        self.columns = columns
+        self.count = lengths.pop() if lengths else 0
+        super(LibrarySnapshot, self).__init__()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, field):
+        return field in self.columns
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+    @property
+    def fields(self):
+        """The names of the fields contained in this snapshot"""
+        return self.columns.keys()
+
+    def row(self, i):
+        """Returns a `dict` of every field for the track at index `i`"""
+        return dict((f, v[i]) for f, v in self.columns.items())
+
+    def rows(self):
+        """Iterates over the snapshot one track (as a `dict`) at a time"""
+        for i in xrange(self.count):
+            yield self.row(i)
+
+    def records(self, fields=None):
+        """Iterates over the snapshot one `models.Track` at a time
+
+        Far lighter than `rows()` on a big snapshot, but the tracks
+        can't take fields outside `models.TRACK_FIELDS`.
+
+        :param fields: (optional) sequence of the fields to include.
+                       Defaults to every field in the snapshot.
+        """
+        fields = tuple(fields or self.fields)
+        make = record_maker(fields)
+
+        for values in izip(*[self.columns[f] for f in fields]):
+            yield make(values)
+
+
+class BatchWriter(object):
+    """Collects changes to library tracks and sends them in bulk
+
+    Setting a property on one track is an Apple event, and so is
+    deleting one.  Instead, queue them up here with `set()` and
+    `delete()`, then `flush()`.  Sets are grouped by (property, value)
+    and each group is sent as a single event against a filter matching
+    all of its tracks by id, `BATCH_CHUNK_SIZE` tracks at a time.  Ten
+    thousand rating changes come to a few dozen events.
+
+    Tracks are identified by their `id` unless told otherwise - anything
+    else that's unique, such as `persistent_ID`, works too.
+
+    A track set more than once keeps the last value given.  Deletes are
+    sent after all the sets.
+    """
+
+    def __init__(self, itunes, key='id'):
+        """__init__ method.
+
+        :param itunes: `ITunesManager` connected to a live iTunes
+        :param key: (optional) `str` name of the track property that
+                    tracks are identified by
+        """
+        itunes._connect_to_itunes()
+        self.tracks = itunes.itunes.library_playlists[1].tracks
+        self.its = itunes.backend.its
+        self.key = key
+        self.sets = OrderedDict()
+        self.deletes = OrderedDict()
+        super(BatchWriter, self).__init__()
+
+    def __len__(self):
+        return len(self.sets) + len(self.deletes)
+
+    def set(self, track_id, prop, value):
+        """Queues setting `prop` to `value` on a track, by its key"""
+        self.sets[(track_id, prop)] = value
+
+    def delete(self, track_id):
+        """Queues removing a track from the library, by its key
+
+        Only the library entry goes - the file is left alone.
+        """
+        self.deletes[track_id] = True
+
+    def flush(self):
+        """Sends everything queued, and clears the queue
+
+        A track that can't be found is reported as failed.  If a bulk
+        event fails, its tracks are retried one at a time so that the
+        failure is pinned on the right ones - and a track a failed bulk
+        delete got to before failing counts as deleted.
+
+        :rtype: `dict` of (track id, property) to None for each change
+                that was made, or to the error for each that wasn't.
+                Deletes are keyed with a property of None.
+        """
+        groups = OrderedDict()
+        for ((track_id, prop), value) in self.sets.iteritems():
+            groups.setdefault((prop, value), []).append(track_id)
+
+        results = {}
+        for ((prop, value), ids) in groups.iteritems():
+            self._send(ids, prop, results,
+                       lambda ref, prop=prop, value=value:
+                            getattr(ref, prop).set(value,
+                                                   timeout=SNAPSHOT_TIMEOUT))
+
+        self._send(list(self.deletes), None, results,
+                   lambda ref: ref.delete(timeout=SNAPSHOT_TIMEOUT))
+
+        self.sets.clear()
+        self.deletes.clear()
+
+        return results
+
+    def _send(self, ids, prop, results, apply_to, retry=False):
+        """Applies one change to `ids`, a chunk at a time
+
+        :param apply_to: function taking a tracks reference and making
+                         the change to every track it matches
+        :param retry: (optional) `boolean`; True when retrying tracks of
+                      a bulk event that failed.  A failed bulk delete
+                      can still have removed some of its tracks, so a
+                      delete that finds nothing then counts as done.
+        """
+        for start in xrange(0, len(ids), BATCH_CHUNK_SIZE):
+            chunk = ids[start:start + BATCH_CHUNK_SIZE]
+            tests = [getattr(self.its, self.key) == track_id
+                     for track_id in chunk]
+            ref = self.tracks[tests[0].OR(*tests[1:]) if len(tests) > 1
+                              else tests[0]]
+
+            try:
+                # Ask which ones exist first, as the change itself
+                # doesn't say what it matched
+                found = set(getattr(ref, self.key).get(
+                                                    timeout=SNAPSHOT_TIMEOUT))
+                if found:
+                    apply_to(ref)
+
+            except CommandError as e:
+                if len(chunk) > 1:
+                    for track_id in chunk:
+                        self._send([track_id], prop, results, apply_to,
+                                   True)
+                else:
+                    results[(chunk[0], prop)] = e
+                continue
+
+            gone = retry and prop is None
+            for track_id in chunk:
+                results[(track_id, prop)] = (None if track_id in found or gone
+                                             else LookupError('No track with '
+                                                              '%s %s' %
+                                                              (self.key,
+                                                               track_id)))
+
+
 class ITunesManager(object):
     """Handles connecting to and sending operations to iTunes
+
+    Reads go through a `LibraryBackend`.  By default that's a live iTunes
+    via appscript, but anything read-only can be pointed at the library
+    XML instead (see `XMLLibraryBackend`), in which case `itunes` is
+    None and operations that change the library raise ValueError.
     """
     itunes = None
+    backend = None
     audio_types = ['AAC audio file',
                    'MPEG audio file',
                    'Protected AAC audio file',
@@ -119,15 +344,36 @@ class ITunesManager(object):
                   'QuickTime movie file',
                   ]
 
-    def __init__(self):
-        """__init__ method.  Takes no options."""
-        self._connect_to_itunes()
+    def __init__(self, backend=None):
+        """__init__ method.
+
+        :param backend: (optional) `LibraryBackend` to read the library
+                        through.  Defaults to `AppscriptBackend`.
+        """
+        if backend is None:
+            backend = AppscriptBackend()
+
+        self.backend = backend
+        self.itunes = backend.connect()
         super(ITunesManager, self).__init__()
 
+    @property
+    def read_only(self):
+        """True if the backend can't make changes to the library"""
+        return self.backend.read_only
+
     def _connect_to_itunes(self):
-        """Establishes a connection to iTunes.  You won't need to use this."""
+        """Establishes a connection to iTunes.  You won't need to use this.
+
+        Raises ValueError if the backend has no iTunes to connect to.
+        """
+        if not self.itunes:
+            self.itunes = self.backend.connect()
+
         if not self.itunes:
-            self.itunes = app('iTunes')
+            raise ValueError('This operation needs a live iTunes, but the '
+                             'library is being read from %s' %
+                             self.backend.__class__.__name__)
 
     def get_all_tracks(self):
         """Returns a list containing all the tracks in iTunes
@@ -138,59 +384,329 @@ class ITunesManager(object):
 
         return self.itunes.tracks()
 
-    def remove_dead_tracks(self):
+    def track_by_id(self, track_id):
+        """Returns a reference to a library track given its `id`
+
+        Building the reference doesn't send anything to iTunes, so this
+        is the cheap way to act on a track found in a snapshot.
+        """
+        self._connect_to_itunes()
+
+        return self.itunes.library_playlists[1].tracks.ID(track_id)
+
+    def track_by_persistent_id(self, persistent_id):
+        """Returns a reference to a library track given its persistent ID
+
+        Like `track_by_id()`, nothing is sent to iTunes until the
+        reference is used.  Persistent IDs survive iTunes restarting,
+        where ids might not.
+        """
+        self._connect_to_itunes()
+
+        tracks = self.itunes.library_playlists[1].tracks
+        return tracks[self.backend.its.persistent_ID == persistent_id].first
+
+    def set_track(self, persistent_id, field, value):
+        """Sets one property of one library track, in one Apple event
+
+        For changes to many tracks, a `batch()` is far fewer events.
+
+        :param persistent_id: `str` persistent ID of the track
+        :param field: `str` name of the property
+        :param value: what to set it to
+        """
+        getattr(self.track_by_persistent_id(persistent_id), field).set(
+                                            value, timeout=SNAPSHOT_TIMEOUT)
+
+    def batch(self, key='id'):
+        """Returns a `BatchWriter` for making changes to tracks in bulk
+
+        Raises ValueError if there's no live iTunes to change.
+
+        :param key: (optional) `str` track property that the writer
+                    identifies tracks by
+        """
+        return BatchWriter(self, key)
+
+    def snapshot(self, fields=SNAPSHOT_FIELDS):
+        """Fetches properties for every track in the library in bulk
+
+        Rather than asking for each property of each track (one Apple
+        event apiece), this asks the backend for one property of every
+        track at once, so against iTunes the number of events is the
+        number of fields.
+
+        The columns are fetched one after another, so don't modify the
+        library while taking a snapshot or they may not line up.  If
+        the track count changes part way through, ValueError is raised.
+
+        :param fields: (optional) iterable of field names to fetch, from
+                       `SNAPSHOT_FIELDS`.  Defaults to all of them.
+        :rtype: `LibrarySnapshot`
+        """
+        for f in fields:
+            if f not in SNAPSHOT_FIELDS:
+                raise ValueError('Unknown snapshot field: %s' % f)
+
+        return LibrarySnapshot(self.backend.fetch_many(fields))
+
+    def fetch_tracks(self, persistent_ids, fields=SNAPSHOT_FIELDS):
+        """Fetches properties for only the given tracks
+
+        Against iTunes this costs one Apple event per track, so it's for
+        picking up a handful of changed tracks rather than a snapshot.
+        Tracks that no longer exist are left out, and the result always
+        has a `persistent_ID` column to tell which ones are there.
+
+        :param persistent_ids: iterable of persistent ID `str`s
+        :param fields: (optional) iterable of field names to fetch, from
+                       `SNAPSHOT_FIELDS`.  Defaults to all of them.
+        :rtype: `LibrarySnapshot`
+        """
+        for f in fields:
+            if f not in SNAPSHOT_FIELDS:
+                raise ValueError('Unknown snapshot field: %s' % f)
+
+        return LibrarySnapshot(self.backend.fetch_by_persistent_id(
+                                                    persistent_ids, fields))
+
+    def remove_dead_tracks(self, dry_run=False):
         """Removes all dead items (entries without a corresponding file)
         from the iTunes library.
         
         DO NOT prompt for verification before removing tracks!  Does not
         attempt to remove from the file system, just removes the entry
         from the iTunes Library.
+
+        Dead tracks are found from a single bulk snapshot, and removed in
+        chunks through a `BatchWriter`.  With `dry_run`, or a read-only
+        backend, they're only reported.
+
+        :param dry_run: (optional) `boolean`; if True, don't remove
+                        anything
+        :rtype: `list` of a `dict` per dead track, holding its `id`,
+                `persistent_ID`, `artist`, `album` and `name`, plus
+                `deleted` (`boolean`) and `error` (`str` or None)
+        """
+        snap = self.snapshot(['id', 'persistent_ID', 'location', 'artist',
+                              'album', 'name'])
+
+        dead = []
+        for track in snap.rows():
+            if track['location'] is None:
+                del track['location']
+                track.update(deleted=False, error=None)
+                dead.append(track)
+
+        dry_run = dry_run or self.read_only
+        for track in dead:
+            sys.stderr.write('%s: %s - %s\n' % ('Dead' if dry_run else
+                                                'Deleting',
+                                                smart_str(track['artist']),
+                                                smart_str(track['name'])))
+
+        if dead and not dry_run:
+            writer = self.batch()
+            for track in dead:
+                writer.delete(track['id'])
+
+            results = writer.flush()
+            for track in dead:
+                error = results.get((track['id'], None))
+                track['deleted'] = error is None
+                track['error'] = str(error) if error is not None else None
+
+        if dry_run:
+            sys.stdout.write('Found %d dead tracks (%s, none deleted)\n' %
+                             (len(dead), 'read-only' if self.read_only
+                                         else 'dry run'))
+        else:
+            deleted = sum(1 for t in dead if t['deleted'])
+            sys.stdout.write('Found %d dead tracks, deleted %d\n' %
+                             (len(dead), deleted))
+
+        return dead
+
+    def playlist_snapshot(self, playlist=PLAYLIST_NAME,
+                          fields=SNAPSHOT_FIELDS):
+        """Fetches properties for every track in a user playlist in bulk
+
+        Like `snapshot()`, but for one playlist.  Needs a live iTunes.
+        Raises ValueError if the playlist doesn't exist.
+
+        :param playlist: (optional) `str` name of the playlist
+        :param fields: (optional) iterable of field names to fetch, from
+                       `SNAPSHOT_FIELDS`.  Defaults to all of them.
+        :rtype: `LibrarySnapshot`
         """
         self._connect_to_itunes()
-        count = 0
 
-        for t in self.get_all_tracks():
-            if t.location() == k.missing_value:
-                sys.stderr.write('Deleting %s - %s\n' % (smart_str(t.artist()),
-                                                         smart_str(t.name())))
-                t.delete()
-                count += 1
+        for f in fields:
+            if f not in SNAPSHOT_FIELDS:
+                raise ValueError('Unknown snapshot field: %s' % f)
 
-        sys.stdout.write('Found and deleted %d dead tracks\n' % count)
+        return LibrarySnapshot(self.backend.fetch_playlist(playlist, fields))
 
-    def get_tracks_from_playlist(self, playlist=PLAYLIST_NAME):
-        """Returns a list of all the tracks in a given playlist
-        
-        :param playlist: (optional) :string:name of playlist to use as
-                         source of files to delete
-        
-        """
 
-        if not self.itunes.exists(self.itunes.user_playlists[playlist]):
-            raise ValueError('Playlist %s does not exist.' % playlist)
+def setup_delete_journal(db):
+    """Creates the delete journal table if it doesn't already exist"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS delete_journal(
+            persistent_id TEXT PRIMARY KEY,
+            name TEXT,
+            path TEXT,
+            state INTEGER
+        )
+    ''')
+    db.commit()
+
+
+def _unlink(path):
+    """Thread pool worker - deletes a file, returning (path, error)
+
+    A file that's already gone counts as deleted.
+    """
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            return (path, e)
+
+    return (path, None)
 
-        sys.stdout.write('Obtaining playlist of files to kill...')
-        tracks = self.itunes.user_playlists[playlist].tracks()
-        track_ids = [t.persistent_ID() for t in tracks]
-        sys.stdout.write('done\n')
 
-        if len(tracks) <= 0:
-            sys.stdout.write('''Playlist '%s' is empty! Don't be silly.\n''' %
-                             playlist)
-            return []
+class DeleteJournal(object):
+    """Deletes tracks from disk and library, recording each step first
 
-        tracks_to_kill = []
+    Every track is written to the journal before anything is touched.
+    Then all the files are deleted, several at a time, and only once a
+    track's file is gone is its library entry removed - in bulk, through
+    a `BatchWriter`.  Each step is recorded as it's done, so `run()`
+    after a crash carries on where it stopped: files already gone are
+    skipped, and entries whose files were deleted are still removed.
+    A track whose file couldn't be deleted keeps its library entry.
+    """
+
+    def __init__(self, db):
+        """__init__ method.
+
+        :param db: `sqlite3.Db` handle to keep the journal in
+        """
+        self.db = db
+        setup_delete_journal(db)
+        super(DeleteJournal, self).__init__()
+
+    def unfinished(self):
+        """Returns the number of journaled tracks not yet deleted"""
+        return self.db.execute('''
+            SELECT COUNT(*) FROM delete_journal WHERE state IN (?, ?)
+        ''', (DELETE_PENDING, DELETE_UNLINKED)).fetchone()[0]
+
+    def tracks(self, state):
+        """Yields (persistent id, name, path) of tracks in a given state"""
+        for row in self.db.execute('''
+            SELECT persistent_id, name, path FROM delete_journal
+            WHERE state = ?
+        ''', (state,)):
+            yield tuple(row)
+
+    def record(self, tracks):
+        """Journals the intent to delete tracks, clearing finished ones
+
+        :param tracks: iterable of track `dict`s holding `persistent_ID`,
+                       `name` and `location`, as given by
+                       `LibrarySnapshot.rows()`
+        """
+        self.db.execute('''
+            DELETE FROM delete_journal WHERE state IN (?, ?)
+        ''', (DELETE_DONE, DELETE_FAILED))
+        self.db.executemany('''
+            INSERT OR REPLACE INTO delete_journal
+                (persistent_id, name, path, state)
+            VALUES (?, ?, ?, ?)
+        ''', [(t['persistent_ID'], t['name'], t['location'], DELETE_PENDING)
+              for t in tracks])
+        self.db.commit()
+
+    def run(self, itunes, workers=DELETE_WORKERS):
+        """Carries out everything in the journal that isn't done yet
+
+        :param itunes: `ITunesManager` connected to a live iTunes
+        :param workers: (optional) `int` number of files to delete at once
+        :rtype: `tuple` of (deleted, failed) counts
+        """
+        # Tracks whose files are already missing go straight through
+        pending = list(self.tracks(DELETE_PENDING))
+        self._set_state([(pid,) for (pid, _, path) in pending if not path],
+                        DELETE_UNLINKED)
+
+        # The same file can be in the library more than once
+        unlinked = {}
+        for (pid, _, path) in pending:
+            if path:
+                unlinked.setdefault(path, []).append(pid)
+
+        failed = 0
+        done = []
+        pool = ThreadPool(max(1, workers))
+
+        try:
+            for (n, (path, error)) in enumerate(pool.imap_unordered(
+                                                        _unlink, unlinked)):
+                sys.stdout.write('\rDeleted %d/%d files' % (n + 1,
+                                                            len(unlinked)))
+                if error is not None:
+                    sys.stderr.write('\nError deleting %s: %s\n' %
+                                     (path, error))
+                    self._set_state([(pid,) for pid in unlinked[path]],
+                                    DELETE_FAILED)
+                    failed += len(unlinked[path])
+                else:
+                    done.extend((pid,) for pid in unlinked[path])
+
+                if len(done) >= DELETE_COMMIT_EVERY:
+                    self._set_state(done, DELETE_UNLINKED)
+                    done = []
+        finally:
+            pool.close()
+            pool.join()
+            self._set_state(done, DELETE_UNLINKED)
+
+        # Only now do the library entries go
+        names = dict((pid, name) for (pid, name, _)
+                     in self.tracks(DELETE_UNLINKED))
+        writer = itunes.batch('persistent_ID')
+        for pid in names:
+            writer.delete(pid)
+
+        results = writer.flush() if names else {}
+        deleted = []
+        for (pid, name) in names.iteritems():
+            error = results.get((pid, None))
+            if error is None:
+                deleted.append((pid,))
+            elif isinstance(error, LookupError):
+                # Already gone from the library
+                deleted.append((pid,))
+            else:
+                sys.stderr.write('\nError deleting %s from iTunes '
+                                 'library: %s\n' % (smart_str(name), error))
+                failed += 1
+
+        self._set_state(deleted, DELETE_DONE)
+        sys.stdout.write('\n')
 
-        sys.stdout.write('Building list of tracks from playlist...')
-        for t in self.get_all_tracks():
-            if t.persistent_ID() in track_ids:
-                tracks_to_kill.append(t)
-        sys.stdout.write('done\n')
+        return (len(deleted), failed)
 
-        return tracks_to_kill
+    def _set_state(self, pids, state):
+        """Records a new state for a `list` of (persistent id,) tuples"""
+        self.db.executemany('''
+            UPDATE delete_journal SET state = %d WHERE persistent_id = ?
+        ''' % state, pids)
+        self.db.commit()
 
 
-def delete_tracks(tracks):
+def delete_tracks(itunes, tracks, db, workers=DELETE_WORKERS):
     """
     Deletes a list of tracks from iTunes, AS WELL AS the
     corresponding file.
@@ -200,36 +716,34 @@ def delete_tracks(tracks):
     Note that I don't prompt for verification before each file.  I make no
     warranty or guarantee that this won't completely destroy your entire
     library.  USE AT YOUR OWN RISK!
+
+    The deletion is journaled in `db` (see `DeleteJournal`), so if it's
+    interrupted, `DeleteJournal(db).run()` finishes it off.
     
-    :param tracks: :list: of iTunes tracks, NOT track IDs.  They
-                   will be deleted from disk and from the library. 
-    
+    :param itunes: `ITunesManager` connected to a live iTunes
+    :param tracks: :list: of track `dict`s holding `persistent_ID`,
+                   `name` and `location`, as given by
+                   `ITunesManager.playlist_snapshot()`.  They will be
+                   deleted from disk and from the library.
+    :param db: `sqlite3.Db` handle to journal the deletion in
+    :param workers: (optional) `int` number of files to delete at once
+    :rtype: `tuple` of (deleted, failed) counts
     """
 
     for t in tracks:
-        print t.name()
+        print smart_str(t['name'])
 
     print "\nThe above %d tracks will be deleted." % len(tracks)
     x = raw_input('Continue? [y/N] ')
 
-    if x.lower() == 'y':
-        for i, t in enumerate(tracks):
-            sys.stdout.write('\rProcessed %d/%d' % (i + 1, len(tracks)))
-
-            try:
-                if t.location() != k.missing_value:
-                    """If the location is missing, the file has
-                    already been deleted from disk.  So only try to
-                    remove a file if it actually exists.
-                    """
-                    os.unlink(t.location().path)
+    if x.lower() != 'y':
+        return (0, 0)
 
-                """Now delete the track from iTunes"""
-                t.delete()
-
-            except CommandError as e:
-                sys.stderr.write('\nError deleting %s from iTunes '
-                                 'library: %s\n' % (t.name(), str(e)))
+    journal = DeleteJournal(db)
+    journal.record(tracks)
+    (deleted, failed) = journal.run(itunes, workers)
 
-        sys.stdout.write('\nDone!\n')
+    sys.stdout.write('Done!  Deleted %d tracks, %d failed\n' %
+                     (deleted, failed))
 
+    return (deleted, failed)
@@ -0,0 +1,202 @@
+# ---*< jobs.py >*-------------------------------------------------------------
+# Checkpointed, resumable jobs
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Keeps the progress of long runs on disk, so they can be resumed
+
+Created on Oct 16, 2026
+
+A sync or a ratings run against a big library can take hours, and used
+to keep everything it had done in memory.  Kill it two hours in and the
+next run started from nothing.
+
+A `Job` is a named list of work items in the catalog DB, each pending,
+done or failed, plus a `phase` the caller uses to say how far it got
+(e.g. whether the scan finished).  Items are ticked off in memory - from
+any thread - and written out by `checkpoint()` at most every `interval`
+seconds, so a crash costs at most one interval of repeated work.
+
+When a job is created and an unfinished one of the same name and params
+is on disk, it's picked up where it left off (`resumed` is set).  An
+unfinished job with different params is thrown away.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import json
+import threading
+import time
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+
+# ---*< Initialization >*------------------------------------------------------
+"""Most seconds of progress that can be lost by default"""
+DEFAULT_CHECKPOINT_INTERVAL = 30
+
+"""States of a work item"""
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+UNCERTAIN = 'uncertain'
+
+# ---*< Code >*----------------------------------------------------------------
+def setup_jobs(db):
+    """Creates the job tables if they don't already exist"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS jobs(
+            name TEXT PRIMARY KEY,
+            params TEXT,
+            phase TEXT,
+            started REAL,
+            checkpointed REAL
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS job_items(
+            job TEXT,
+            item TEXT,
+            state TEXT,
+            data TEXT,
+            PRIMARY KEY (job, item)
+        )
+    ''')
+    db.commit()
+
+
+class Job(object):
+    """A resumable run, checkpointed to the DB
+
+    Only `done()`, `failed()` and `uncertain()` may be called from other
+    threads.  Everything else - and all DB access - stays on the thread
+    that created the job.
+    """
+
+    def __init__(self, db, name, params=None,
+                 interval=DEFAULT_CHECKPOINT_INTERVAL, restart=False):
+        """__init__ method.
+
+        :param db: `sqlite3.Db` handle to keep the job in
+        :param name: `str` naming the job.  One job of a name at a time.
+        :param params: (optional) JSON-able value describing the run.  A
+                       saved job is only resumed if its params match.
+        :param interval: (optional) most seconds between checkpoints
+        :param restart: (optional) `boolean`; if True, throw away any
+                        saved job of this name rather than resuming it
+        """
+        self.db = db
+        self.name = name
+        self.params = json.dumps(params, sort_keys=True)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.added = []
+        self.updates = {}
+        setup_jobs(db)
+
+        row = db.execute('''
+            SELECT params, phase FROM jobs WHERE name = ?
+        ''', (name,)).fetchone()
+
+        self.resumed = (row is not None and not restart and
+                        row[0] == self.params)
+
+        if self.resumed:
+            self.phase = row[1]
+        else:
+            self.phase = None
+            self.discard()
+            db.execute('''
+                INSERT INTO jobs (name, params, phase, started, checkpointed)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (name, self.params, None, time.time(), time.time()))
+            db.commit()
+
+        self.last_checkpoint = time.time()
+        super(Job, self).__init__()
+
+    def add(self, item, data=None):
+        """Adds a pending work item, unless it's already in the job
+
+        :param item: `str` key of the item, unique within the job
+        :param data: (optional) JSON-able value stored with it
+        """
+        self.added.append((self.name, item, PENDING, json.dumps(data)))
+
+    def done(self, item):
+        """Marks an item done.  Safe from any thread."""
+        with self.lock:
+            self.updates[item] = DONE
+
+    def failed(self, item):
+        """Marks an item failed.  Safe from any thread."""
+        with self.lock:
+            self.updates[item] = FAILED
+
+    def uncertain(self, item):
+        """Marks an item as maybe done - the caller has to check it
+        before trying again.  Safe from any thread."""
+        with self.lock:
+            self.updates[item] = UNCERTAIN
+
+    def set_phase(self, phase):
+        """Records how far the job has got, checkpointing straight away"""
+        self.phase = phase
+        self.checkpoint(force=True)
+
+    def checkpoint(self, force=False):
+        """Writes progress to the DB if `interval` has passed
+
+        :param force: (optional) `boolean`; if True, write it regardless
+        :rtype: `boolean` indicating whether a checkpoint was written
+        """
+        if not force and time.time() - self.last_checkpoint < self.interval:
+            return False
+
+        with self.lock:
+            updates = self.updates
+            self.updates = {}
+
+        added = self.added
+        self.added = []
+
+        try:
+            self.db.executemany('''
+                INSERT OR IGNORE INTO job_items (job, item, state, data)
+                VALUES (?, ?, ?, ?)
+            ''', added)
+            self.db.executemany('''
+                UPDATE job_items SET state = ? WHERE job = ? AND item = ?
+            ''', [(state, self.name, item)
+                  for (item, state) in updates.iteritems()])
+            self.db.execute('''
+                UPDATE jobs SET phase = ?, checkpointed = ? WHERE name = ?
+            ''', (self.phase, time.time(), self.name))
+            self.db.commit()
+
+        except:
+            self.db.rollback()
+            raise
+
+        self.last_checkpoint = time.time()
+        return True
+
+    def items(self, state=PENDING):
+        """Returns a `list` of (item, data) in the given state"""
+        self.checkpoint(force=True)
+
+        return [(row[0], json.loads(row[1])) for row in self.db.execute('''
+            SELECT item, data FROM job_items WHERE job = ? AND state = ?
+            ORDER BY rowid
+        ''', (self.name, state))]
+
+    def finish(self):
+        """Ends the job successfully.  Nothing is left to resume."""
+        self.discard()
+        self.db.commit()
+
+    def discard(self):
+        """Throws away the saved job, finished or not"""
+        self.db.execute('DELETE FROM jobs WHERE name = ?', (self.name,))
+        self.db.execute('DELETE FROM job_items WHERE job = ?', (self.name,))
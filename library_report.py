@@ -0,0 +1,97 @@
+#!/usr/bin/env python -u
+# ---*< library_report.py >*---------------------------------------------------
+# Reports on the library catalog as CSV or JSON
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Prints a report on the whole library, from the catalog
+
+Created on Oct 16, 2026
+
+One of:
+
+- `ratings`: how many tracks have each rating
+- `folders`: tracks, rated tracks, mean rating and dupes in each folder,
+  biggest first.  `--depth N` rolls folders up to their first N path
+  components, and `--top N` only lists the N biggest.
+- `dupes`: how many dupe groups there are of each size
+- `added`: rated and unrated tracks by when they were added, per
+  `--period`
+
+as CSV, or JSON with `--format json`.  Figures come from the catalog
+(see `analytics.py`), so iTunes isn't asked anything unless `--refresh`
+is given.  Needs NumPy.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import argparse
+import sys
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from analytics import (LibraryArrays, numpy, PERIODS, REPORT_COLUMNS,
+                       write_report)
+from catalog import DEFAULT_CATALOG_FILE, open_catalog
+from itunes import ITunesManager, XMLLibraryBackend
+
+# ---*< Initialization >*------------------------------------------------------
+
+# ---*< Code >*----------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reports on the library '
+                                     'catalog.')
+    parser.add_argument('report', choices=sorted(REPORT_COLUMNS),
+                        help='report to print')
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv',
+                        help='output format (default: %(default)s)')
+    parser.add_argument('--output', metavar='PATH',
+                        help='write the report here rather than to stdout')
+    parser.add_argument('--depth', type=int, metavar='N',
+                        help='for folders, path components to keep '
+                             '(default: the directory of each file)')
+    parser.add_argument('--top', type=int, metavar='N',
+                        help='for folders, only the N biggest')
+    parser.add_argument('--period', choices=sorted(PERIODS), default='year',
+                        help='for added, what to group by (default: '
+                             '%(default)s)')
+    parser.add_argument('--catalog', metavar='PATH',
+                        default=DEFAULT_CATALOG_FILE,
+                        help='catalog file to report on (default: '
+                             '%(default)s)')
+    parser.add_argument('--refresh', action='store_true',
+                        help='bring the catalog up to date from iTunes first')
+    parser.add_argument('--library-xml', metavar='PATH',
+                        help='with --refresh, read this iTunes Library.xml '
+                             'rather than asking iTunes')
+    args = parser.parse_args()#IGNORE:C0103
+
+    if numpy is None:
+        sys.exit('NumPy is needed for reports - pip install numpy')
+
+    catalog = open_catalog(args.catalog)#IGNORE:C0103
+    if args.refresh:
+        if args.library_xml:
+            itunes = ITunesManager(XMLLibraryBackend(args.library_xml))#IGNORE:C0103
+        else:
+            itunes = ITunesManager()#IGNORE:C0103
+        catalog.refresh(itunes)
+
+    arrays = LibraryArrays.load(catalog.db)#IGNORE:C0103
+
+    if args.report == 'ratings':
+        rows = arrays.ratings_report()#IGNORE:C0103
+    elif args.report == 'folders':
+        rows = arrays.folders_report(args.depth, args.top)#IGNORE:C0103
+    elif args.report == 'dupes':
+        rows = arrays.dupes_report()#IGNORE:C0103
+    else:
+        rows = arrays.added_report(args.period)#IGNORE:C0103
+
+    out = open(args.output, 'wb') if args.output else sys.stdout#IGNORE:C0103
+    try:
+        write_report(rows, REPORT_COLUMNS[args.report], out, args.format)
+    finally:
+        if args.output:
+            out.close()
@@ -0,0 +1,117 @@
+# ---*< library_xml.py >*------------------------------------------------------
+# Streaming reader for iTunes Library.xml
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Reads tracks out of an iTunes Library.xml one at a time
+
+Created on Oct 16, 2026
+
+A big library XML runs to hundreds of MB, and `plistlib` builds the
+whole thing in memory before handing anything back.  This walks the
+file with `iterparse` instead, yielding each track as soon as its
+`<dict>` closes and then throwing the parsed elements away, so memory
+use stays flat no matter how big the library is.
+
+Only the `Tracks` section is read.  Parsing stops as soon as it ends,
+so the playlists at the bottom of the file aren't even looked at.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import base64
+from datetime import datetime
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+
+# ---*< Initialization >*------------------------------------------------------
+"""Format of <date> values in the XML.  They're always UTC."""
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# ---*< Code >*----------------------------------------------------------------
+def plist_value(elem):
+    """Converts a simple plist value element into its Python equivalent
+
+    Only handles the scalar types that appear in a track dict.
+    """
+    tag = elem.tag
+    text = elem.text or ''
+
+    if tag == 'string':
+        return unicode(text)
+    elif tag == 'integer':
+        return int(text)
+    elif tag == 'date':
+        return datetime.strptime(text, DATE_FORMAT)
+    elif tag == 'true':
+        return True
+    elif tag == 'false':
+        return False
+    elif tag == 'real':
+        return float(text)
+    elif tag == 'data':
+        return base64.b64decode(text)
+
+    raise ValueError('Unexpected plist element <%s> in track' % tag)
+
+
+def track_from_element(elem):
+    """Builds a `dict` of XML keys to values from a track's <dict>"""
+    track = {}
+    key = None
+
+    for child in elem:
+        if child.tag == 'key':
+            key = child.text
+        else:
+            track[key] = plist_value(child)
+
+    return track
+
+
+def iter_tracks(xml_file):
+    """Yields each track in the library XML as a `dict`, one at a time
+
+    Keys are the ones used in the XML ('Track ID', 'Location', etc).
+
+    :param xml_file: `str` path of (or open file for) the library XML
+    """
+    depth = 0
+    last_key = None
+    tracks_elem = None
+    context = ElementTree.iterparse(xml_file, events=('start', 'end'))
+
+    for event, elem in context:
+        if event == 'start':
+            depth += 1
+
+            # <plist> is 1, the top-level <dict> 2, so the value of the
+            # 'Tracks' key is the <dict> that starts at 3
+            if depth == 3 and elem.tag == 'dict' and last_key == 'Tracks':
+                tracks_elem = elem
+
+            continue
+
+        depth -= 1
+
+        if tracks_elem is None:
+            if depth == 2 and elem.tag == 'key':
+                last_key = elem.text
+            continue
+
+        if elem is tracks_elem:
+            # Done with the tracks - nothing else is of interest
+            break
+
+        if depth == 3 and elem.tag == 'dict':
+            yield track_from_element(elem)
+
+            # Drop everything parsed so far.  Only the tracks <dict> is
+            # holding on to anything, as the root was never kept.
+            tracks_elem.clear()
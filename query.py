@@ -0,0 +1,160 @@
+# ---*< query.py >*------------------------------------------------------------
+# Queries over the library catalog
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Picks tracks out of the library catalog, without asking iTunes
+
+Created on Oct 16, 2026
+
+Filtering the library in iTunes means either a smart playlist kept up by
+hand or an Apple event per track.  The catalog already has every track's
+rating, date added, path and dupe hash, so a `TrackQuery` asks SQLite
+instead:
+
+    TrackQuery(max_rating=20, under='/music/Incoming').tracks(db)
+
+Each predicate is a range or equality test on an indexed column (see
+`catalog.CATALOG_INDEXES`), and a path prefix is turned into a range on
+the path index rather than a LIKE, which SQLite can't index.  All the
+predicates given must hold.  Tracks come back as `models.Track`s that
+read like the rows of `LibrarySnapshot.rows()`, so they go straight into
+`delete_tracks()` and the other bulk operations.
+
+The answer is only as current as the catalog - `Catalog.refresh()` it
+first if iTunes might have changed since.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import os
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from catalog import COLUMN_NAMES, setup_catalog
+from models import record_maker
+
+# ---*< Initialization >*------------------------------------------------------
+"""iTunes ratings run 0-100, so a star is worth"""
+RATING_PER_STAR = 20
+
+"""Fields returned unless asked for others - enough for `delete_tracks()`
+and for showing the tracks to someone"""
+QUERY_FIELDS = ('persistent_ID', 'id', 'name', 'artist', 'location',
+                'rating', 'date_added')
+
+# ---*< Code >*----------------------------------------------------------------
+def prefix_range(prefix):
+    """Returns (low, high) bounding every string starting with `prefix`
+
+    `low <= s < high` holds for exactly those strings, and SQLite can
+    answer it from an index where it can't a LIKE.
+    """
+    return (prefix, prefix[:-1] + unichr(ord(prefix[-1]) + 1))
+
+
+class TrackQuery(object):
+    """A set of conditions on catalogued tracks, all of which must hold"""
+
+    def __init__(self, min_rating=None, max_rating=None, added_after=None,
+                 added_before=None, under=None, missing=None, dupes=None):
+        """__init__ method.  Conditions left as None aren't checked.
+
+        :param min_rating: (optional) `int` lowest rating, 0-100
+        :param max_rating: (optional) `int` highest rating, 0-100
+        :param added_after: (optional) `datetime`; only tracks added at
+                            or after it
+        :param added_before: (optional) `datetime`; only tracks added
+                             before it
+        :param under: (optional) `string` of a directory; only tracks
+                      whose file is somewhere below it
+        :param missing: (optional) `boolean`; True for only tracks with
+                        no location, False for only those with one
+        :param dupes: (optional) `boolean`; True for only tracks sharing
+                      a dupe hash with another, False for only those
+                      that don't
+        """
+        if under is not None:
+            if not isinstance(under, unicode):
+                under = unicode(under)
+            under = os.path.join(os.path.abspath(under), '')
+
+        self.min_rating = min_rating
+        self.max_rating = max_rating
+        self.added_after = added_after
+        self.added_before = added_before
+        self.under = under
+        self.missing = missing
+        self.dupes = dupes
+        super(TrackQuery, self).__init__()
+
+    def where(self):
+        """Returns (SQL `WHERE` clause, params), the clause '' if empty"""
+        terms = []
+        params = []
+
+        if self.min_rating is not None:
+            terms.append('rating >= ?')
+            params.append(self.min_rating)
+        if self.max_rating is not None:
+            terms.append('rating <= ?')
+            params.append(self.max_rating)
+        if self.added_after is not None:
+            terms.append('date_added >= ?')
+            params.append(self.added_after)
+        if self.added_before is not None:
+            terms.append('date_added < ?')
+            params.append(self.added_before)
+        if self.under is not None:
+            terms.append('path >= ? AND path < ?')
+            params.extend(prefix_range(self.under))
+        if self.missing is not None:
+            terms.append('path IS NULL' if self.missing else
+                         'path IS NOT NULL')
+        if self.dupes is not None:
+            terms.append('hash %s (SELECT hash FROM catalog GROUP BY hash '
+                         'HAVING COUNT(*) > 1)' %
+                         ('IN' if self.dupes else 'NOT IN'))
+
+        if not terms:
+            return ('', params)
+
+        return ('WHERE ' + ' AND '.join(terms), params)
+
+    def sql(self, fields=QUERY_FIELDS):
+        """Returns (SQL, params) selecting `fields` of matching tracks"""
+        (where, params) = self.where()
+
+        return ('SELECT %s FROM catalog %s' %
+                (', '.join([COLUMN_NAMES[f] for f in fields]), where), params)
+
+    def tracks(self, db, fields=QUERY_FIELDS):
+        """Returns a `list` of matching tracks as `models.Track`s
+
+        :param db: `sqlite3.Db` handle holding the catalog
+        :param fields: (optional) fields to fetch, from
+                       `catalog.COLUMN_NAMES`
+        """
+        setup_catalog(db)
+        (sql, params) = self.sql(fields)
+        make = record_maker(fields)
+
+        return [make(row) for row in db.execute(sql, params)]
+
+    def count(self, db):
+        """Returns the number of matching tracks"""
+        setup_catalog(db)
+        (where, params) = self.where()
+
+        return db.execute('SELECT COUNT(*) FROM catalog %s' % where,
+                          params).fetchone()[0]
+
+    def plan(self, db, fields=QUERY_FIELDS):
+        """Returns SQLite's query plan as a `list` of lines, to check
+        which indexes it uses"""
+        setup_catalog(db)
+        (sql, params) = self.sql(fields)
+
+        return [row[-1] for row in db.execute('EXPLAIN QUERY PLAN ' + sql,
+                                              params)]
@@ -0,0 +1,166 @@
+#!/usr/bin/env python -u
+# ---*< query_catalog.py >*----------------------------------------------------
+# Lists or deletes tracks picked out of the library catalog
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Finds tracks by rating, date added, location and dupes, from the catalog
+
+Created on Oct 16, 2026
+
+Answers come from the catalog (see `query.TrackQuery`), so they take
+milliseconds and iTunes isn't asked anything - unless `--refresh` or
+`--delete` is given, which bring the catalog up to date first.
+
+    query_catalog.py --rating 1 --under /music/Incoming --delete
+
+does what the 'Files to kill' smart playlist and
+`remove_tracks_in_playlist.py` do, without the playlist.  Ratings are in
+stars, so `--min-rating 3.5` is three and a half stars or better.
+Tracks picked for deletion are read again from iTunes just before they
+go, so the files deleted are the ones the library points at then.
+`--paths` prints just the locations, one per line, to pipe elsewhere.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import argparse
+from datetime import datetime
+import sys
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from catalog import DEFAULT_CATALOG_FILE, open_catalog
+from itunes import (DELETE_WORKERS, DeleteJournal, delete_tracks,
+                    ITunesManager, smart_str, XMLLibraryBackend)
+from query import RATING_PER_STAR, TrackQuery
+
+# ---*< Initialization >*------------------------------------------------------
+
+# ---*< Code >*----------------------------------------------------------------
+def stars(value):
+    """argparse type - a number of stars, as an iTunes rating"""
+    rating = int(round(float(value) * RATING_PER_STAR))
+    if not 0 <= rating <= 100:
+        raise argparse.ArgumentTypeError('ratings are 0 to 5 stars')
+
+    return rating
+
+
+def date(value):
+    """argparse type - a YYYY-MM-DD date"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError('dates are YYYY-MM-DD')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Lists, or deletes, tracks '
+                                     'in the library catalog matching every '
+                                     'condition given.')
+    parser.add_argument('--rating', type=stars, metavar='STARS',
+                        help='exactly this rating')
+    parser.add_argument('--min-rating', type=stars, metavar='STARS',
+                        help='at least this rating')
+    parser.add_argument('--max-rating', type=stars, metavar='STARS',
+                        help='at most this rating (unrated is 0)')
+    parser.add_argument('--added-after', type=date, metavar='YYYY-MM-DD',
+                        help='added on or after this date')
+    parser.add_argument('--added-before', type=date, metavar='YYYY-MM-DD',
+                        help='added before this date')
+    parser.add_argument('--under', metavar='DIR',
+                        help='file is somewhere below this directory')
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument('--missing', action='store_const', const=True,
+                       help='has no file')
+    where.add_argument('--present', action='store_const', dest='missing',
+                       const=False, help='has a file')
+    dupes = parser.add_mutually_exclusive_group()
+    dupes.add_argument('--dupes', action='store_const', const=True,
+                       help='shares a dupe hash with another track')
+    dupes.add_argument('--unique', action='store_const', dest='dupes',
+                       const=False, help="doesn't share a dupe hash")
+    parser.add_argument('--catalog', metavar='PATH',
+                        default=DEFAULT_CATALOG_FILE,
+                        help='catalog file to query (default: %(default)s)')
+    parser.add_argument('--refresh', action='store_true',
+                        help='bring the catalog up to date from iTunes first')
+    parser.add_argument('--library-xml', metavar='PATH',
+                        help='with --refresh, read this iTunes Library.xml '
+                             'rather than asking iTunes')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--count', action='store_true',
+                        help='only print how many tracks match')
+    output.add_argument('--paths', action='store_true',
+                        help='only print the locations of matching tracks')
+    output.add_argument('--delete', action='store_true',
+                        help='delete matching tracks from disk and the '
+                             'library, after asking')
+    parser.add_argument('--workers', type=int, default=DELETE_WORKERS,
+                        help='with --delete, files to delete at once '
+                             '(default: %(default)s)')
+    args = parser.parse_args()#IGNORE:C0103
+
+    if args.rating is not None:
+        if args.min_rating is not None or args.max_rating is not None:
+            parser.error("--rating can't be used with --min-rating or "
+                         '--max-rating')
+        args.min_rating = args.max_rating = args.rating
+
+    if args.delete and args.library_xml:
+        parser.error("--delete needs iTunes, so can't use --library-xml")
+
+    catalog = open_catalog(args.catalog)#IGNORE:C0103
+
+    itunes = None#IGNORE:C0103
+    if args.delete or args.refresh:
+        if args.library_xml:
+            itunes = ITunesManager(XMLLibraryBackend(args.library_xml))#IGNORE:C0103
+        else:
+            itunes = ITunesManager()#IGNORE:C0103
+        # Never delete on the strength of a stale catalog
+        catalog.refresh(itunes)
+
+    query = TrackQuery(args.min_rating, args.max_rating,#IGNORE:C0103
+                       args.added_after, args.added_before, args.under,
+                       args.missing, args.dupes)
+
+    if args.count:
+        print query.count(catalog.db)
+        sys.exit(0)
+
+    tracks = query.tracks(catalog.db)#IGNORE:C0103
+
+    if args.delete:
+        journal = DeleteJournal(catalog.db)#IGNORE:C0103
+        if journal.unfinished():
+            print ('Finishing %d deletions left over from an interrupted '
+                   'run' % journal.unfinished())
+            journal.run(itunes, args.workers)
+
+        # Journal what iTunes says now, not the catalog, so the file
+        # deleted is always the one the library entry points at
+        if tracks:
+            tracks = list(itunes.fetch_tracks(#IGNORE:C0103
+                            [t.persistent_ID for t in tracks],
+                            ('persistent_ID', 'name', 'location')).rows())
+
+        if tracks:
+            delete_tracks(itunes, tracks, catalog.db, args.workers)
+        else:
+            print 'No tracks match.'
+
+    elif args.paths:
+        for t in tracks:
+            if t.location:
+                print smart_str(t.location)
+
+    else:
+        for t in tracks:
+            print '%s\t%s\t%s\t%s - %s\t%s' % (
+                    t.persistent_ID, '%g' % (t.rating / float(RATING_PER_STAR)),
+                    t.date_added, smart_str(t.artist), smart_str(t.name),
+                    smart_str(t.location or '(missing)'))
+        sys.stderr.write('%d tracks\n' % len(tracks))
@@ -0,0 +1,352 @@
+#!/usr/bin/env python -u
+# ---*< relocate_tracks.py >*--------------------------------------------------
+# Points library tracks at files that have been moved
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Moves library entries to follow files that have moved on disk
+
+Created on Oct 16, 2026
+
+Move a few thousand files around and iTunes loses track of all of them.
+Re-adding them makes new entries with no ratings, play counts or date
+added, and `apply_ratings_on_dupes.py` can only bring some of that
+back.  This instead sets the location of each existing entry to the
+file's new home, so the entry keeps everything.
+
+Tell it where things went with any number of `--move OLD NEW` rules, or
+a file of tab-separated `old<TAB>new` lines (`--mappings`).  Either can
+name a single file or a whole directory - everything below a directory
+goes with it, and the most specific rule wins.  The rules go into a
+trie of path components, so planning is one walk down the trie per
+track, however many rules there are.
+
+Old locations come from the library catalog, which remembers where
+each track's file was last seen (iTunes itself only reports moved files
+as missing), refreshes included.  `--library-xml` reads them from the
+library XML instead, which keeps them too.
+
+The plan is saved in the catalog DB and each track is ticked off as it's
+done, so an interrupted run picks up where it left off with `--resume`.
+`--dry-run` only prints a plan, and never touches the saved one.
+Every new location is checked to exist before iTunes is asked to use
+it.  iTunes can only set one location per Apple event, so this is one
+event per track - but no adds, and no metadata lost.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import argparse
+import os
+import sys
+import time
+
+# ---*< Third-party imports >*-------------------------------------------------
+try:
+    from mactypes import File #@UnresolvedImport
+except ImportError:
+    # Not on a Mac - only a dry run is possible, or a run against the
+    # simulator (see `simulator`), which takes plain paths
+    def File(path):
+        return path
+
+# ---*< Local imports >*-------------------------------------------------------
+from catalog import Catalog, DEFAULT_CATALOG_FILE, open_catalog
+from itunes import CommandError, ITunesManager, XMLLibraryBackend
+
+# ---*< Initialization >*------------------------------------------------------
+"""Relocations done between commits of the plan's progress"""
+COMMIT_EVERY = 100
+
+"""States of a planned relocation"""
+PENDING = 0
+DONE = 1
+FAILED = 2
+
+# ---*< Code >*----------------------------------------------------------------
+def split_path(path):
+    """Splits an absolute path into its components"""
+    return [c for c in os.path.normpath(path).split(os.sep) if c]
+
+
+class PathTrie(object):
+    """Maps path prefixes to replacements, one path component per level"""
+
+    def __init__(self):
+        """__init__ method.  Takes no options."""
+        self.root = ({}, [None])
+        self.count = 0
+        super(PathTrie, self).__init__()
+
+    def __len__(self):
+        return self.count
+
+    def add(self, old, new):
+        """Adds a rule moving `old` (a file or directory) to `new`"""
+        node = self.root
+        for c in split_path(old):
+            node = node[0].setdefault(c, ({}, [None]))
+
+        if node is self.root:
+            raise ValueError('Cannot relocate the root directory')
+
+        if node[1][0] is None:
+            self.count += 1
+        node[1][0] = os.path.normpath(new)
+
+    def relocate(self, path):
+        """Returns where `path` has moved to, or None if no rule covers it
+
+        The deepest matching rule is used.
+        """
+        parts = split_path(path)
+        node = self.root
+        best = None
+
+        for (depth, c) in enumerate(parts):
+            node = node[0].get(c)
+            if node is None:
+                break
+            if node[1][0] is not None:
+                best = (depth + 1, node[1][0])
+
+        if best is None:
+            return None
+
+        return os.path.join(best[1], *parts[best[0]:])
+
+
+def read_mappings(mapping_file, trie):
+    """Adds each `old<TAB>new` line of a file to `trie`
+
+    Blank lines and lines starting with # are skipped.
+    """
+    with open(mapping_file) as f:
+        for (n, line) in enumerate(f):
+            line = line.decode('utf-8').rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+
+            try:
+                (old, new) = line.split('\t')
+            except ValueError:
+                raise ValueError('%s line %d: expected old<TAB>new' %
+                                 (mapping_file, n + 1))
+
+            trie.add(old, new)
+
+
+def work_out(tracks, trie):
+    """Returns (persistent id, old path, new path) of every track a rule
+    moves, without saving anything
+
+    :param tracks: iterable of track `dict`s with `persistent_ID` and
+                   `location`, as given by `Catalog.rows()`
+    :param trie: `PathTrie` of relocation rules
+    """
+    moves = []
+    for t in tracks:
+        if not t['location']:
+            continue
+
+        new = trie.relocate(t['location'])
+        if new is not None and new != t['location']:
+            moves.append((t['persistent_ID'], t['location'], new))
+
+    return moves
+
+
+def setup_relocations(db):
+    """Creates the relocation plan table if it doesn't already exist"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS relocations(
+            persistent_id TEXT PRIMARY KEY,
+            old_path TEXT,
+            new_path TEXT,
+            state INTEGER
+        )
+    ''')
+    db.commit()
+
+
+class Relocator(object):
+    """Plans and carries out a relocation, saving progress as it goes"""
+
+    def __init__(self, db):
+        """__init__ method.
+
+        :param db: `sqlite3.Db` handle holding the library catalog
+        """
+        self.db = db
+        setup_relocations(db)
+        super(Relocator, self).__init__()
+
+    def pending(self):
+        """Returns the number of relocations not yet done"""
+        return self.db.execute('''
+            SELECT COUNT(*) FROM relocations WHERE state = ?
+        ''', (PENDING,)).fetchone()[0]
+
+    def plan(self, tracks, trie):
+        """Works out every track's new location, replacing any old plan
+
+        :param tracks: iterable of track `dict`s with `persistent_ID` and
+                       `location`, as given by `Catalog.rows()`
+        :param trie: `PathTrie` of relocation rules
+        :rtype: `int` number of tracks to relocate
+        """
+        planned = [(pid, old, new, PENDING)
+                   for (pid, old, new) in work_out(tracks, trie)]
+
+        self.db.execute('DELETE FROM relocations')
+        self.db.executemany('''
+            INSERT INTO relocations (persistent_id, old_path, new_path, state)
+            VALUES (?, ?, ?, ?)
+        ''', planned)
+        self.db.commit()
+
+        return len(planned)
+
+    def planned(self, state=PENDING):
+        """Yields (persistent id, old path, new path) in the given state"""
+        for row in self.db.execute('''
+            SELECT persistent_id, old_path, new_path FROM relocations
+            WHERE state = ? ORDER BY new_path
+        ''', (state,)):
+            yield tuple(row)
+
+    def run(self, tunes, check=True, report=None):
+        """Relocates every pending track in iTunes
+
+        Progress is committed every `COMMIT_EVERY` tracks.  The catalog
+        is updated along with it, so it knows the new locations without
+        a full refresh.
+
+        :param tunes: `ITunesManager` connected to a live iTunes
+        :param check: (optional) `boolean`; if True, fail any track
+                      whose new file doesn't exist rather than asking
+                      iTunes to point at it
+        :param report: (optional) function called with a progress line
+                       after each track
+        :rtype: `tuple` of (relocated, failed) counts
+        """
+        work = list(self.planned())
+        start = time.time()
+        done = failed = 0
+
+        try:
+            for (i, (pid, old, new)) in enumerate(work):
+                state = DONE
+                if check and not os.path.exists(new):
+                    sys.stderr.write('\nNot found, skipping: %s\n' % new)
+                    state = FAILED
+                else:
+                    try:
+                        tunes.set_track(pid, 'location', File(new))
+                    except CommandError as e:
+                        sys.stderr.write('\nError relocating %s: %s\n' %
+                                         (old, e))
+                        state = FAILED
+
+                self.db.execute('''
+                    UPDATE relocations SET state = ? WHERE persistent_id = ?
+                ''', (state, pid))
+
+                if state == DONE:
+                    self.db.execute('''
+                        UPDATE catalog SET path = ?, last_path = ?
+                        WHERE persistent_id = ?
+                    ''', (new, new, pid))
+                    done += 1
+                else:
+                    failed += 1
+
+                if (i + 1) % COMMIT_EVERY == 0:
+                    self.db.commit()
+
+                if report:
+                    elapsed = time.time() - start
+                    report('[Relocated %d/%d  Failed %d  %.1f tracks/sec]' %
+                           (done, len(work), failed,
+                            (i + 1) / elapsed if elapsed else 0))
+        finally:
+            self.db.commit()
+
+        return (done, failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Points library tracks at '
+                                     'files that have been moved.')
+    parser.add_argument('--move', nargs=2, action='append', default=[],
+                        metavar=('OLD', 'NEW'),
+                        help='relocate the file or directory OLD (and '
+                             'everything below it) to NEW.  Repeatable.')
+    parser.add_argument('--mappings', metavar='PATH',
+                        help='file of old<TAB>new rules, one per line')
+    parser.add_argument('--resume', action='store_true',
+                        help='carry on with the last plan rather than '
+                             'making a new one')
+    parser.add_argument('--library-xml', metavar='PATH',
+                        help='take old locations from this iTunes '
+                             'Library.xml rather than the catalog')
+    parser.add_argument('--catalog', metavar='PATH',
+                        default=DEFAULT_CATALOG_FILE,
+                        help='library catalog file (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only show the plan')
+    parser.add_argument('--no-check', action='store_true',
+                        help="don't check that new locations exist")
+    args = parser.parse_args()#IGNORE:C0103
+
+    db = open_catalog(args.catalog).db#IGNORE:C0103
+    relocator = Relocator(db)#IGNORE:C0103
+
+    if not args.resume:
+        trie = PathTrie()#IGNORE:C0103
+        for (old, new) in args.move:
+            trie.add(old.decode('utf-8'), new.decode('utf-8'))
+        if args.mappings:
+            read_mappings(args.mappings, trie)
+
+        if not trie:
+            parser.error('nothing to do - give --move, --mappings or '
+                         '--resume')
+
+        if args.library_xml:
+            backend = XMLLibraryBackend(args.library_xml,#IGNORE:C0103
+                                        check_locations=False)
+            tracks = backend.iter_rows(['persistent_ID', 'location'])#IGNORE:C0103
+        else:
+            tracks = Catalog(db).last_seen()#IGNORE:C0103
+
+        start = time.time()#IGNORE:C0103
+        if args.dry_run:
+            # Leaves any saved plan as it is
+            moves = sorted(work_out(tracks, trie),#IGNORE:C0103
+                           key=lambda m: m[2])
+            count = len(moves)#IGNORE:C0103
+        else:
+            unfinished = relocator.pending()#IGNORE:C0103
+            if unfinished:
+                print ('Discarding %d unfinished relocations from the last '
+                       'plan' % unfinished)
+            count = relocator.plan(tracks, trie)#IGNORE:C0103
+        print ('Planned %d relocations from %d rules in %.2f seconds' %
+               (count, len(trie), time.time() - start))
+    elif args.dry_run:
+        moves = list(relocator.planned())#IGNORE:C0103
+
+    if args.dry_run:
+        for (_, old, new) in moves:
+            print '%s\n  -> %s' % (old.encode('utf-8'), new.encode('utf-8'))
+        sys.exit(0)
+
+    if not relocator.pending():
+        print 'Nothing to relocate.'
+        sys.exit(0)
+
+    itunes = ITunesManager()#IGNORE:C0103
+    (done, failed) = relocator.run(itunes, not args.no_check,#IGNORE:C0103
+                                   lambda s: sys.stdout.write(s + '\r'))
+    print '\nRelocated %d tracks, %d failed' % (done, failed)
@@ -21,15 +21,43 @@ track object.
 
 """
 # ---*< Standard imports >*----------------------------------------------------
+import argparse
+import json
 
 # ---*< Third-party imports >*-------------------------------------------------
 
 # ---*< Local imports >*-------------------------------------------------------
-from itunes import ITunesManager
+from itunes import ITunesManager, XMLLibraryBackend
 
 # ---*< Initialization >*------------------------------------------------------
 
 # ---*< Code >*----------------------------------------------------------------
 if __name__ == "__main__":
-    itunes = ITunesManager()#IGNORE:C0103
-    itunes.remove_dead_tracks()
+    parser = argparse.ArgumentParser(description='Removes dead tracks from '
+                                     'the iTunes library.')
+    parser.add_argument('--library-xml', metavar='PATH',
+                        help='only report dead tracks found in this iTunes '
+                             'Library.xml, without changing anything')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report dead tracks, without removing them')
+    parser.add_argument('--report', metavar='PATH',
+                        help='write a JSON report of the dead tracks, and '
+                             'what happened to each, to PATH')
+    args = parser.parse_args()#IGNORE:C0103
+
+    if args.library_xml:
+        itunes = ITunesManager(XMLLibraryBackend(args.library_xml))#IGNORE:C0103
+    else:
+        itunes = ITunesManager()#IGNORE:C0103
+    dead = itunes.remove_dead_tracks(args.dry_run)#IGNORE:C0103
+
+    if args.report:
+        report = {'dry_run': args.dry_run or itunes.read_only,#IGNORE:C0103
+                  'dead': len(dead),
+                  'deleted': sum(1 for t in dead if t['deleted']),
+                  'failed': sum(1 for t in dead if t['error']),
+                  'tracks': dead,
+                  }
+        with open(args.report, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+            out.write('\n')
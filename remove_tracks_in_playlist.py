@@ -15,18 +15,26 @@ At first, I was going to iterate over the whole library and just grab
 all the tracks with one star.  But that's slow on large libraries, so I
 decided to keep that logic in iTunes by creating a smart playlist named
 'Files to kill' that contains only files with one star.  Then I just
-grab all the tracks in that playlist.  Keeps the script faster, although
-it still needs to grab the entire library once to get access to the root
-track object.
+grab all the tracks in that playlist.  Only the playlist's tracks are
+fetched, in bulk, so the size of the library doesn't matter.
+
+What's about to be deleted is journaled in the catalog DB first.  Files
+are deleted several at a time, then their library entries in bulk.  If
+a run is interrupted, the next one finishes it off before doing anything
+else.
+
+`query_catalog.py --rating 1 --delete` does the same from the library
+catalog, with no playlist to keep up.
 
 """
 # ---*< Standard imports >*----------------------------------------------------
-import sys
+import argparse
 
 # ---*< Third-party imports >*-------------------------------------------------
 
 # ---*< Local imports >*-------------------------------------------------------
-from itunes import ITunesManager, delete_tracks
+from catalog import DEFAULT_CATALOG_FILE, open_catalog
+from itunes import DELETE_WORKERS, DeleteJournal, delete_tracks, ITunesManager
 
 # ---*< Initialization >*------------------------------------------------------
 """The name of the playlist of files to kill.  Any type of playlist."""
@@ -34,11 +42,31 @@ PLAYLIST_NAME = 'Files to kill'
 
 # ---*< Code >*----------------------------------------------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Deletes every track in a '
+                                     'playlist from disk and the library.')
+    parser.add_argument('playlist', nargs='?', default=PLAYLIST_NAME,
+                        help='playlist to delete (default: %(default)s)')
+    parser.add_argument('--catalog', metavar='PATH',
+                        default=DEFAULT_CATALOG_FILE,
+                        help='catalog file to journal the deletion in '
+                             '(default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=DELETE_WORKERS,
+                        help='files to delete at once (default: '
+                             '%(default)s)')
+    args = parser.parse_args()#IGNORE:C0103
+
     itunes = ITunesManager()#IGNORE:C0103
+    db = open_catalog(args.catalog).db#IGNORE:C0103
 
-    target_playlist = (sys.argv[1] if len(sys.argv) > 1#IGNORE:C0103
-                       else PLAYLIST_NAME)
+    journal = DeleteJournal(db)#IGNORE:C0103
+    if journal.unfinished():
+        print ('Finishing %d deletions left over from an interrupted run' %
+               journal.unfinished())
+        journal.run(itunes, args.workers)
 
-    dyingtracks = itunes.get_tracks_from_playlist(target_playlist)#IGNORE:C0103
+    dyingtracks = itunes.playlist_snapshot(#IGNORE:C0103
+                        args.playlist, ['persistent_ID', 'name', 'location'])
     if len(dyingtracks) > 0:
-        delete_tracks(dyingtracks)
+        delete_tracks(itunes, list(dyingtracks.rows()), db, args.workers)
+    else:
+        print "Playlist '%s' is empty! Don't be silly." % args.playlist
@@ -0,0 +1,341 @@
+# ---*< scanner.py >*----------------------------------------------------------
+# Parallel directory tree scanner
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Finds files in a directory tree, listing directories in parallel
+
+Created on Oct 16, 2026
+
+On an SMB or NFS mount, nearly all the time spent walking a tree goes on
+waiting for the server to answer each directory listing.  `os.walk()`
+waits for one listing at a time, and it lists excluded directories and
+everything below them before the caller gets a chance to skip them.
+
+`TreeScanner` keeps a bounded pool of threads listing directories at
+once, prunes excluded directories before they're ever listed, and hands
+matching files back through a generator as soon as they're found.  The
+threads spend their time blocked on I/O, so the GIL isn't a problem.
+
+`scandir` is used when available (it's built into Python 3.5+, or
+`pip install scandir`), as it gets file types from the directory
+listing itself.  Without it every entry has to be stat()ed, which costs
+another round trip per entry on a network mount.
+
+`DirectoryJournal` remembers what each directory held the last time it
+was listed, and its mtime at the time.  Adding, removing or renaming
+anything in a directory moves its mtime, so on the next scan a
+directory whose mtime hasn't moved is answered from the journal with a
+single stat() instead of a listing.  Every directory still has to be
+stat()ed, as a change deep in the tree doesn't touch the mtime of the
+directories above it.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import json
+import os
+import Queue
+import threading
+import time
+
+# ---*< Third-party imports >*-------------------------------------------------
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir #@UnresolvedImport
+    except ImportError:
+        scandir = None
+
+# ---*< Local imports >*-------------------------------------------------------
+
+# ---*< Initialization >*------------------------------------------------------
+"""Number of directories listed at once by default"""
+DEFAULT_WORKERS = 8
+
+"""Seconds after which a journaled directory is listed again even if its
+mtime hasn't moved, so that every directory is checked now and then"""
+VERIFY_INTERVAL = 7 * 24 * 60 * 60
+
+"""Coarsest mtime resolution we expect from a file system, in seconds.
+SMB and FAT only keep two-second times.  A directory listed this soon
+after it was modified could change again without its mtime moving, so
+it isn't trusted until it has been listed again."""
+MTIME_GRANULARITY = 2
+
+# ---*< Code >*----------------------------------------------------------------
+def list_dir(path):
+    """Lists a directory, returning (subdirectory names, file names)
+
+    Symlinks to directories are treated like `os.walk()` treats them -
+    they're not descended into.
+    """
+    dirs = []
+    files = []
+
+    if scandir is not None:
+        for entry in scandir(path):
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif entry.is_file():
+                files.append(entry.name)
+
+    else:
+        for name in os.listdir(path):
+            full = os.path.join(path, name)
+            if os.path.isdir(full):
+                if not os.path.islink(full):
+                    dirs.append(name)
+            elif os.path.isfile(full):
+                files.append(name)
+
+    return (dirs, files)
+
+
+class TreeScanner(object):
+    """Scans directory trees for files, several directories at a time
+
+    Directories that can't be listed are skipped, and recorded in
+    `errors` as (path, exception) tuples.  So is a directory that fails
+    any other way - say a name that won't decode - which may leave some
+    of what's in it unscanned, but never stops the scan.
+    """
+
+    def __init__(self, include=None, exclude=None, workers=DEFAULT_WORKERS,
+                 lister=list_dir):
+        """__init__ method.
+
+        :param include: (optional) compiled regex matched against each
+                        file name.  Only matching files are returned.
+        :param exclude: (optional) compiled regex matched against the
+                        absolute path of each directory.  Matching
+                        directories aren't listed, nor is anything in
+                        them.
+        :param workers: (optional) `int` number of directories to list
+                        at once
+        :param lister: (optional) function taking a directory path and
+                       returning (subdirectory names, file names).
+                       Defaults to `list_dir()`.
+        """
+        self.include = include
+        self.exclude = exclude
+        self.workers = max(1, workers)
+        self.lister = lister
+        self.errors = []
+        super(TreeScanner, self).__init__()
+
+    def scan(self, root):
+        """Yields the full path of each matching file below `root`
+
+        Files come back in no particular order.  Stopping early (closing
+        the generator) stops the scan.
+        """
+        root = os.path.abspath(root)
+        if self.exclude and self.exclude.match(root):
+            return
+
+        dirs = Queue.Queue()
+        results = Queue.Queue()
+        stop = threading.Event()
+        lock = threading.Lock()
+        pending = [1] # directories queued but not yet finished
+        done = object()
+
+        def work():
+            while True:
+                path = dirs.get()
+                if path is None:
+                    return
+
+                try:
+                    if not stop.is_set():
+                        self._list(path, dirs, results, lock, pending)
+                except Exception as e:
+                    # Keep this worker going, or the directories still
+                    # queued may never be listed
+                    self.errors.append((path, e))
+                finally:
+                    with lock:
+                        pending[0] -= 1
+                        if pending[0] == 0:
+                            results.put(done)
+
+        threads = [threading.Thread(target=work)
+                   for _ in xrange(self.workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        dirs.put(root)
+
+        try:
+            while True:
+                # Block with a timeout, or Python 2 won't deliver ^C
+                try:
+                    found = results.get(timeout=1)
+                except Queue.Empty:
+                    continue
+
+                if found is done:
+                    break
+
+                for f in found:
+                    yield f
+
+        finally:
+            stop.set()
+            for _ in threads:
+                dirs.put(None)
+
+    def _list(self, path, dirs, results, lock, pending):
+        """Lists one directory, queueing its subdirectories for listing"""
+        try:
+            (subdirs, files) = self.lister(path)
+        except (IOError, OSError) as e:
+            self.errors.append((path, e))
+            return
+
+        for d in subdirs:
+            d = os.path.join(path, d)
+            if self.exclude and self.exclude.match(d):
+                continue
+
+            with lock:
+                pending[0] += 1
+            dirs.put(d)
+
+        if self.include:
+            files = [f for f in files if self.include.match(f)]
+
+        if files:
+            results.put([os.path.join(path, f) for f in files])
+
+
+def setup_journal(db):
+    """Creates the directory journal table if it doesn't already exist"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS dir_journal(
+            path TEXT PRIMARY KEY,
+            mtime REAL,
+            listed_at REAL,
+            entries INTEGER,
+            dirs TEXT,
+            files TEXT
+        )
+    ''')
+    db.commit()
+
+
+class DirectoryJournal(object):
+    """Persisted record of each directory's contents as of its last listing
+
+    Use `lister()` as the lister for a `TreeScanner`, then `save()` once
+    the scan is finished.  The journal is read into memory up front and
+    only written back by `save()`, so the scanner's threads never touch
+    the DB.
+
+    Directories are listed again when their mtime has moved, when they
+    haven't been listed for `verify_interval` seconds (a rolling sweep
+    that catches anything mtimes missed), or always if `full` is set.
+    Sweeps that find a directory changed without its mtime moving are
+    counted in `stats['stale']`.
+    """
+
+    def __init__(self, db, full=False, verify_interval=VERIFY_INTERVAL):
+        """__init__ method.
+
+        :param db: `sqlite3.Db` handle to keep the journal in
+        :param full: (optional) `boolean`; if True, ignore the journal
+                     and list every directory (it's still updated)
+        :param verify_interval: (optional) seconds after which a
+                                directory is listed regardless
+        """
+        self.db = db
+        self.full = full
+        self.verify_interval = verify_interval
+        self.lock = threading.Lock()
+        self.updates = {}
+        self.visited = set()
+        self.stats = {'listed': 0, 'skipped': 0, 'stale': 0}
+
+        setup_journal(db)
+        self.entries = {}
+        for row in db.execute('''
+            SELECT path, mtime, listed_at, entries, dirs, files
+            FROM dir_journal
+        '''):
+            self.entries[row[0]] = tuple(row)[1:]
+
+        super(DirectoryJournal, self).__init__()
+
+    def lister(self, list_func=list_dir):
+        """Returns a `TreeScanner` lister that consults the journal
+
+        :param list_func: (optional) function that actually lists a
+                          directory.  Defaults to `list_dir()`.
+        """
+        def journaled_list(path):
+            # stat() before listing, so that a change made while listing
+            # moves the mtime past the one recorded
+            mtime = os.stat(path).st_mtime
+            now = time.time()
+            entry = self.entries.get(path)
+
+            with self.lock:
+                self.visited.add(path)
+
+            if entry is not None and not self.full:
+                (old_mtime, listed_at, count, dirs, files) = entry
+                settled = listed_at - old_mtime > MTIME_GRANULARITY
+                fresh = now - listed_at < self.verify_interval
+
+                if old_mtime == mtime and settled and fresh:
+                    with self.lock:
+                        self.stats['skipped'] += 1
+                    return (json.loads(dirs), json.loads(files))
+
+            (dirs, files) = list_func(path)
+
+            with self.lock:
+                self.stats['listed'] += 1
+                if (entry is not None and entry[0] == mtime and
+                    entry[2] != len(dirs) + len(files)):
+                    self.stats['stale'] += 1
+
+                self.updates[path] = (mtime, now, len(dirs) + len(files),
+                                      json.dumps(dirs), json.dumps(files))
+
+            return (dirs, files)
+
+        return journaled_list
+
+    def save(self, root):
+        """Writes back everything listed, and forgets vanished directories
+
+        :param root: `string` of the directory that was scanned.  Journal
+                     entries below it that weren't reached are deleted.
+        """
+        root = os.path.abspath(root)
+        prefix = os.path.join(root, '')
+        gone = [p for p in self.entries
+                if (p == root or p.startswith(prefix)) and
+                p not in self.visited]
+
+        self.db.executemany('''
+            INSERT OR REPLACE INTO dir_journal
+                (path, mtime, listed_at, entries, dirs, files)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(p,) + v for p, v in self.updates.items()])
+
+        self.db.executemany('''
+            DELETE FROM dir_journal WHERE path = ?
+        ''', [(p,) for p in gone])
+
+        self.db.commit()
+
+        self.entries.update(self.updates)
+        for p in gone:
+            del self.entries[p]
+        self.updates = {}
+        self.visited = set()
@@ -0,0 +1,579 @@
+# ---*< simulator.py >*--------------------------------------------------------
+# In-process stand-in for iTunes
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""A fake iTunes, for running and timing the scripts without one
+
+Created on Oct 16, 2026
+
+Everything the scripts do to iTunes goes through a small part of its
+scripting interface: the library playlist and its tracks, user
+playlists, `add`, `delete`, `exists`, `count`, getting and setting
+track properties (singly, in bulk and through `its` filters) and
+`missing_value`.  `SimulatedITunes` implements just that part, in
+memory, with the same shape as the appscript objects - so the code
+under test runs unchanged on any machine, Linux included.
+
+Every command is one simulated Apple event.  They're counted in
+`events`, run one at a time (as iTunes would), and each can be made to
+sleep for `latency` seconds to stand in for the round trip.  Point an
+`ITunesManager` at one with `SimulatedBackend`::
+
+    fake = SimulatedITunes(generate_library(100000), latency=0.001)
+    itunes = ITunesManager(SimulatedBackend(fake))
+
+`generate_library()` builds synthetic libraries with dupes and dead
+entries in them.  `ROADIE_PROFILE` works on the simulator too.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+from datetime import datetime, timedelta
+import os
+import random
+import threading
+import time
+
+# ---*< Third-party imports >*-------------------------------------------------
+
+# ---*< Local imports >*-------------------------------------------------------
+from backends import AppscriptBackend, CommandError
+import instrument
+
+# ---*< Initialization >*------------------------------------------------------
+"""Track properties the simulator keeps"""
+TRACK_PROPERTIES = ('id', 'persistent_ID', 'location', 'name', 'artist',
+                    'album', 'duration', 'comment', 'rating', 'date_added',
+                    'modification_date')
+
+"""Properties that filters on can be answered from an index"""
+INDEXED_PROPERTIES = ('id', 'persistent_ID')
+
+"""Apple event error numbers the simulator raises"""
+FILE_NOT_FOUND = -43
+NO_SUCH_OBJECT = -1728
+
+"""Where generated libraries keep their files"""
+DEFAULT_ROOT = '/Volumes/multimedia/Music'
+
+# ---*< Code >*----------------------------------------------------------------
+class SimulatedCommandError(CommandError):
+    """A failed simulated event, carrying its error number"""
+
+    def __init__(self, errornumber, message):
+        Exception.__init__(self, message)
+        self.errornumber = errornumber
+        self.message = message
+
+    def __str__(self):
+        return 'Command failed (%d): %s' % (self.errornumber, self.message)
+
+
+class Keyword(object):
+    """An appscript keyword, e.g. `k.missing_value`"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Keyword) and other.name == self.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return 'k.%s' % self.name
+
+
+class Keywords(object):
+    """Stands in for appscript's `k`"""
+
+    def __getattr__(self, name):
+        return Keyword(name)
+
+
+class Test(object):
+    """A filter on tracks, e.g. `its.rating == 100`
+
+    Tests on the same property can be OR'd together, which is how
+    `BatchWriter` builds them.
+    """
+
+    def __init__(self, prop, values):
+        """__init__ method.
+
+        :param prop: `str` name of the property tested
+        :param values: `set` of values, any of which matches
+        """
+        self.prop = prop
+        self.values = values
+
+    def OR(self, *others):
+        """Returns a test matching anything this or `others` match"""
+        values = set(self.values)
+        for other in others:
+            if other.prop != self.prop:
+                raise ValueError('The simulator can only OR tests on the '
+                                 'same property')
+            values.update(other.values)
+
+        return Test(self.prop, values)
+
+    def matches(self, track):
+        return track[self.prop] in self.values
+
+
+class TestProperty(object):
+    """One property of `its`, waiting to be compared"""
+
+    def __init__(self, prop):
+        self.prop = prop
+
+    def __eq__(self, value):
+        return Test(self.prop, set([value]))
+
+
+class Its(object):
+    """Stands in for appscript's `its`"""
+
+    def __getattr__(self, prop):
+        return TestProperty(prop)
+
+
+"""The simulator's keywords and test builder"""
+k = Keywords()
+its = Its()
+
+
+class SimulatedAlias(object):
+    """A file location as iTunes returns it"""
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+
+
+@instrument.register_command_type
+class Command(object):
+    """A command on a simulated reference.  Calling it is one event."""
+
+    def __init__(self, app, name, run):
+        """__init__ method.
+
+        :param app: `SimulatedITunes` the event goes to
+        :param name: `str` name of the command, for counting
+        :param run: function doing the work
+        """
+        self.app = app
+        self.name = name
+        self.run = run
+
+    def __call__(self, *args, **kwargs):
+        kwargs.pop('timeout', None)
+        return self.app.send(self.name, self.run, *args, **kwargs)
+
+
+class Tracks(object):
+    """Reference to some tracks, as picked out by a chain of selectors
+
+    Nothing is looked up until a command is sent.
+    """
+
+    def __init__(self, app, playlist=None, selectors=()):
+        """__init__ method.
+
+        :param app: `SimulatedITunes` the tracks belong to
+        :param playlist: (optional) `str` name of the user playlist the
+                         tracks come from, or None for the library
+        :param selectors: (optional) `tuple` of selectors, applied in
+                          order to the tracks of the playlist
+        """
+        self.app = app
+        self.playlist = playlist
+        self.selectors = selectors
+
+    def _select(self, selector):
+        return Tracks(self.app, self.playlist, self.selectors + (selector,))
+
+    @property
+    def single(self):
+        """True if this refers to one track rather than a list of them"""
+        return bool(self.selectors) and self.selectors[-1][0] in ('index',
+                                                                  'first',
+                                                                  'id')
+
+    def __getitem__(self, selector):
+        if isinstance(selector, Test):
+            return self._select(('test', selector))
+        if isinstance(selector, slice):
+            return self._select(('range', selector.start, selector.stop))
+        return self._select(('index', selector))
+
+    def __getslice__(self, start, end):
+        return self._select(('range', start, end))
+
+    def __call__(self, **kwargs):
+        # Calling a reference is shorthand for getting it
+        return Command(self.app, 'get', self._get_refs)(**kwargs)
+
+    def ID(self, track_id):
+        """Returns a reference to the track with an id"""
+        return self._select(('id', track_id))
+
+    @property
+    def first(self):
+        return self._select(('first',))
+
+    def __getattr__(self, name):
+        if name == 'count':
+            return Command(self.app, 'count',
+                           lambda each=None: len(self.resolve()))
+        if name == 'delete':
+            return Command(self.app, 'delete', self._delete)
+        if name == 'properties' or name in TRACK_PROPERTIES:
+            return Property(self, name)
+        raise AttributeError(name)
+
+    def resolve(self):
+        """Returns the `list` of track `dict`s this refers to
+
+        Raises `SimulatedCommandError` if it's a single track that
+        doesn't exist.
+        """
+        app = self.app
+        selectors = list(self.selectors)
+
+        if (self.playlist is None and selectors and
+            selectors[0][0] in ('test', 'id') and
+            (selectors[0][0] == 'id' or
+             selectors[0][1].prop in INDEXED_PROPERTIES)):
+            # Answer from the index rather than a pass over the library
+            (kind, arg) = selectors.pop(0)[:2]
+            if kind == 'id':
+                (prop, values) = ('id', [arg])
+            else:
+                (prop, values) = (arg.prop, arg.values)
+            found = [app.index[prop][v] for v in values
+                     if v in app.index[prop]]
+            tracks = sorted(found, key=lambda t: t['_order'])
+            if kind == 'id':
+                selectors.insert(0, ('first',))
+        elif self.playlist is None:
+            tracks = app.live_tracks()
+        else:
+            tracks = [app.index['persistent_ID'][pid]
+                      for pid in app.playlists[self.playlist]
+                      if pid in app.index['persistent_ID']]
+
+        for selector in selectors:
+            kind = selector[0]
+            if kind == 'test':
+                tracks = [t for t in tracks if selector[1].matches(t)]
+            elif kind == 'range':
+                # 1-based and inclusive, like AppleScript
+                tracks = tracks[selector[1] - 1:selector[2]]
+            elif kind == 'id':
+                tracks = [t for t in tracks if t['id'] == selector[1]][:1]
+            elif kind == 'first':
+                tracks = tracks[:1]
+            elif kind == 'index':
+                i = selector[1]
+                tracks = tracks[i - 1:i] if 0 < i <= len(tracks) else []
+
+            if kind in ('id', 'first', 'index') and not tracks:
+                raise SimulatedCommandError(NO_SUCH_OBJECT,
+                                            "Can't get reference.")
+
+        return tracks
+
+    def _get_refs(self):
+        refs = [Tracks(self.app, None, (('id', t['id']),))
+                for t in self.resolve()]
+        return refs[0] if self.single else refs
+
+    def _delete(self):
+        for t in self.resolve():
+            self.app.remove(t)
+
+
+class Property(object):
+    """Reference to one property of some tracks"""
+
+    def __init__(self, tracks, name):
+        self.tracks = tracks
+        self.name = name
+
+    def __getattr__(self, name):
+        if name == 'get':
+            return Command(self.tracks.app, 'get', self._get)
+        if name == 'set':
+            return Command(self.tracks.app, 'set', self._set)
+        raise AttributeError(name)
+
+    def __call__(self, **kwargs):
+        return self.get(**kwargs)
+
+    def _get(self):
+        if self.name == 'properties':
+            values = [dict((getattr(k, p), export(p, t[p]))
+                           for p in TRACK_PROPERTIES)
+                      for t in self.tracks.resolve()]
+        else:
+            values = [export(self.name, t[self.name])
+                      for t in self.tracks.resolve()]
+
+        if self.tracks.single:
+            return values[0]
+        return values
+
+    def _set(self, value):
+        if self.name not in ('location', 'rating', 'name', 'artist', 'album',
+                             'comment'):
+            raise SimulatedCommandError(-10003, "Can't set %s" % self.name)
+
+        if self.name == 'location':
+            value = getattr(value, 'path', value)
+
+        for t in self.tracks.resolve():
+            t[self.name] = value
+            t['modification_date'] = datetime.now()
+
+
+def export(prop, value):
+    """Converts a stored value to what iTunes would return"""
+    if value is None:
+        return k.missing_value
+    if prop == 'location':
+        return SimulatedAlias(value)
+    return value
+
+
+class Playlists(object):
+    """Reference to the library or user playlists, by index or name"""
+
+    def __init__(self, app, library):
+        self.app = app
+        self.library = library
+
+    def __getitem__(self, key):
+        return Playlist(self.app, None if self.library else key)
+
+
+class Playlist(object):
+    """Reference to one playlist - the library, if `name` is None"""
+
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+
+    @property
+    def tracks(self):
+        return Tracks(self.app, self.name)
+
+    @property
+    def add(self):
+        return Command(self.app, 'add', self._add)
+
+    def _add(self, files, to=None):
+        single = not isinstance(files, (list, tuple))
+        added = []
+
+        for f in ([files] if single else files):
+            path = getattr(f, 'path', f)
+            if not os.path.exists(path):
+                raise SimulatedCommandError(FILE_NOT_FOUND,
+                                            'File not found: %s' % path)
+
+            (base, _) = os.path.splitext(os.path.basename(path))
+            track = self.app.insert({'location': path, 'name': base})
+            if self.name is not None:
+                self.app.playlists[self.name].append(track['persistent_ID'])
+            added.append(Tracks(self.app, None, (('id', track['id']),)))
+
+        return added[0] if single else added
+
+
+class SimulatedITunes(object):
+    """An in-memory iTunes library, scriptable like the real one
+
+    Only meant to be driven through the references it hands out, the
+    way appscript's application object is.
+    """
+
+    def __init__(self, tracks=(), latency=0.0, playlists=None):
+        """__init__ method.
+
+        :param tracks: (optional) iterable of track `dict`s, as made by
+                       `generate_library()`.  Missing properties are
+                       filled in.
+        :param latency: (optional) `float` seconds each event takes
+        :param playlists: (optional) `dict` of user playlist name to a
+                          `list` of the persistent IDs in it
+        """
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.events = {}
+        self.rows = []
+        self.removed = 0
+        self.index = dict((p, {}) for p in INDEXED_PROPERTIES)
+        self.next_id = 1
+        self.playlists = dict((name, list(pids)) for (name, pids)
+                              in (playlists or {}).iteritems())
+        self.rng = random.Random(0)
+
+        for t in tracks:
+            self.insert(t)
+
+        super(SimulatedITunes, self).__init__()
+
+    @property
+    def event_count(self):
+        """Total events sent so far"""
+        return sum(self.events.itervalues())
+
+    def send(self, command, run, *args, **kwargs):
+        """Runs a command as one event - counted, serialized and slowed"""
+        with self.lock:
+            self.events[command] = self.events.get(command, 0) + 1
+            if self.latency:
+                time.sleep(self.latency)
+            return run(*args, **kwargs)
+
+    def insert(self, track):
+        """Adds a track `dict` to the library, filling in what's missing
+
+        :rtype: the stored `dict`
+        """
+        t = dict.fromkeys(TRACK_PROPERTIES)
+        t.update(track)
+        t['rating'] = t['rating'] or 0
+        if t['id'] is None:
+            t['id'] = self.next_id
+        if t['persistent_ID'] is None:
+            t['persistent_ID'] = '%016X' % self.rng.getrandbits(64)
+        if t['date_added'] is None:
+            t['date_added'] = t['modification_date'] = datetime.now()
+        t['_order'] = len(self.rows)
+
+        self.next_id = max(self.next_id, t['id'] + 1)
+        self.rows.append(t)
+        for p in INDEXED_PROPERTIES:
+            self.index[p][t[p]] = t
+
+        return t
+
+    def remove(self, track):
+        """Deletes a track `dict`.  The list is compacted lazily."""
+        if track.get('_removed'):
+            return
+
+        track['_removed'] = True
+        self.removed += 1
+        for p in INDEXED_PROPERTIES:
+            del self.index[p][track[p]]
+
+    def live_tracks(self):
+        """Returns the `list` of tracks in library order"""
+        if self.removed:
+            self.rows = [t for t in self.rows if not t.get('_removed')]
+            for (i, t) in enumerate(self.rows):
+                t['_order'] = i
+            self.removed = 0
+
+        return self.rows
+
+    # What scripts reach the library through
+    @property
+    def library_playlists(self):
+        return Playlists(self, True)
+
+    @property
+    def user_playlists(self):
+        return Playlists(self, False)
+
+    @property
+    def tracks(self):
+        return Tracks(self)
+
+    @property
+    def exists(self):
+        return Command(self, 'exists',
+                       lambda ref: (ref.name in self.playlists
+                                    if isinstance(ref, Playlist) else
+                                    bool(ref.resolve())))
+
+
+class SimulatedBackend(AppscriptBackend):
+    """Reads from and writes to a `SimulatedITunes` in place of iTunes"""
+    its = its
+    k = k
+
+    def __init__(self, simulated=None, **kwargs):
+        """__init__ method.
+
+        :param simulated: (optional) `SimulatedITunes` to use.  If None,
+                          one is made from `kwargs`.
+        """
+        super(SimulatedBackend, self).__init__()
+        self.simulated = simulated or SimulatedITunes(**kwargs)
+
+    def connect(self):
+        if not self.itunes:
+            self.itunes = instrument.wrap(self.simulated)
+
+        return self.itunes
+
+
+def generate_library(count, dupe_ratio=0.1, dead_ratio=0.02, seed=0,
+                     root=DEFAULT_ROOT):
+    """Builds a synthetic library for `SimulatedITunes`
+
+    About `dupe_ratio` of the tracks are exact dupes (same artist, album,
+    name, duration and comment) of another, with a different rating and
+    file.  About `dead_ratio` have no file.
+
+    :param count: `int` number of tracks
+    :param dupe_ratio: (optional) `float` share of tracks that are dupes
+    :param dead_ratio: (optional) `float` share of tracks with no file
+    :param seed: (optional) seed, so the same arguments give the same
+                 library
+    :param root: (optional) `str` directory the files are under
+    :rtype: `list` of track `dict`s
+    """
+    rng = random.Random(seed)
+    artists = max(1, count // 12)
+    added = datetime(2011, 1, 1)
+    tracks = []
+
+    for i in xrange(count):
+        if tracks and rng.random() < dupe_ratio:
+            t = dict(rng.choice(tracks))
+            t['location'] = '%s/Dupes/%d.mp3' % (root, i)
+        else:
+            artist = 'Artist %d' % rng.randrange(artists)
+            album = 'Album %d' % rng.randrange(4)
+            name = 'Track %d' % i
+            t = {'artist': artist,
+                 'album': album,
+                 'name': name,
+                 'duration': round(rng.uniform(120, 600), 3),
+                 'comment': '',
+                 'location': '%s/%s/%s/%s.mp3' % (root, artist, album, name),
+                 }
+
+        t['id'] = i + 1000
+        t['persistent_ID'] = '%016X' % rng.getrandbits(64)
+        t['rating'] = rng.choice((0, 0, 0, 20, 40, 60, 80, 100))
+        t['date_added'] = t['modification_date'] = (added +
+                                                    timedelta(seconds=i))
+        if rng.random() < dead_ratio:
+            t['location'] = None
+
+        tracks.append(t)
+
+    return tracks
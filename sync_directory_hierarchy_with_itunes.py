@@ -21,10 +21,11 @@ also been unable to add the track manually.  If you find an instance
 where the script fails to add something but you CAN add it manually,
 PLEASE contact me!
 
-This works by creating a temporary local SQLite filed-based database,
-populating it with the path to all the files in your iTunes library, and
-then walking the directory hierarchy to find any files that aren't in
-the SQLite DB.  If it finds a file, it tells iTunes to add it.
+This works by refreshing the persistent library catalog (see
+`catalog.py`), which holds the path to all the files in your iTunes
+library, and then walking the directory hierarchy to find any files
+that aren't in the catalog.  If it finds a file, it tells iTunes to add
+it.
 
 I'm a little unsure about the handling of unicode in here - so let me
 know if you run into issues.
@@ -47,20 +48,50 @@ either one track at a time or in batch in the past, and the difference
 is negligible.  And the problem with doing them in batch is the timeout
 must be much higher, as iTunes still processes one file at a time.
 
+So rather than waiting for the scan to finish, new files go on a queue
+(see `AddQueue`) as soon as they're found, and iTunes starts adding
+them while the rest of the tree is still being walked.  Adds that fail
+are retried with backoff.  Adds that time out are checked against the
+library at the end rather than retried, as iTunes usually finishes them
+anyway.
+
+Progress is checkpointed to the catalog DB as it goes (see `jobs.py`),
+so a sync that's interrupted - a crash, a closed lid - carries on where
+it left off the next time it's run on the same directory.
+
+Rather than running this from cron, which walks the whole tree and
+refreshes the catalog every time to find a handful of new files, it can
+`--watch` the tree.  After one normal sync it stays running and adds
+files as they turn up, a few seconds after they stop changing - see
+`watch_dir()` and `watcher.py`.
+
 """
 # ---*< Standard imports >*----------------------------------------------------
-import json
+import argparse
+import Queue
 import re
 import sys
 import os
+import threading
+import time
 
 # ---*< Third-party imports >*-------------------------------------------------
-from appscript import k
-from mactypes import Alias
+try:
+    from mactypes import Alias #@UnresolvedImport
+except ImportError:
+    # Not on a Mac - only a dry run is possible, or a run against the
+    # simulator (see `simulator`), which takes plain paths
+    def Alias(path):
+        return path
 
 # ---*< Local imports >*-------------------------------------------------------
-from itunes import init_db_conn, ITunesManager
-from models import iTunesTrack
+from catalog import Catalog, DEFAULT_CATALOG_FILE, open_catalog
+from itunes import CommandError, ITunesManager, XMLLibraryBackend
+from jobs import (DEFAULT_CHECKPOINT_INTERVAL, DONE, FAILED, Job, PENDING,
+                  UNCERTAIN)
+from scanner import DEFAULT_WORKERS, DirectoryJournal, list_dir, TreeScanner
+from watcher import (Debouncer, DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE,
+                     InotifyWatcher, PollingWatcher, pyinotify)
 
 # ---*< Initialization >*------------------------------------------------------
 # Dir to start in.  Preferably a unicode string, because it is used as
@@ -77,194 +108,726 @@ EXCLUDE_DIR_REGEX = re.compile('^('
     '/Volumes/multimedia/Music/(incoming|Production|iTunes)'
 ')')
 
-# DB table name
-table_name = 'sync_hierarchy'
-
 # iTunes AppleScript timeout - if you are adding large files, you may
 # need to increase this if you get -1712 Apple event timed out errors
 AS_TIMEOUT = 300 # seconds
 
-def add_track(db, track, commit=True):
-    """Adds a track from iTunes to the sync temporary DB
-
-    The sync DB is volatile, and is erased with every instantiation of
-    init_db_conn() in the ITunesManager.
-
-    :param db: `sqlite3.Db` handle to the working DB
-    :param track: `iTunes track` as returned from iTunes via appscript
-    :param commit: `boolean` indicating whether add_track() should call
-                   `db.commit()` after generating the INSERT operation.
-                   If you are going to update a lot of tracks in a
-                   batch, it is MUCH faster to set `commit` to false -
-                   but if you do, be sure you call `db.commit()` once
-                   you've done all the batch operations.  Otherwise,
-                   your changes won't be saved.
-    
-    """
-    track_entry = iTunesTrack()
-    curs = db.cursor()
+# Error number of an Apple event that timed out
+AS_TIMEOUT_ERROR = -1712
 
-    # Check if already exists - if it does, add the id of this track to
-    # the list
-    curs.execute('''
-        SELECT data FROM %s WHERE path = ?
-    ''' % table_name, (track.location().path,))
+# Files per add event.  iTunes still imports one at a time, so this
+# mostly saves on event overhead.
+ADD_BATCH_SIZE = 1
 
-    rows = curs.fetchall()
-    if len(rows) == 0:
-        # Nothing found, so just add track as new
-        track_entry.path = track.location().path
-        track_entry.ids = [track.id(), ]
+# Most files found but waiting to be added before the scan waits
+ADD_QUEUE_SIZE = 1000
 
-    elif len(rows) == 1:
-        # Found an entry, so add the id to the list and report it
-        data = json.loads(rows[0]['data'])
-        track_entry = iTunesTrack(**data)
+# Times to retry a failed add, and the first wait between tries.  The
+# wait doubles each time.
+ADD_RETRIES = 3
+ADD_RETRY_BACKOFF = 2 # seconds
 
-        # Data integrity check
-        if track_entry.path != track.location().path:
-            raise ValueError('Path for saved track index and stored JSON '
-                             'object don\'t match.\nJSON: %s\nIndex: %s' %
-                             (track_entry.path, track.location.path()))
+def scan_files(path, workers=DEFAULT_WORKERS, journal=None):
+    """Yields the full path of every file under `path` to be synced
 
-        if track.id() not in track_entry.ids:
-            track_entry.ids.append(track.id())
+    Only files matching `INCLUDE_EXTENSIONS` are returned, and
+    directories matching `EXCLUDE_DIR_REGEX` are never even listed.
+    Directories are listed `workers` at a time (see `TreeScanner`), so
+    files come back in no particular order.
 
-        print ('Duplicate entries found for %s: %s' %
-               (track_entry.path, ','.join([str(x) for x in track_entry.ids])))
+    :param journal: (optional) `DirectoryJournal` used to skip listing
+                    directories that haven't changed.  Call its `save()`
+                    once the scan is done.
+    """
+    lister = journal.lister() if journal is not None else list_dir
+    scanner = TreeScanner(INCLUDE_EXTENSIONS, EXCLUDE_DIR_REGEX, workers,
+                          lister)
+
+    for f in scanner.scan(path):
+        yield f
+
+    for (d, e) in scanner.errors:
+        sys.stderr.write('Unable to list %s: %s\n' % (d, e))
+
+
+def diff_paths(library_paths, scanned_paths, root=None, on_new=None):
+    """Compares files on disk with the library in a single pass
+
+    Each scanned path is one hash lookup against `library_paths`, so
+    this is linear in the number of paths on both sides, and the scan
+    can be a generator that's consumed as it goes.
+
+    :param library_paths: `set` of paths known to the library
+    :param scanned_paths: iterable of paths found on disk
+    :param root: (optional) `string` of the directory that was scanned.
+                 If given, library-only paths are limited to those
+                 below it that weren't excluded from the scan.
+    :param on_new: (optional) function called with each path to add as
+                   soon as it's found, so work can start before the
+                   scan is over
+    :rtype: `tuple` of (to add `list`, present `list`, library-only
+            `set`).  The lists are in scan order.
+    """
+    unseen = set(library_paths)
+    to_add = []
+    present = []
+
+    for f in scanned_paths:
+        if f in unseen:
+            unseen.remove(f)
+            present.append(f)
+        elif f not in library_paths:
+            to_add.append(f)
+            if on_new is not None:
+                on_new(f)
+
+    if root is not None:
+        prefix = os.path.join(os.path.abspath(root), '')
+        unseen = set(f for f in unseen if f.startswith(prefix) and
+                     not EXCLUDE_DIR_REGEX.match(os.path.dirname(f)))
+
+    return (to_add, present, unseen)
+
+
+class AddQueue(object):
+    """Adds files to iTunes on a background thread as they're found
+
+    The scan `put()`s each new file on a bounded queue, and a worker
+    drains it in batches of `batch_size`, so iTunes is importing while
+    the scan carries on.  If the scan gets more than `maxsize` files
+    ahead, `put()` blocks until the worker catches up.
+
+    An add that fails outright is retried up to `retries` times with
+    exponential backoff, and then a batch is split up and its files
+    tried one by one.  An add that times out (-1712) is different -
+    iTunes carries on importing after the event times out, so retrying
+    could add the file twice.  Those files are set aside in `uncertain`
+    for `settle()` to check once the queue has drained.
+
+    Given a `jobs.Job`, the outcome of every file is recorded in it too.
+
+    If the worker dies anyway, `put()` and `close()` raise RuntimeError
+    rather than waiting on it forever.
+    """
 
-    track_entry.validate()
+    def __init__(self, lib, batch_size=ADD_BATCH_SIZE, maxsize=ADD_QUEUE_SIZE,
+                 retries=ADD_RETRIES, job=None):
+        """__init__ method.
+
+        :param lib: appscript reference to the library playlist
+        :param batch_size: (optional) `int` most files per `add` event
+        :param maxsize: (optional) `int` most files waiting to be added
+        :param retries: (optional) `int` times to retry a failed add
+        :param job: (optional) `jobs.Job` to record outcomes in
+        """
+        self.lib = lib
+        self.job = job
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.queue = Queue.Queue(maxsize)
+        self.successes = []
+        self.failures = []
+        self.uncertain = []
+        self.queued = 0
+        self.error = None
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        super(AddQueue, self).__init__()
+
+    def put(self, path):
+        """Queues a file to be added, blocking while the queue is full"""
+        self.queued += 1
+        self._put(path)
+
+    def close(self):
+        """Says no more files are coming"""
+        self._put(None)
+
+    def _put(self, item):
+        """Queues an item, as long as the worker is there to take it"""
+        while True:
+            if not self.thread.is_alive():
+                raise RuntimeError('The add worker has stopped: %s' %
+                                   (self.error,))
+
+            # Block with a timeout, or Python 2 won't deliver ^C
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except Queue.Full:
+                continue
+
+    def join(self, report=None):
+        """Waits for every queued file to be tried
+
+        :param report: (optional) function called with `status()` about
+                       once a second while waiting
+        """
+        while self.thread.is_alive():
+            self.thread.join(1)
+            if report:
+                report(self.status())
+
+    def status(self):
+        """Returns a one-line progress report"""
+        done = len(self.successes) + len(self.failures) + len(self.uncertain)
+        elapsed = time.time() - self.started
+
+        return ('[Queued: %d Added: %d Failed: %d Unsure: %d - %.2f/sec]' %
+                (self.queued, len(self.successes), len(self.failures),
+                 len(self.uncertain), done / elapsed if elapsed else 0))
+
+    def settle(self, landed, backoff=ADD_RETRY_BACKOFF):
+        """Re-checks timed-out adds, retrying the ones that didn't land
+
+        Waits with exponential backoff between checks, to give iTunes
+        time to finish what it was doing.  Anything still not in the
+        library after `retries` rounds is counted as a failure.
+
+        :param landed: function taking no arguments and returning a
+                       `set` of every track location in the library
+        """
+        for attempt in xrange(self.retries + 1):
+            if not self.uncertain:
+                return
+
+            time.sleep(backoff * 2 ** attempt)
+            paths = landed()
+            unsure = self.uncertain
+            self.uncertain = []
+
+            retry = []
+            for f in unsure:
+                if f in paths:
+                    self._record([f], self.successes, 'done')
+                else:
+                    retry.append(f)
 
-    curs.execute('''
-        INSERT OR REPLACE INTO %s (path, data) VALUES (?, ?)
-    ''' % table_name, (track_entry.path, track_entry.to_json()))
+            if attempt == self.retries:
+                self._record(retry, self.failures, 'failed')
+            else:
+                for f in retry:
+                    self._add([f])
 
-    if commit:
-        db.commit()
+    def _run(self):
+        """Worker thread - drains the queue a batch at a time"""
+        try:
+            self._drain()
+        except Exception as e:
+            self.error = e
+            raise
+
+    def _drain(self):
+        """Takes batches off the queue and adds them, until closed"""
+        closed = False
+
+        while not closed:
+            batch = [self.queue.get()]
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            if None in batch:
+                closed = True
+                batch = [f for f in batch if f is not None]
+
+            if batch:
+                self._add(batch)
+
+    def _add(self, batch):
+        """Adds one batch, retrying failures with exponential backoff"""
+        for attempt in xrange(self.retries + 1):
+            try:
+                added = self.lib.add([Alias(f) for f in batch],
+                                     timeout=AS_TIMEOUT * len(batch))
+
+            except CommandError as e:
+                if getattr(e, 'errornumber', None) == AS_TIMEOUT_ERROR:
+                    self._record(batch, self.uncertain, 'uncertain')
+                    return
+
+                if attempt < self.retries:
+                    time.sleep(ADD_RETRY_BACKOFF * 2 ** attempt)
+                    continue
+
+                if len(batch) > 1:
+                    # One bad file fails the whole event, so find it
+                    for f in batch:
+                        self._add([f])
+                else:
+                    self._record(batch, self.failures, 'failed')
+                return
+
+            except Exception:
+                # Not from iTunes - e.g. a file that's gone since the
+                # scan can't be made into an alias.  Retrying won't help.
+                if len(batch) > 1:
+                    for f in batch:
+                        self._add([f])
+                else:
+                    self._record(batch, self.failures, 'failed')
+                return
+
+            if not isinstance(added, list):
+                added = [added] if added else []
+
+            if len(added) == len(batch):
+                self._record(batch, self.successes, 'done')
+            elif len(batch) == 1:
+                self._record(batch, self.failures, 'failed')
+            else:
+                # Some of the batch didn't make it, and iTunes doesn't
+                # say which
+                self._record(batch, self.uncertain, 'uncertain')
+
+            return
+
+    def _record(self, files, outcome, state):
+        """Adds files to an outcome list, and marks them in the job
+
+        :param state: `str` name of the `jobs.Job` method to call
+        """
+        outcome.extend(files)
+        if self.job is not None:
+            for f in files:
+                getattr(self.job, state)(f)
+
+
+def sync_dir(db, path, silent=False, library=None, dry_run=False,
+             full_refresh=False, workers=DEFAULT_WORKERS, full_scan=False,
+             batch_size=ADD_BATCH_SIZE,
+             checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, restart=False):
+    """Recursively synchronizes a directory hierarchy with iTunes
 
-def db_track_exists(db, path):
-    """Checks for existence of a given path in the DB
+    Progress is checkpointed to `db` (see `jobs.Job`).  If the last
+    sync of the same directory didn't finish, this picks it up again -
+    once the scan has finished, a resumed sync goes straight back to
+    adding the files it hadn't got to.
+   
+    :param db: `sqlite3.Db` handle to the working DB, which also holds
+               the persistent library catalog (see `open_catalog()`)
+    :param dirname: `string` of the root directory
+    :param library: (optional) `ITunesManager` to extract the existing
+                    library paths from.  Defaults to a live iTunes.  If
+                    it's read-only (e.g. built on `XMLLibraryBackend`),
+                    a live iTunes is still used for adding files.
+    :param dry_run: (optional) `boolean`; if True, new files are only
+                    returned as successes, and nothing is added.  Never
+                    needs a live iTunes if `library` is read-only.
+    :param full_refresh: (optional) `boolean`; if True, refetch every
+                         track into the catalog, not just changed ones
+    :param workers: (optional) `int` number of directories to list at
+                    once while scanning
+    :param full_scan: (optional) `boolean`; if True, list every
+                      directory rather than trusting the directory
+                      journal for ones whose mtime hasn't moved
+    :param batch_size: (optional) `int` most files to add per Apple
+                       event (see `AddQueue`)
+    :param checkpoint_interval: (optional) most seconds of progress
+                                that can be lost
+    :param restart: (optional) `boolean`; if True, start afresh even if
+                    the last sync didn't finish
 
-    :param db: `sqlite3.Db` handle to the working DB
-    :param path: `string` of path to check
-    :rtype: `boolean` indicating whether the track exists in the DB
     """
-    res = db.execute('''
-        SELECT path FROM %s WHERE path = ?
-    ''' % table_name, (path,))
+    if library is None:
+        sys.stdout.write('Connecting to iTunes...')
+        library = ITunesManager()
+        sys.stdout.write('done\n')
+
+    itunes_manager = library#IGNORE:C0103
+
+    # Try to work with unicode
+    if not isinstance(path, unicode):
+        path = unicode(path)
 
-    count = len(res.fetchall()) # even sqlite3 says the .rowcount is "quirky"
+    # Dry runs don't change anything, so there's nothing to resume
+    job = None
+    if not dry_run:
+        job = Job(db, 'sync', {'path': os.path.abspath(path)},
+                  checkpoint_interval, restart)
+
+    def report(status=''):
+        """Writes a progress line, overwriting the last one"""
+        if job is not None:
+            job.checkpoint()
+        if not silent:
+            sys.stdout.write('%s\r' % status)
+
+    def connect():
+        """Returns (live `ITunesManager`, `AddQueue` feeding it)"""
+        live = itunes_manager
+        if live.read_only:
+            sys.stdout.write('Connecting to iTunes...')
+            live = ITunesManager()
+            sys.stdout.write('done\n')
+
+        return (live, AddQueue(live.itunes.library_playlists[1], batch_size,
+                               job=job))
+
+    if job is not None and job.resumed and job.phase == 'scanned':
+        to_add = [f for (f, _) in job.items(PENDING)]
+        unsure = [f for (f, _) in job.items(UNCERTAIN)]
+
+        if not silent:
+            print ('Resuming the last sync: %d files left to add, %d to '
+                   'check' % (len(to_add), len(unsure)))
+
+        (itunes_manager, queue) = connect()
+        queue.uncertain.extend(unsure)
+
+        # Adds made since the last checkpoint aren't recorded, so check
+        # what's already in the library rather than adding them twice
+        present = library_locations(itunes_manager)
+        for f in to_add:
+            if f in present:
+                job.done(f)
+            else:
+                queue.put(f)
+        queue.close()
 
-    if count > 0:
-        return True
-    elif count == 0:
-        return False
     else:
-        raise ValueError('Got %d results for SELECT query in db_track_exists()'
-                         'while looking for %s' % (count, path))
+        if job is not None and job.resumed and not silent:
+            print 'The last sync was interrupted while scanning - rescanning'
 
+        (to_add, queue, live) = scan_dir(db, path, itunes_manager, silent,
+                                         full_refresh, workers, full_scan,
+                                         job, connect, report)
+        if live is not None:
+            itunes_manager = live#IGNORE:C0103
 
-def sync_dir(db, path, silent=False):
-    """Recursively synchronizes a directory hierarchy with iTunes
-   
-    :param db: `sqlite3.Db` handle to the working DB
-    :param dirname: `string` of the root directory
+    if dry_run:
+        return (to_add, [])
 
-    """
-    sys.stdout.write('Connecting to iTunes...')
-    itunes_manager = ITunesManager()#IGNORE:C0103
-    sys.stdout.write('done\n')
+    queue.join(report)
+
+    # Anything that timed out may well have been added anyway, so look
+    # for it in the library before trying again
+    if queue.uncertain:
+        if not silent:
+            print ('\n%d adds timed out - checking whether they landed...' %
+                   len(queue.uncertain))
+
+        queue.settle(lambda: library_locations(itunes_manager))
 
-    # Toss iTunes Library into temp DB
     if not silent:
-        print 'Extracting file paths from iTunes library...'
+        print '\n%s\n' % queue.status()
 
-    count = itunes_manager.itunes.tracks.count(each=k.item)
-    for (i, t) in enumerate(itunes_manager.itunes.tracks()):
-        """If it's missing, add the track name and id to a list"""
-        if not silent:
-            sys.stdout.write('[%d/%d (%.02f%%)]\r' % (i, count, (100 * float(i) / count)))
+    # Include whatever was done before an interruption
+    successes = [f for (f, _) in job.items(DONE)]
+    failures = [f for (f, _) in job.items(FAILED)]
+    job.finish()
+
+    return (successes, failures)
+
+
+def library_locations(itunes):
+    """Returns a `set` of every track location, fetched in bulk"""
+    return set(p for p in itunes.snapshot(['location'])['location'] if p)
 
-        if t.location() == k.missing_value:
-            if not silent:
-                print "***** MISSING: %d - %s - %s" % (t.id(), t.artist(), t.name())
 
-        else:
-            add_track(db, t, False)
+def scan_dir(db, path, library, silent, full_refresh, workers, full_scan,
+             job, connect, report):
+    """Refreshes the catalog and scans for new files - see `sync_dir()`
+
+    New files are queued for adding as they're found, unless there's no
+    `job` (a dry run).
+
+    :param connect: function returning (`ITunesManager`, `AddQueue`)
+                    connected to a live iTunes
+    :param report: function taking a progress line
+    :rtype: `tuple` of (`list` of new files, `AddQueue` or None, the
+            live `ITunesManager` the queue adds through or None)
+    """
+    # Bring the persistent catalog up to date - only changed tracks
+    # are fetched from iTunes
+    if not silent:
+        print 'Refreshing library catalog...'
 
-    # Commit here after all have been added, for speed
-    db.commit()
+    catalog = Catalog(db)
+    (added, updated, deleted) = catalog.refresh(library, full_refresh)
+
+    if not silent:
+        print ('Catalog: %d added, %d updated, %d deleted' %
+               (added, updated, deleted))
+
+    # Report what's missing, and any file in the library more than once
+    if not silent:
+        for (track_id, artist, name) in catalog.missing():
+            print "***** MISSING: %d - %s - %s" % (track_id, artist, name)
+
+        for (dupe_path, ids) in catalog.duplicate_paths():
+            print ('Duplicate entries found for %s: %s' %
+                   (dupe_path, ','.join([str(x) for x in ids])))
 
     # Now that everything is in the DB, begin walking the file system
-    total_found = 0
-    new_found = 0
-    successes = []
-    failures = []
-    lib = itunes_manager.itunes.library_playlists[1]
+    library_paths = catalog.paths()
 
     if not silent:
         sys.stdout.write('Traversing file system from current directory...\n')
 
-    # Try to work with unicode
+    # Unless this is a dry run, start adding as soon as files turn up.
+    # Files an interrupted sync already tried aren't tried again, even
+    # if the library doesn't show them yet.
+    queue = on_new = live = None
+    if job is not None:
+        (live, queue) = connect()
+        tried = set(f for state in (DONE, FAILED, UNCERTAIN)
+                    for (f, _) in job.items(state))
+
+        # Adds that timed out before the interruption still have to be
+        # checked for, the same as ones that time out this time
+        queue.uncertain.extend(f for (f, _) in job.items(UNCERTAIN))
+
+        def on_new(f):
+            if f not in tried:
+                job.add(f)
+                queue.put(f)
+
+    def counted(paths):
+        """Passes paths through, reporting progress as they go by"""
+        for (i, f) in enumerate(paths):
+            report('[Total found: %d] %s' % (i + 1,
+                                             queue.status() if queue else ''))
+            yield f
+
+    journal = DirectoryJournal(db, full_scan)
+    try:
+        (to_add, present, library_only) = diff_paths(library_paths,
+                                    counted(scan_files(path, workers, journal)),
+                                    path, on_new)
+    finally:
+        if queue is not None:
+            queue.close()
+    journal.save(path)
+
+    if job is not None:
+        job.set_phase('scanned')
+
+    if not silent:
+        print ('\nListed %(listed)d directories, %(skipped)d unchanged '
+               '(%(stale)d found stale)' % journal.stats)
+
+        print ('\nFound %d files: %d new, %d already in library.  '
+               '%d library tracks not found on disk.' %
+               (len(to_add) + len(present), len(to_add), len(present),
+                len(library_only)))
+
+    return (to_add, queue, live)
+
+
+def watch_dir(db, path, silent=False, library=None, workers=DEFAULT_WORKERS,
+              batch_size=ADD_BATCH_SIZE, poll=False,
+              poll_interval=DEFAULT_POLL_INTERVAL, settle=DEFAULT_SETTLE,
+              checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """Syncs a directory, then adds new files as they turn up in it
+
+    Runs until interrupted.  The tree is watched with inotify if
+    pyinotify is installed, and polled otherwise (see `watcher.py`).
+    Changes are debounced, so an album being copied in is added in one
+    go once it's finished.  Files already in the library are skipped -
+    so a tag edit doesn't add anything - but a file moved within the
+    tree is a new file as far as the library is concerned, and is added
+    at its new path.  Use `relocate_tracks.py` to move entries instead.
+
+    Files that fail to add aren't retried until they change again.
+
+    :param db: `sqlite3.Db` handle holding the library catalog
+    :param path: `string` of the root directory
+    :param library: (optional) `ITunesManager` to use, as for
+                    `sync_dir()`
+    :param workers: (optional) `int` directories to list at once
+    :param batch_size: (optional) `int` most files per add event
+    :param poll: (optional) `boolean`; if True, poll even if inotify is
+                 available.  Needed on network mounts, which don't pass
+                 on changes made by other machines.
+    :param poll_interval: (optional) seconds between polls
+    :param settle: (optional) seconds the tree has to be quiet before
+                   new files are added
+    :param checkpoint_interval: (optional) as for `sync_dir()`
+    """
     if not isinstance(path, unicode):
         path = unicode(path)
+    path = os.path.abspath(path)
 
-    for root, dirs, files in os.walk(path):
-        root = os.path.abspath(root)
+    # Start watching first, so nothing that turns up during the sync
+    # is missed
+    if poll or pyinotify is None:
+        if not silent:
+            print 'Polling for changes every %d seconds' % poll_interval
+        watcher = PollingWatcher(path, db, INCLUDE_EXTENSIONS,
+                                 EXCLUDE_DIR_REGEX, poll_interval, workers)
+    else:
+        watcher = InotifyWatcher(path, EXCLUDE_DIR_REGEX)
+        if watcher.failed:
+            sys.stderr.write('Could not watch %d directories - raise '
+                             'fs.inotify.max_user_watches, or use '
+                             '--poll\n' % watcher.failed)
 
-        # Skip entries that match the regex
-        if EXCLUDE_DIR_REGEX.match(root):
-            continue
+    try:
+        (successes, _) = sync_dir(db, path, silent, library, workers=workers,
+                                  batch_size=batch_size,
+                                  checkpoint_interval=checkpoint_interval)
 
-        # Only work with files we care about
-        prune_juice = [x for x in files if INCLUDE_EXTENSIONS.match(x)]
-        total_found += len(prune_juice)
+        if library is None or library.read_only:
+            library = ITunesManager()
 
-        # As each file is encountered, check for it in the DB
-        # if not found, tell iTunes to add it and then add it to the DB
-        for f in prune_juice:
-            f = root + os.sep + f
+        known = Catalog(db).paths()
+        known.update(successes)
+        debouncer = Debouncer(settle)
 
-            if not db_track_exists(db, f):
-                new_found += 1
+        if not silent:
+            print 'Watching %s for new files' % path
 
-                # Add to iTunes
-                f_alias = Alias(f)
+        while True:
+            for changed in watcher.wait(debouncer.timeout()):
+                debouncer.add(changed)
 
-                itunes_track = lib.add([f_alias, ], timeout=AS_TIMEOUT)
+            new = [f for f in expand_changes(debouncer.ready(), workers)
+                   if f not in known]
+            if new:
+                known.update(add_files(library, new, batch_size, silent))
+    finally:
+        watcher.close()
 
-                if not itunes_track:
-                    failures.append(f)
-                else:
-                    # Add to DB
-                    add_track(db, itunes_track)
-                    successes.append(f)
 
-            if not silent:
-                sys.stdout.write('[Total found: %d New: %d]\r' %
-                                 (total_found, new_found))
+def expand_changes(paths, workers=DEFAULT_WORKERS):
+    """Returns a `set` of the files to sync among changed paths
+
+    Directories are scanned.  Files are checked against the include and
+    exclude rules, and anything that has gone again is dropped.
+    """
+    files = set()
+    for p in paths:
+        if not isinstance(p, unicode):
+            p = p.decode(sys.getfilesystemencoding() or 'utf-8')
+
+        if os.path.isdir(p):
+            files.update(scan_files(p, workers))
+        elif (os.path.isfile(p) and
+              INCLUDE_EXTENSIONS.match(os.path.basename(p)) and
+              not EXCLUDE_DIR_REGEX.match(os.path.dirname(p))):
+            files.add(p)
+
+    return files
+
+
+def add_files(itunes, files, batch_size=ADD_BATCH_SIZE, silent=False):
+    """Adds files to iTunes, reporting on each
+
+    :param itunes: `ITunesManager` connected to a live iTunes
+    :param files: iterable of paths to add
+    :rtype: `list` of the paths that were added
+    """
+    queue = AddQueue(itunes.itunes.library_playlists[1], batch_size)
+    for f in sorted(files):
+        queue.put(f)
+    queue.close()
+    queue.join()
+    queue.settle(lambda: library_locations(itunes))
 
     if not silent:
-        print '\n'
+        for f in queue.successes:
+            print 'Added: %s' % f.encode('utf-8')
+    for f in queue.failures:
+        sys.stderr.write('Failed to add: %s\n' % f.encode('utf-8'))
 
-    return (successes, failures)
+    return queue.successes
 
 if __name__ == '__main__':
     # Unbuffer stdout, for debugging
     sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
 
+    parser = argparse.ArgumentParser(description='Adds all files to iTunes '
+                                     'that aren\'t already in the library.')
+    parser.add_argument('directory', nargs='?', default=DEFAULT_DIR,
+                        help='directory to sync (default: %(default)s)')
+    parser.add_argument('--library-xml', metavar='PATH',
+                        help='read existing library paths from this iTunes '
+                             'Library.xml instead of asking iTunes')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report files that would be added')
+    parser.add_argument('--catalog', metavar='PATH',
+                        default=DEFAULT_CATALOG_FILE,
+                        help='library catalog file (default: %(default)s)')
+    parser.add_argument('--full-refresh', action='store_true',
+                        help='refetch every track into the catalog, not '
+                             'just those that changed')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='directories to list at once (default: '
+                             '%(default)s)')
+    parser.add_argument('--full-scan', action='store_true',
+                        help='list every directory, even those the '
+                             'directory journal says are unchanged')
+    parser.add_argument('--batch-size', type=int, default=ADD_BATCH_SIZE,
+                        help='files to add per Apple event (default: '
+                             '%(default)s)')
+    parser.add_argument('--checkpoint-interval', type=int, metavar='SECS',
+                        default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help='most seconds of progress an interruption '
+                             'can lose (default: %(default)s)')
+    parser.add_argument('--restart', action='store_true',
+                        help="start afresh, even if the last sync didn't "
+                             'finish')
+    parser.add_argument('--watch', action='store_true',
+                        help='after syncing, keep running and add new '
+                             'files as they turn up')
+    parser.add_argument('--poll', action='store_true',
+                        help='with --watch, poll for changes rather than '
+                             'using inotify, e.g. on a network mount')
+    parser.add_argument('--poll-interval', type=int, metavar='SECS',
+                        default=DEFAULT_POLL_INTERVAL,
+                        help='seconds between polls (default: '
+                             '%(default)s)')
+    parser.add_argument('--settle', type=float, metavar='SECS',
+                        default=DEFAULT_SETTLE,
+                        help='with --watch, seconds the tree must be quiet '
+                             'before new files are added (default: '
+                             '%(default)s)')
+    args = parser.parse_args()#IGNORE:C0103
+
+    if args.watch and args.dry_run:
+        parser.error("--watch can't be used with --dry-run")
+
+    library = None#IGNORE:C0103
+    if args.library_xml:
+        library = ITunesManager(XMLLibraryBackend(args.library_xml))
+
     # Setup DB
-    db = init_db_conn()
+    db = open_catalog(args.catalog).db
+
+    if args.watch:
+        try:
+            watch_dir(db, args.directory, library=library,
+                      workers=args.workers, batch_size=args.batch_size,
+                      poll=args.poll, poll_interval=args.poll_interval,
+                      settle=args.settle,
+                      checkpoint_interval=args.checkpoint_interval)
+        except KeyboardInterrupt:
+            print '\nStopped watching.'
+        sys.exit(0)
 
     # Do it up!
-    (success, failure) = sync_dir(db, DEFAULT_DIR)
+    (success, failure) = sync_dir(db, args.directory,
+                                  library=library, dry_run=args.dry_run,
+                                  full_refresh=args.full_refresh,
+                                  workers=args.workers,
+                                  full_scan=args.full_scan,
+                                  batch_size=args.batch_size,
+                                  checkpoint_interval=args.checkpoint_interval,
+                                  restart=args.restart)
 
     # Report on our successes and failures, openly.  We share.
+    verb = 'Would add' if args.dry_run else 'Added'#IGNORE:C0103
     for s in success:
         try:
-            print 'Added: %s' % s
+            print '%s: %s' % (verb, s)
         except UnicodeEncodeError:
-            print 'Added: ',
+            print '%s: ' % verb,
             print s.encode('utf-16')
 
     print ''
@@ -0,0 +1,256 @@
+# ---*< watcher.py >*----------------------------------------------------------
+# Notices new files in a directory tree
+#
+# Copyright (C) 2011 st0w <st0w@st0w.com>
+#
+# This is released under the MIT License.
+"""Watches a directory tree for files that turn up in it
+
+Created on Oct 16, 2026
+
+Two ways of watching, with the same interface - `wait(timeout)` returns
+the paths that changed, or an empty list if nothing did in time:
+
+- `InotifyWatcher` has the kernel say what changed (Linux only, needs
+  `pip install pyinotify`).  A file is reported once it's been closed
+  after writing, or moved into the tree.  Directories created in or
+  moved into the tree are reported too, so the caller can scan them -
+  a whole album moved in arrives as one directory, not its files.
+  Sitting idle costs nothing.
+- `PollingWatcher` rescans the tree every `interval` seconds through a
+  `DirectoryJournal`, so each poll is one stat() per directory plus a
+  listing of just the directories that changed.  Network mounts don't
+  pass on inotify events for changes made on other machines, so use
+  this for those.
+
+Copying an album in produces a burst of changes.  `Debouncer` holds
+changed paths until the tree has been quiet for `settle` seconds (or
+`max_wait` has passed since the first), and holds back any file whose
+size or mtime moved in the meantime, as it's still being written.
+
+"""
+# ---*< Standard imports >*----------------------------------------------------
+import os
+import time
+
+# ---*< Third-party imports >*-------------------------------------------------
+try:
+    import pyinotify #@UnresolvedImport
+except ImportError:
+    # Only polling is available
+    pyinotify = None
+
+# ---*< Local imports >*-------------------------------------------------------
+from scanner import DEFAULT_WORKERS, DirectoryJournal, TreeScanner
+
+# ---*< Initialization >*------------------------------------------------------
+"""Seconds the tree has to be quiet before changes are passed on"""
+DEFAULT_SETTLE = 3
+
+"""Most seconds a change is held back, however busy the tree is"""
+DEFAULT_MAX_WAIT = 60
+
+"""Seconds between scans when polling"""
+DEFAULT_POLL_INTERVAL = 30
+
+# ---*< Code >*----------------------------------------------------------------
+def file_state(path):
+    """Returns (size, mtime) of a file, or None if it isn't there"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return (st.st_size, st.st_mtime)
+
+
+class Debouncer(object):
+    """Collects changed paths and lets them go once things settle"""
+
+    def __init__(self, settle=DEFAULT_SETTLE, max_wait=DEFAULT_MAX_WAIT):
+        """__init__ method.
+
+        :param settle: (optional) seconds without a new change before
+                       the pending paths are ready
+        :param max_wait: (optional) most seconds to hold a path back
+        """
+        self.settle = settle
+        self.max_wait = max_wait
+        self.pending = {}
+        self.first = self.last = None
+        super(Debouncer, self).__init__()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, path, now=None):
+        """Records a change to `path`"""
+        now = time.time() if now is None else now
+        self.pending[path] = file_state(path)
+        self.last = now
+        if self.first is None:
+            self.first = now
+
+    def timeout(self, now=None):
+        """Seconds until `ready()` could next return something, or None
+        if nothing is pending"""
+        if not self.pending:
+            return None
+
+        now = time.time() if now is None else now
+        due = min(self.last + self.settle, self.first + self.max_wait)
+        return max(0, due - now)
+
+    def ready(self, now=None):
+        """Returns the pending paths if things have settled, else []
+
+        A file whose size or mtime has moved since it was last reported
+        is still being written, so it's kept back for another round.
+        """
+        wait = self.timeout(now)
+        if wait is None or wait > 0:
+            return []
+
+        now = time.time() if now is None else now
+        (ready, busy) = ([], [])
+        for (path, state) in self.pending.iteritems():
+            if os.path.isdir(path) or file_state(path) == state:
+                ready.append(path)
+            else:
+                busy.append(path)
+
+        self.pending = {}
+        self.first = self.last = None
+        for path in busy:
+            self.add(path, now)
+
+        return ready
+
+
+class InotifyWatcher(object):
+    """Has the kernel report changes in a tree, through pyinotify"""
+
+    def __init__(self, root, exclude=None):
+        """__init__ method.
+
+        :param root: `string` of the directory to watch, with everything
+                     below it
+        :param exclude: (optional) compiled regex matched against the
+                        absolute path of each directory.  Matching
+                        directories aren't watched.
+        """
+        if pyinotify is None:
+            raise ValueError('pyinotify is not available - use polling')
+
+        self.root = os.path.abspath(root)
+        self.exclude = exclude
+        self.changed = []
+        self.mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+                     pyinotify.IN_CREATE)
+        self.manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.manager, self._event)
+        self.failed = 0
+        self._watch(self.root)
+        super(InotifyWatcher, self).__init__()
+
+    def _watch(self, path):
+        """Watches a directory and everything below it"""
+        exclude = ((lambda p: bool(self.exclude.match(p)))
+                   if self.exclude else None)
+        added = self.manager.add_watch(path, self.mask, rec=True,
+                                       auto_add=True, exclude_filter=exclude,
+                                       quiet=True)
+
+        # Usually fs.inotify.max_user_watches being too low
+        self.failed += sum(1 for wd in added.itervalues() if wd < 0)
+
+    def _event(self, event):
+        if event.mask & pyinotify.IN_Q_OVERFLOW:
+            # Events were lost, so anything could have changed
+            self.changed.append(self.root)
+        elif event.mask & pyinotify.IN_ISDIR:
+            if event.mask & (pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO):
+                if event.mask & pyinotify.IN_MOVED_TO:
+                    self._watch(event.pathname)
+                self.changed.append(event.pathname)
+        elif event.mask & (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO):
+            self.changed.append(event.pathname)
+
+    def wait(self, timeout=None):
+        """Returns the paths that changed, waiting up to `timeout` seconds
+
+        :param timeout: (optional) seconds to wait, or None to wait
+                        until something happens
+        """
+        if self.notifier.check_events(None if timeout is None
+                                      else int(timeout * 1000)):
+            self.notifier.read_events()
+            self.notifier.process_events()
+
+        (changed, self.changed) = (self.changed, [])
+        return changed
+
+    def close(self):
+        self.notifier.stop()
+
+
+class PollingWatcher(object):
+    """Finds new files in a tree by rescanning it every so often"""
+
+    def __init__(self, root, db, include=None, exclude=None,
+                 interval=DEFAULT_POLL_INTERVAL, workers=DEFAULT_WORKERS):
+        """__init__ method.
+
+        :param root: `string` of the directory to watch
+        :param db: `sqlite3.Db` handle holding the directory journal
+        :param include: (optional) compiled regex matched against file
+                        names, as for `TreeScanner`
+        :param exclude: (optional) compiled regex matched against
+                        directory paths, as for `TreeScanner`
+        :param interval: (optional) seconds between scans
+        :param workers: (optional) `int` directories to list at once
+        """
+        self.root = os.path.abspath(root)
+        self.db = db
+        self.include = include
+        self.exclude = exclude
+        self.interval = interval
+        self.workers = workers
+        self.errors = []
+        self.files = self._scan()
+        self.next_poll = time.time() + interval
+        super(PollingWatcher, self).__init__()
+
+    def _scan(self):
+        """Returns a `set` of every matching file in the tree"""
+        journal = DirectoryJournal(self.db)
+        scanner = TreeScanner(self.include, self.exclude, self.workers,
+                              journal.lister())
+        files = set(scanner.scan(self.root))
+        journal.save(self.root)
+        self.errors = scanner.errors
+
+        return files
+
+    def wait(self, timeout=None):
+        """Returns new files, waiting up to `timeout` seconds for a poll
+
+        :param timeout: (optional) seconds to wait, or None to wait for
+                        the next poll however long it is
+        """
+        wait = max(0, self.next_poll - time.time())
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return []
+
+        time.sleep(wait)
+        self.next_poll = time.time() + self.interval
+
+        files = self._scan()
+        new = files - self.files
+        self.files = files
+
+        return sorted(new)
+
+    def close(self):
+        pass